@@ -0,0 +1,165 @@
+"""
+Concurrent read throughput: AsyncDatabase versus the blocking Database API
+
+Seeds a throwaway database, then performs the same mix of lookups, filtered
+page reads, inserts and analytics reports from many coroutines at once:
+first calling the blocking Database directly, then through AsyncDatabase.
+Reports throughput and the longest stretch the event loop was blocked.
+
+Usage:
+    python benchmarks/bench_async.py [--leads 50000] [--ops 5000] [--concurrency 64] [--readers 4]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from salespipe.analytics import Analytics  # noqa: E402
+from salespipe.async_database import AsyncDatabase  # noqa: E402
+from salespipe.database import Database  # noqa: E402
+from salespipe.models import Lead, Opportunity, INDUSTRIES, LOCATIONS  # noqa: E402
+
+
+def seed(db_path, leads):
+    """Fill a fresh database with `leads` leads, each with one opportunity"""
+    db = Database(db_path)
+    db.create_tables()
+    with db.transaction():
+        for i in range(leads):
+            lead_id = db.add_lead(Lead(None, f"Bench {i}", f"bench{i}@example.com", "", "web",
+                                       location=LOCATIONS[i % 4], industry=INDUSTRIES[i % 4]))
+            db.add_opportunity(Opportunity(None, lead_id, f"Deal {i}", 1000 + i, probability=i % 100))
+
+
+def make_ops(count, leads, write_ratio, report_ratio):
+    """The operation mix, fixed up front so both runs do identical work"""
+    rng = random.Random(42)
+    ops = []
+    for n in range(count):
+        if rng.random() < write_ratio:
+            ops.append(('add', Lead(None, f"New {n}", f"new{n}@example.com", "", "web")))
+        elif rng.random() < report_ratio:
+            ops.append(('report', None))
+        elif rng.random() < 0.5:
+            ops.append(('get', rng.randint(1, leads)))
+        else:
+            ops.append(('page', (rng.choice(INDUSTRIES), rng.randint(1, leads))))
+    return ops
+
+
+async def heartbeat(stop, interval=0.001):
+    """Longest time the event loop went without running this task, in ms"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst * 1000
+
+
+async def run_sync(db_path, ops, concurrency):
+    """Blocking Database called straight from coroutines, as a naive service would"""
+    db = Database(db_path)
+    db.open_session()
+    analytics = Analytics(db=db)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(kind, arg):
+        async with slots:
+            if kind == 'add':
+                db.add_lead(arg)
+            elif kind == 'report':
+                analytics.get_performance_by_location()
+            elif kind == 'get':
+                db.get_record('leads', arg)
+            else:
+                list(db.iter_leads(industry=arg[0], after_id=arg[1], limit=50))
+            await asyncio.sleep(0)
+
+    stop = asyncio.Event()
+    stall = asyncio.ensure_future(heartbeat(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(kind, arg) for kind, arg in ops))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    db.close_session()
+    return elapsed, await stall
+
+
+async def run_async(db_path, ops, concurrency, readers):
+    async with AsyncDatabase(db_path, readers=readers) as db:
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(kind, arg):
+            async with slots:
+                if kind == 'add':
+                    await db.add_lead(arg)
+                elif kind == 'report':
+                    await db.get_performance_by_location()
+                elif kind == 'get':
+                    await db.get_record('leads', arg)
+                else:
+                    await db.pool.read(lambda sync_db, _: list(sync_db.iter_leads(industry=arg[0], after_id=arg[1],
+                                                                                  limit=50)))
+
+        stop = asyncio.Event()
+        stall = asyncio.ensure_future(heartbeat(stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(one(kind, arg) for kind, arg in ops))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        return elapsed, await stall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare AsyncDatabase with the blocking API")
+    parser.add_argument('--leads', type=int, default=50000, help='Leads to seed (default: 50000)')
+    parser.add_argument('--ops', type=int, default=5000, help='Operations per run (default: 5000)')
+    parser.add_argument('--concurrency', type=int, default=64, help='Async operations in flight (default: 64)')
+    parser.add_argument('--readers', type=int, default=4, help='AsyncDatabase reader threads (default: 4)')
+    parser.add_argument('--write-ratio', type=float, default=0.02, help='Share of inserts (default: 0.02)')
+    parser.add_argument('--report-ratio', type=float, default=0.01,
+                        help='Share of analytics reports (default: 0.01)')
+    parser.add_argument('--json', help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'bench.db')
+        print(f"Seeding {args.leads:,} leads...")
+        seed(db_path, args.leads)
+        # Same journal mode for both runs (AsyncDatabase switches the file to WAL)
+        Database(db_path).enable_wal()
+        ops = make_ops(args.ops, args.leads, args.write_ratio, args.report_ratio)
+
+        sync_seconds, sync_stall = asyncio.run(run_sync(db_path, ops, args.concurrency))
+        async_seconds, async_stall = asyncio.run(run_async(db_path, ops, args.concurrency, args.readers))
+
+    results = {
+        'sync_ops_per_second': round(args.ops / sync_seconds, 1),
+        'async_ops_per_second': round(args.ops / async_seconds, 1),
+        'sync_max_loop_stall_ms': round(sync_stall, 2),
+        'async_max_loop_stall_ms': round(async_stall, 2),
+    }
+    print(f"\n{'API':<30} {'Seconds':>10} {'Ops/s':>10} {'Max loop stall':>16}")
+    print("-" * 70)
+    print(f"{'Database (blocking)':<30} {sync_seconds:>10.2f} {results['sync_ops_per_second']:>10,.0f} "
+          f"{sync_stall:>14.1f}ms")
+    print(f"{f'AsyncDatabase ({args.readers} readers)':<30} {async_seconds:>10.2f} "
+          f"{results['async_ops_per_second']:>10,.0f} {async_stall:>14.1f}ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'leads': args.leads, 'ops': args.ops, 'concurrency': args.concurrency,
+                       'readers': args.readers, 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Per-market writes and reports: one database file versus one file per market
+
+One writer thread per market inserts leads with their opportunities, first
+into a single file (all writers share its lock), then into a
+ShardedDatabase (each market has its own file and lock). The reports are
+then timed on both: the sharded ones query the four files in parallel.
+
+Usage:
+    python benchmarks/bench_sharding.py [--leads 2000] [--reports 5]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from salespipe.analytics import Analytics  # noqa: E402
+from salespipe.database import Database  # noqa: E402
+from salespipe.models import Lead, Opportunity, LOCATIONS  # noqa: E402
+from salespipe.sharding import ShardedDatabase, ShardedAnalytics  # noqa: E402
+
+
+def run_writers(db, leads):
+    """One thread per market storing `leads` leads with an opportunity each; returns seconds taken"""
+    def write(market):
+        for i in range(leads):
+            lead_id = db.add_lead(Lead(None, f"{market} {i}", f"{i}@{market.lower()}.example", "", "web",
+                                       location=market, industry="automotive"))
+            db.add_opportunity(Opportunity(None, lead_id, f"Deal {i}", 1000 + i, probability=50))
+
+    threads = [threading.Thread(target=write, args=(market,)) for market in LOCATIONS]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def time_reports(analytics, rounds):
+    """Average seconds for one pass over the fan-out-heavy reports"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        analytics.get_conversion_rates()
+        analytics.get_performance_by_location()
+        analytics.get_top_opportunities()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare one database file with one file per market")
+    parser.add_argument('--leads', type=int, default=2000, help='Leads per market (default: 2000)')
+    parser.add_argument('--reports', type=int, default=5, help='Report passes to average (default: 5)')
+    parser.add_argument('--json', help='Also write results to this JSON file')
+    args = parser.parse_args()
+    total = args.leads * len(LOCATIONS)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        single_db = Database(os.path.join(workdir, 'single.db'))
+        single_db.create_tables()
+        single_db.enable_wal()
+        single = run_writers(single_db, args.leads)
+        single_reports = time_reports(Analytics(db=single_db), args.reports)
+
+        sharded_db = ShardedDatabase(os.path.join(workdir, 'sharded.db'))
+        sharded_db.create_tables()
+        sharded_db.enable_wal()
+        sharded = run_writers(sharded_db, args.leads)
+        sharded_reports = time_reports(ShardedAnalytics(db=sharded_db), args.reports)
+        sharded_db.close()
+
+    results = {
+        'single_leads_per_second': round(total / single, 1),
+        'sharded_leads_per_second': round(total / sharded, 1),
+        'write_speedup': round(single / sharded, 2),
+        'single_report_seconds': round(single_reports, 4),
+        'sharded_report_seconds': round(sharded_reports, 4),
+    }
+    print(f"{total:,} leads from {len(LOCATIONS)} market writers, CPUs: {os.cpu_count()}\n")
+    print(f"{'Storage':<22} {'Write s':>10} {'Leads/s':>10} {'Reports s':>11}")
+    print("-" * 56)
+    print(f"{'One file':<22} {single:>10.2f} {results['single_leads_per_second']:>10,.0f} {single_reports:>11.4f}")
+    print(f"{'One file per market':<22} {sharded:>10.2f} {results['sharded_leads_per_second']:>10,.0f} "
+          f"{sharded_reports:>11.4f}")
+    print(f"\nWrite speedup: {results['write_speedup']:.1f}x")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'leads': args.leads, 'reports': args.reports, 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Startup-time benchmark for the command line interface
+
+Runs `main.py add-lead` (and a couple of reference commands) as separate
+processes against a throwaway database and reports wall-clock latency.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 30] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, 'main.py')
+
+COMMANDS = {
+    'python -c pass': [sys.executable, '-c', 'pass'],
+    'main.py --help': [sys.executable, MAIN, '--help'],
+    'main.py add-lead': [sys.executable, MAIN, 'add-lead', '--name', 'Bench GmbH',
+                         '--email', 'bench@example.com', '--location', 'Germany'],
+    'main.py list-leads': [sys.executable, MAIN, 'list-leads'],
+}
+
+
+def time_command(argv, runs, cwd):
+    """Run a command `runs` times; returns the latencies in milliseconds"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=cwd, stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    """Reduce latencies to min / median / p95"""
+    ordered = sorted(timings)
+    return {
+        'min_ms': round(ordered[0], 2),
+        'median_ms': round(statistics.median(ordered), 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CLI startup latency")
+    parser.add_argument('--runs', type=int, default=30, help='Runs per command (default: 30)')
+    parser.add_argument('--json', help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # First invocation creates the database and compiles bytecode; not timed
+        subprocess.run(COMMANDS['main.py add-lead'], cwd=workdir, stdout=subprocess.DEVNULL, check=True)
+
+        print(f"{'Command':<22} {'Min':>10} {'Median':>10} {'P95':>10}")
+        print("-" * 55)
+        for name, argv in COMMANDS.items():
+            results[name] = summarize(time_command(argv, args.runs, workdir))
+            r = results[name]
+            print(f"{name:<22} {r['min_ms']:>8.1f}ms {r['median_ms']:>8.1f}ms {r['p95_ms']:>8.1f}ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'runs': args.runs, 'python': sys.version.split()[0], 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
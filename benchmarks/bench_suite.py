@@ -0,0 +1,221 @@
+"""
+Benchmark suite: every Database, Analytics and CSV operation at scale
+
+Generates a dataset per size with salespipe.generator (default funnel
+ratios: 40% of leads become opportunities, 60% of those get a quote, half
+of the quotes close, 40% of closed orders are won), then times each
+operation on it:
+Database.add_* / get_* / updates, every Analytics report, CSV export and
+import, and the `company` command. Results are written as JSON; given a
+baseline file from an earlier run, operations slower than it by more than
+the threshold are reported and the exit status is 1.
+
+Datasets are cached in --data-dir (by size and seed) and copied for each
+run, so generating 10M leads is paid once.
+
+Usage:
+    python benchmarks/bench_suite.py [--sizes 10k,100k,1M,10M] [--repeat 5] [--json results.json]
+                                     [--baseline baseline.json] [--threshold 0.25]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from salespipe import generator, scoring  # noqa: E402
+from salespipe.analytics import Analytics  # noqa: E402
+from salespipe.cli import CLI  # noqa: E402
+from salespipe.csv_handler import CSVHandler  # noqa: E402
+from salespipe.database import Database  # noqa: E402
+from salespipe.models import Lead, Opportunity, Quote, Order  # noqa: E402
+
+# Operations that read every row are skipped above this many leads (see --max-full-scan)
+MAX_FULL_SCAN = 1_000_000
+
+# Calls timed per round for single-record operations; results are per call
+CALLS = 50
+
+
+def parse_size(text):
+    """'10k' -> 10000, '1M' -> 1000000"""
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def dataset(data_dir, leads, seed):
+    """Path of the cached dataset for a size, generating it first if needed; returns (path, counts)"""
+    path = os.path.join(data_dir, f"bench_{leads}_{seed}.db")
+    counts_path = path + ".json"
+    if not os.path.exists(counts_path):
+        if os.path.exists(path):
+            os.remove(path)
+        start = time.perf_counter()
+        counts = generator.generate(path, leads, seed)
+        print(f"  generated {leads:,} leads in {time.perf_counter() - start:.1f}s")
+        with open(counts_path, 'w', encoding='utf-8') as f:
+            json.dump(counts, f)
+    with open(counts_path, encoding='utf-8') as f:
+        return path, json.load(f)
+
+
+def operations(db_path, counts, workdir, rng):
+    """name -> (function, calls per round, reads every row?)"""
+    db = Database(db_path)
+    csv_path = os.path.join(workdir, 'bench_leads.csv')
+    ids = {table: [rng.randrange(1, max(counts[table], 1) + 1) for _ in range(CALLS)] for table in counts}
+    mid_lead = counts['leads'] // 2
+
+    def calls(function):
+        return lambda: [function(i) for i in range(CALLS)]
+
+    def report(method, *args):
+        return lambda: getattr(Analytics(db_path), method)(*args)
+
+    def export():
+        CSVHandler.export_leads_to_csv(db.get_all_leads(), csv_path)
+
+    def show_company():
+        cli = CLI(db_path)
+        for i in range(5):
+            cli.show_company(argparse.Namespace(name=f"Company {ids['leads'][i]}"))
+
+    return {
+        'Database.add_lead': (calls(lambda i: db.add_lead(
+            Lead(None, f"Bench {i}", f"bench{i}@bench.example", "", "web", location="Germany",
+                 industry="automotive"))), CALLS, False),
+        'Database.add_opportunity': (calls(lambda i: db.add_opportunity(
+            Opportunity(None, ids['leads'][i], f"Bench deal {i}", 10000, probability=50))), CALLS, False),
+        'Database.add_quote': (calls(lambda i: db.add_quote(
+            Quote(None, ids['opportunities'][i], f"BQ-{rng.random()}", 9000, "2030-01-01", "Net 30",
+                  "sent"))), CALLS, False),
+        'Database.add_order': (calls(lambda i: db.add_order(
+            Order(None, ids['quotes'][i], "won", 8500, "2024-06-01"))), CALLS, False),
+        'Database.get_record': (calls(lambda i: db.get_record('leads', ids['leads'][i])), CALLS, False),
+        'Database.iter_leads (first page)': (lambda: list(db.iter_leads(status='qualified', sort='name',
+                                                                        limit=100)), 1, False),
+        'Database.iter_leads (deep page)': (lambda: list(db.iter_leads(after_id=mid_lead, limit=100)), 1, False),
+        'Database.update_lead': (calls(lambda i: db.update_lead(ids['leads'][i], phone=f"+39 {i}")), CALLS, False),
+        'Database.update_opportunity_stages': (lambda: db.update_opportunity_stages(
+            ids['opportunities'], 'negotiation'), 1, False),
+        'Database.expire_quotes': (lambda: db.expire_quotes(as_of="2000-01-01"), 1, False),
+        'Database.get_all_leads': (db.get_all_leads, 1, True),
+        'Database.get_all_opportunities': (db.get_all_opportunities, 1, True),
+        'Database.get_all_quotes': (db.get_all_quotes, 1, True),
+        'Database.get_all_orders': (db.get_all_orders, 1, True),
+        'Analytics.get_conversion_rates': (report('get_conversion_rates'), 1, True),
+        'Analytics.get_win_rate': (report('get_win_rate'), 1, True),
+        'Analytics.get_pipeline_value': (report('get_pipeline_value'), 1, True),
+        'Analytics.get_pipeline_value (excluding expired)': (report('get_pipeline_value', True), 1, True),
+        'Analytics.get_performance_by_industry': (report('get_performance_by_industry'), 1, True),
+        'Analytics.get_performance_by_location': (report('get_performance_by_location'), 1, True),
+        'Analytics.get_time_in_stage': (report('get_time_in_stage'), 1, True),
+        'Analytics.get_stage_velocity': (report('get_stage_velocity'), 1, True),
+        'Analytics.get_top_opportunities': (report('get_top_opportunities'), 1, True),
+        'Analytics.get_top_accounts': (report('get_top_accounts'), 1, True),
+        'CSVHandler.export_leads_to_csv': (export, 1, True),
+        'CSVHandler.import_leads_from_csv': (lambda: CSVHandler.import_leads_from_csv(csv_path), 1, True),
+        # Every exported row is already in the database, so this times the duplicate checks alone
+        'CSVHandler.import_leads_to_database': (lambda: CSVHandler.import_leads_to_database(db, csv_path), 1, True),
+        'scoring.score_leads (all)': (lambda: scoring.score_leads(db, rescore_all=True), 1, True),
+        'CLI.show_company': (show_company, 5, True),
+    }
+
+
+def time_operation(function, calls, repeat):
+    """Milliseconds per call: median and minimum over `repeat` rounds"""
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000 / calls)
+    return {'median_ms': round(statistics.median(timings), 4), 'min_ms': round(min(timings), 4)}
+
+
+def run_size(data_dir, leads, args):
+    """Time every operation on a fresh copy of the dataset for one size"""
+    source, counts = dataset(data_dir, leads, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'bench.db')
+        shutil.copyfile(source, db_path)
+        rng = random.Random(args.seed)
+        for name, (function, calls, full_scan) in operations(db_path, counts, workdir, rng).items():
+            if args.only and not any(part in name for part in args.only.split(',')):
+                continue
+            if full_scan and leads > args.max_full_scan:
+                results[name] = {'skipped': f"reads every row; above --max-full-scan {args.max_full_scan:,}"}
+                continue
+            results[name] = time_operation(function, calls, args.repeat)
+            print(f"  {name:<50} {results[name]['median_ms']:>12.3f} ms")
+    return {'counts': counts, 'operations': results}
+
+
+def compare(results, baseline, threshold):
+    """(size, operation, baseline ms, current ms) of every operation slower than baseline * (1 + threshold)"""
+    regressions = []
+    for size, current in results.items():
+        before = baseline.get('results', {}).get(size, {}).get('operations', {})
+        for name, timing in current['operations'].items():
+            old = before.get(name, {}).get('median_ms')
+            new = timing.get('median_ms')
+            if old and new and new > old * (1 + threshold):
+                regressions.append((size, name, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every Database, Analytics and CSV operation at scale")
+    parser.add_argument('--sizes', default='10k,100k',
+                        help='Comma-separated lead counts, e.g. 10k,100k,1M,10M (default: 10k,100k)')
+    parser.add_argument('--repeat', type=int, default=5, help='Rounds per operation (default: 5)')
+    parser.add_argument('--seed', type=int, default=42, help='Dataset seed (default: 42)')
+    parser.add_argument('--only', help='Comma-separated substrings; time only matching operations')
+    parser.add_argument('--max-full-scan', type=parse_size, default=MAX_FULL_SCAN,
+                        help='Skip operations reading every row above this many leads (default: 1M)')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'salespipe_bench'),
+                        help='Where generated datasets are cached')
+    parser.add_argument('--json', help='Also write results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Slowdown over the baseline reported as a regression (default: 0.25 = 25%%)')
+    args = parser.parse_args()
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = {}
+    for size in args.sizes.split(','):
+        leads = parse_size(size)
+        print(f"\n{leads:,} leads")
+        results[str(leads)] = run_size(args.data_dir, leads, args)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'sqlite': sqlite3.sqlite_version, 'seed': args.seed,
+                       'repeat': args.repeat, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for size, name, old, new in regressions:
+                print(f"  {int(size):>12,} leads  {name:<50} {old:>10.3f} -> {new:>10.3f} ms ({new / old:.1f}x)")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Concurrent insert throughput: one shared Database versus the WriteQueue
+
+Several producer threads insert leads at the same time, first each calling
+Database.add_lead (one transaction and fsync per lead, competing for the
+write lock), then through a WriteQueue that commits them in groups.
+
+Usage:
+    python benchmarks/bench_write_queue.py [--producers 8] [--leads 500] [--max-batch 500] [--max-delay 0.001]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from salespipe.database import Database  # noqa: E402
+from salespipe.models import Lead  # noqa: E402
+from salespipe.write_queue import WriteQueue  # noqa: E402
+
+
+def run_producers(producers, leads, insert):
+    """Start `producers` threads each inserting `leads` leads; returns seconds taken"""
+    def produce(n):
+        for i in range(leads):
+            insert(Lead(None, f"Bench {n}-{i}", f"bench{n}.{i}@example.com", "", "web", location="Germany"))
+
+    threads = [threading.Thread(target=produce, args=(n,)) for n in range(producers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare direct concurrent inserts with the WriteQueue")
+    parser.add_argument('--producers', type=int, default=8, help='Producer threads (default: 8)')
+    parser.add_argument('--leads', type=int, default=500, help='Leads per producer (default: 500)')
+    parser.add_argument('--max-batch', type=int, default=500, help='WriteQueue group size (default: 500)')
+    parser.add_argument('--max-delay', type=float, default=0.001,
+                        help='WriteQueue group window in seconds (default: 0.001)')
+    parser.add_argument('--json', help='Also write results to this JSON file')
+    args = parser.parse_args()
+    total = args.producers * args.leads
+
+    with tempfile.TemporaryDirectory() as workdir:
+        direct_db = Database(os.path.join(workdir, 'direct.db'))
+        direct_db.create_tables()
+        direct = run_producers(args.producers, args.leads, direct_db.add_lead)
+
+        with WriteQueue(os.path.join(workdir, 'queued.db'), args.max_batch, args.max_delay) as writes:
+            # Producers wait for their ID, like callers that need it right away
+            queued = run_producers(args.producers, args.leads, lambda lead: writes.submit(lead).result())
+            groups = writes.stats['groups']
+
+    results = {
+        'direct_inserts_per_second': round(total / direct, 1),
+        'queued_inserts_per_second': round(total / queued, 1),
+        'speedup': round(direct / queued, 2),
+        'groups': groups,
+    }
+    print(f"{total:,} leads from {args.producers} threads\n")
+    print(f"{'Method':<28} {'Seconds':>10} {'Inserts/s':>12}")
+    print("-" * 52)
+    print(f"{'Database.add_lead':<28} {direct:>10.2f} {results['direct_inserts_per_second']:>12,.0f}")
+    print(f"{'WriteQueue (group commit)':<28} {queued:>10.2f} {results['queued_inserts_per_second']:>12,.0f}")
+    print(f"\nSpeedup: {results['speedup']:.1f}x ({groups:,} commits instead of {total:,})")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'producers': args.producers, 'leads': args.leads, 'max_batch': args.max_batch,
+                       'max_delay': args.max_delay, 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
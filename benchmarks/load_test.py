@@ -0,0 +1,184 @@
+"""
+Load test for the HTTP/JSON API server
+
+Opens many keep-alive connections at once and sends a mix of list, lookup and
+report requests (plus a share of lead inserts) for a fixed time, then reports
+throughput and latency per request type. Without --url it seeds a throwaway
+database, starts `main.py serve` on a free port and stops it afterwards.
+
+Usage:
+    python benchmarks/load_test.py [--concurrency 200] [--duration 10] [--write-ratio 0.05]
+    python benchmarks/load_test.py --url http://127.0.0.1:8080
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, 'main.py')
+sys.path.insert(0, ROOT)
+
+from salespipe.database import Database  # noqa: E402
+from salespipe.models import Lead, Opportunity, LOCATIONS, INDUSTRIES  # noqa: E402
+
+
+def seed(db_path, leads):
+    """Fill a fresh database with `leads` leads, each with one opportunity"""
+    db = Database(db_path)
+    db.create_tables()
+    with db.transaction():
+        for i in range(leads):
+            lead_id = db.add_lead(Lead(None, f"Load Test {i}", f"load{i}@example.com", "", "web",
+                                       location=LOCATIONS[i % 4], industry=INDUSTRIES[i % 4]))
+            db.add_opportunity(Opportunity(None, lead_id, f"Deal {i}", 1000 + i, probability=i % 100))
+
+
+def pick_request(leads, write_ratio):
+    """Choose the next request: (label, method, path, body)"""
+    if random.random() < write_ratio:
+        n = random.randrange(10 ** 9)
+        return 'POST /leads', 'POST', '/leads', {'name': f"New {n}", 'email': f"new{n}@example.com"}
+    return random.choice([
+        ('GET /leads', 'GET', f"/leads?limit=50&industry={random.choice(INDUSTRIES)}", None),
+        ('GET /leads/{id}', 'GET', f"/leads/{random.randint(1, leads)}", None),
+        ('GET /analytics/pipeline', 'GET', '/analytics/pipeline', None),
+        ('GET /analytics/top-opportunities', 'GET', '/analytics/top-opportunities?limit=10', None),
+        ('GET /analytics/industry', 'GET', '/analytics/industry', None),
+    ])
+
+
+async def send(reader, writer, host, method, path, body):
+    """Send one request on a keep-alive connection; returns the status code"""
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n").encode() + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, leads, write_ratio, deadline, timings, errors):
+    """One connection sending requests back to back until the deadline"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            label, method, path, body = pick_request(leads, write_ratio)
+            start = time.perf_counter()
+            status = await send(reader, writer, host, method, path, body)
+            timings.setdefault(label, []).append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors[label] = errors.get(label, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, concurrency, duration, leads, write_ratio):
+    timings, errors = {}, {}
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, leads, write_ratio, deadline, timings, errors)
+                           for _ in range(concurrency)))
+    return timings, errors, time.perf_counter() - start
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(timings):
+    """Reduce latencies to count / median / p95 / p99"""
+    ordered = sorted(timings)
+    return {
+        'requests': len(ordered),
+        'median_ms': round(percentile(ordered, 0.5), 2),
+        'p95_ms': round(percentile(ordered, 0.95), 2),
+        'p99_ms': round(percentile(ordered, 0.99), 2),
+    }
+
+
+def wait_for_server(host, port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on {host}:{port} did not start")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API server")
+    parser.add_argument('--url', help='Test a running server instead of starting one')
+    parser.add_argument('--concurrency', type=int, default=200, help='Open connections (default: 200)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run (default: 10)')
+    parser.add_argument('--write-ratio', type=float, default=0.05,
+                        help='Share of requests that insert a lead (default: 0.05)')
+    parser.add_argument('--leads', type=int, default=10000, help='Leads to seed the throwaway database with')
+    parser.add_argument('--readers', type=int, default=4, help='Reader threads for the started server')
+    parser.add_argument('--json', help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    server = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.url:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+        else:
+            host, port = '127.0.0.1', free_port()
+            print(f"Seeding {args.leads:,} leads...")
+            seed(os.path.join(workdir, 'sales_pipeline.db'), args.leads)
+            server = subprocess.Popen([sys.executable, MAIN, 'serve', '--port', str(port), '--quiet',
+                                       '--readers', str(args.readers)], cwd=workdir, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_server(host, port)
+            print(f"Running {args.concurrency} connections for {args.duration:g}s against {host}:{port}...")
+            timings, errors, elapsed = asyncio.run(run_load(host, port, args.concurrency, args.duration,
+                                                            args.leads, args.write_ratio))
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+    total = sum(len(t) for t in timings.values())
+    results = {label: summarize(t) for label, t in sorted(timings.items())}
+    print(f"\n{'Request':<34} {'Count':>8} {'Median':>10} {'P95':>10} {'P99':>10} {'Errors':>7}")
+    print("-" * 84)
+    for label, r in results.items():
+        print(f"{label:<34} {r['requests']:>8} {r['median_ms']:>8.1f}ms {r['p95_ms']:>8.1f}ms "
+              f"{r['p99_ms']:>8.1f}ms {errors.get(label, 0):>7}")
+    print(f"\nTotal: {total:,} requests in {elapsed:.1f}s ({total / elapsed:,.0f} req/s)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'concurrency': args.concurrency, 'duration': args.duration,
+                       'write_ratio': args.write_ratio, 'requests_per_second': round(total / elapsed, 1),
+                       'errors': errors, 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@
 Sales Pipeline Manager - Main Entry Point
 """
 import sys
+from salespipe import metrics, profiling
 from salespipe.cli import CLI, create_parser
 
 
@@ -15,31 +16,22 @@ def main():
         parser.print_help()
         return
 
+    if args.profile:
+        profiling.enable()
+
     cli = CLI()
 
     # Route commands to appropriate handlers
-    if args.command == 'add-lead':
-        cli.add_lead(args)
-    elif args.command == 'list-leads':
-        cli.list_leads(args)
-    elif args.command == 'export':
-        cli.export_leads(args)
-    elif args.command == 'import':
-        cli.import_leads(args)
-    elif args.command == 'analytics':
-        cli.show_analytics(args)
-    elif args.command == 'company':
-        cli.show_company(args)
-    elif args.command == 'add-opportunity':
-        cli.add_opportunity_cmd(args)
-    elif args.command == 'add-quote':
-        cli.add_quote_cmd(args)
-    elif args.command == 'add-order':
-        cli.add_order_cmd(args)
-    else:
-        print(f"Unknown command: {args.command}")
-        parser.print_help()
+    try:
+        if not cli.dispatch(args):
+            print(f"Unknown command: {args.command}")
+            parser.print_help()
+    finally:
+        if args.profile:
+            print(profiling.profiler.report(), file=sys.stderr)
+        if args.metrics_file:
+            metrics.registry.write_textfile(args.metrics_file)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
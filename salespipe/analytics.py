@@ -1,44 +1,455 @@
 """
 Analytics module for P.I.P.E. Sales Pipeline
 Provides conversion rates, win rates, and performance metrics
+
+Every report runs in two steps: module-level collectors query one database
+for raw counts and integer cents, and the report method adds up the
+collected parts and derives the rates. With a single file there is one
+part; ShardedAnalytics (salespipe.sharding) collects one per market.
+When the database has an archive attached (salespipe.archive), collectors
+add its pre-aggregated totals and archived history to what they return.
 """
+import functools
+import threading
+from salespipe import metrics
 from salespipe.database import Database
+from salespipe.models import Money
+
+
+def cached_report(method):
+    """
+    Memoize a report while the database is in a session, until the data changes
+    Cached results are shared between callers, so treat them as read-only
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.replica is not None:
+            self.replica.refresh_if_stale()
+        if not self.db.in_session:
+            return method(self, *args, **kwargs)
+
+        # Data states are per connection, and every thread has its own
+        key = (threading.get_ident(), method.__name__, args, tuple(sorted(kwargs.items())))
+        state = self.db.data_state()
+        cached = self._cache.get(key)
+        if cached and cached[0] == state:
+            metrics.ANALYTICS_CACHE.inc(method.__name__, 'hit')
+            return cached[1]
+
+        metrics.ANALYTICS_CACHE.inc(method.__name__, 'miss')
+        result = method(self, *args, **kwargs)
+        self._cache[key] = (state, result)
+        return result
+
+    return wrapper
+
+
+def _add_up(parts):
+    """
+    Merge collected parts: dicts whose values are numbers, or lists of
+    numbers added up position by position. Keys keep first-seen order.
+    """
+    total = {}
+    for part in parts:
+        for key, value in part.items():
+            if key not in total:
+                total[key] = value
+            elif isinstance(value, list):
+                total[key] = [a + b for a, b in zip(total[key], value)]
+            else:
+                total[key] += value
+    return total
+
+
+def _archived(db):
+    """Whether the open connection has an archive attached, with its tables created"""
+    if not db.archive_attached():
+        return False
+    db.cursor.execute("SELECT 1 FROM archive.sqlite_master WHERE name = 'archive_totals'")
+    return db.cursor.fetchone() is not None
+
+
+def _archive_totals(db, *counters):
+    """Sums of archive_totals counters, over everything archived"""
+    db.cursor.execute(f"SELECT {', '.join(f'TOTAL({name})' for name in counters)} FROM archive.archive_totals")
+    return [int(total) for total in db.cursor.fetchone()]
+
+
+def _funnel_counts(db):
+    """Number of leads, opportunities, quotes, orders and won orders"""
+    db.connect()
+
+    # Count leads
+    db.cursor.execute("SELECT COUNT(*) FROM leads")
+    leads = db.cursor.fetchone()[0]
+
+    # Count opportunities
+    db.cursor.execute("SELECT COUNT(*) FROM opportunities")
+    opportunities = db.cursor.fetchone()[0]
+
+    # Count quotes
+    db.cursor.execute("SELECT COUNT(*) FROM quotes")
+    quotes = db.cursor.fetchone()[0]
+
+    # Count orders (won)
+    won = db.lookup_code('order_statuses', 'won')
+    db.cursor.execute("SELECT COUNT(*) FROM orders WHERE status_id=?", (won,))
+    won_orders = db.cursor.fetchone()[0]
+
+    # Count all orders
+    db.cursor.execute("SELECT COUNT(*) FROM orders")
+    orders = db.cursor.fetchone()[0]
+
+    counts = {'leads': leads, 'opportunities': opportunities, 'quotes': quotes,
+              'orders': orders, 'won': won_orders}
+    if _archived(db):
+        archived = _archive_totals(db, 'opportunities', 'quotes', 'orders', 'won_orders')
+        for name, count in zip(('opportunities', 'quotes', 'orders', 'won'), archived):
+            counts[name] += count
+
+    db.close()
+    return counts
+
+
+def _order_counts(db):
+    """Number of won orders and of all orders"""
+    db.connect()
+
+    won = db.lookup_code('order_statuses', 'won')
+    db.cursor.execute("SELECT COUNT(*) FROM orders WHERE status_id=?", (won,))
+    won_orders = db.cursor.fetchone()[0]
+
+    db.cursor.execute("SELECT COUNT(*) FROM orders")
+    total_orders = db.cursor.fetchone()[0]
+
+    if _archived(db):
+        archived_won, archived_orders = _archive_totals(db, 'won_orders', 'orders')
+        won_orders += archived_won
+        total_orders += archived_orders
+
+    db.close()
+    return {'won': won_orders, 'orders': total_orders}
+
+
+def _pipeline_cents(db, exclude_expired):
+    """Summed cents of opportunities, quotes, won orders and all orders"""
+    db.connect()
+
+    # Sum of estimated values from opportunities
+    db.cursor.execute("SELECT SUM(estimated_value_cents) FROM opportunities")
+    opp_cents = db.cursor.fetchone()[0] or 0
+
+    # Sum of quoted amounts
+    db.cursor.execute("SELECT SUM(quoted_amount_cents) FROM quotes")
+    quote_cents = db.cursor.fetchone()[0] or 0
+
+    if exclude_expired:
+        # Expired quotes are one range of idx_quotes_expiry, which also covers the amount
+        expired = db.lookup_code('quote_statuses', 'expired')
+        db.cursor.execute("SELECT SUM(quoted_amount_cents) FROM quotes WHERE status_id=?", (expired,))
+        quote_cents -= db.cursor.fetchone()[0] or 0
+
+    # Sum of won orders
+    won = db.lookup_code('order_statuses', 'won')
+    db.cursor.execute("SELECT SUM(final_amount_cents) FROM orders WHERE status_id=?", (won,))
+    won_cents = db.cursor.fetchone()[0] or 0
+
+    # Sum of all orders (won + lost)
+    db.cursor.execute("SELECT SUM(final_amount_cents) FROM orders")
+    closed_cents = db.cursor.fetchone()[0] or 0
+
+    cents = {'opportunities': opp_cents, 'quotes': quote_cents, 'won': won_cents, 'closed': closed_cents}
+    if _archived(db):
+        archived = _archive_totals(db, 'opportunity_cents', 'quote_cents', 'expired_quote_cents',
+                                   'won_cents', 'closed_cents')
+        cents['opportunities'] += archived[0]
+        cents['quotes'] += archived[1] - (archived[2] if exclude_expired else 0)
+        cents['won'] += archived[3]
+        cents['closed'] += archived[4]
+
+    db.close()
+    return cents
+
+
+def _industry_stats(db):
+    """industry -> [leads, won orders, won cents]"""
+    db.connect()
+
+    # Count leads per industry
+    db.cursor.execute("""
+                      SELECT l.industry_id, ind.label, COUNT(*)
+                      FROM leads l
+                               JOIN industries ind ON ind.code = l.industry_id
+                      GROUP BY l.industry_id
+                      """)
+    lead_counts = db.cursor.fetchall()
+
+    # Won orders and their value per industry (via lead_id chain)
+    won = db.lookup_code('order_statuses', 'won')
+    db.cursor.execute("""
+                      SELECT l.industry_id, COUNT(*), SUM(o.final_amount_cents)
+                      FROM orders o
+                               JOIN quotes q ON o.quote_id = q.quote_id
+                               JOIN opportunities opp ON q.opp_id = opp.opp_id
+                               JOIN leads l ON opp.lead_id = l.lead_id
+                      WHERE o.status_id = ?
+                        AND l.industry_id IS NOT NULL
+                      GROUP BY l.industry_id
+                      """, (won,))
+    won_stats = {code: (count, cents) for code, count, cents in db.cursor.fetchall()}
+
+    if _archived(db):
+        db.cursor.execute("""
+                          SELECT industry_id, SUM(won_orders), SUM(won_cents)
+                          FROM archive.archive_totals
+                          WHERE industry_id != 0
+                          GROUP BY industry_id
+                          """)
+        for code, count, cents in db.cursor.fetchall():
+            hot_count, hot_cents = won_stats.get(code, (0, 0))
+            won_stats[code] = (hot_count + count, hot_cents + cents)
+
+    db.close()
+    return {industry: [leads_count, *won_stats.get(code, (0, 0))] for code, industry, leads_count in lead_counts}
+
+
+def _location_stats(db):
+    """location -> [leads, won orders, pipeline cents]"""
+    db.connect()
+
+    # Count leads per location
+    db.cursor.execute("""
+                      SELECT l.location_id, loc.label, COUNT(*)
+                      FROM leads l
+                               JOIN locations loc ON loc.code = l.location_id
+                      GROUP BY l.location_id
+                      """)
+    lead_counts = db.cursor.fetchall()
+
+    # Count won orders per location
+    won = db.lookup_code('order_statuses', 'won')
+    db.cursor.execute("""
+                      SELECT l.location_id, COUNT(*)
+                      FROM orders o
+                               JOIN quotes q ON o.quote_id = q.quote_id
+                               JOIN opportunities opp ON q.opp_id = opp.opp_id
+                               JOIN leads l ON opp.lead_id = l.lead_id
+                      WHERE o.status_id = ?
+                        AND l.location_id IS NOT NULL
+                      GROUP BY l.location_id
+                      """, (won,))
+    won_counts = dict(db.cursor.fetchall())
+
+    # Pipeline value per location
+    db.cursor.execute("""
+                      SELECT l.location_id, SUM(opp.estimated_value_cents)
+                      FROM opportunities opp
+                               JOIN leads l ON opp.lead_id = l.lead_id
+                      WHERE l.location_id IS NOT NULL
+                      GROUP BY l.location_id
+                      """)
+    pipeline_cents = dict(db.cursor.fetchall())
+
+    if _archived(db):
+        db.cursor.execute("""
+                          SELECT location_id, SUM(won_orders), SUM(opportunity_cents)
+                          FROM archive.archive_totals
+                          WHERE location_id != 0
+                          GROUP BY location_id
+                          """)
+        for code, count, cents in db.cursor.fetchall():
+            won_counts[code] = won_counts.get(code, 0) + count
+            pipeline_cents[code] = pipeline_cents.get(code, 0) + cents
+
+    db.close()
+    return {location: [leads_count, won_counts.get(code, 0), pipeline_cents.get(code, 0)]
+            for code, location, leads_count in lead_counts}
+
+
+def _stage_histories(db):
+    """Stage history tables to report on: the main one, and the archived one if attached"""
+    if _archived(db):
+        return ['main.opportunity_stage_history', 'archive.opportunity_stage_history']
+    return ['main.opportunity_stage_history']
+
+
+def _stage_stays(db):
+    """stage -> [completed stays, total days of those stays, opportunities in the stage now]"""
+    db.connect()
+    parts = []
+    for history in _stage_histories(db):
+        # LEAD() gives the moment each stay ended: the next change of the same opportunity
+        db.cursor.execute(f"""
+                          SELECT st.label,
+                                 COUNT(h.left_at),
+                                 TOTAL(julianday(h.left_at) - julianday(h.changed_at)),
+                                 SUM(h.left_at IS NULL)
+                          FROM (SELECT to_stage_id,
+                                       changed_at,
+                                       LEAD(changed_at) OVER (PARTITION BY opp_id
+                                           ORDER BY changed_at, history_id) AS left_at
+                                FROM {history}) h
+                                   JOIN opportunity_stages st ON st.code = h.to_stage_id
+                          GROUP BY h.to_stage_id
+                          ORDER BY h.to_stage_id
+                          """)
+        parts.append({stage: [exits, days, current] for stage, exits, days, current in db.cursor.fetchall()})
+    db.close()
+    return _add_up(parts)
+
+
+def _stage_transitions(db):
+    """(from_stage, to_stage) -> [transitions, transitions with a known entry time, total days]"""
+    db.connect()
+    parts = []
+    for history in _stage_histories(db):
+        # LAG() gives the moment the opportunity entered the stage it is leaving
+        db.cursor.execute(f"""
+                          SELECT f.label,
+                                 t.label,
+                                 COUNT(*),
+                                 COUNT(h.entered_at),
+                                 TOTAL(julianday(h.changed_at) - julianday(h.entered_at))
+                          FROM (SELECT from_stage_id,
+                                       to_stage_id,
+                                       changed_at,
+                                       LAG(changed_at) OVER (PARTITION BY opp_id
+                                           ORDER BY changed_at, history_id) AS entered_at
+                                FROM {history}) h
+                                   JOIN opportunity_stages f ON f.code = h.from_stage_id
+                                   JOIN opportunity_stages t ON t.code = h.to_stage_id
+                          GROUP BY h.from_stage_id, h.to_stage_id
+                          ORDER BY h.from_stage_id, h.to_stage_id
+                          """)
+        parts.append({(from_stage, to_stage): [transitions, timed, days]
+                      for from_stage, to_stage, transitions, timed, days in db.cursor.fetchall()})
+    db.close()
+    return _add_up(parts)
+
+
+# Sort keys of get_top_opportunities: SQL expression, and the same for a collected row
+TOP_OPPORTUNITY_ORDERS = {
+    'weighted': ('opp.estimated_value_cents * opp.probability',
+                 lambda row: row[4] * row[5] if row[5] is not None else -1),
+    'value': ('opp.estimated_value_cents', lambda row: row[4]),
+}
+
+
+def _top_opportunities(db, limit, by, include_closed):
+    """Up to `limit` rows (opp_id, title, company, stage, value cents, probability), largest first"""
+    order_by = TOP_OPPORTUNITY_ORDERS[by][0]
+    closed_filter = "" if include_closed else """
+                      WHERE NOT EXISTS (SELECT 1
+                                        FROM quotes q
+                                                 JOIN orders o ON o.quote_id = q.quote_id
+                                        WHERE q.opp_id = opp.opp_id)"""
+
+    db.connect()
+    # Archived opportunities are all closed
+    tables = ['main.opportunities']
+    if include_closed and _archived(db):
+        tables.append('archive.opportunities')
+
+    rows = []
+    for table in tables:
+        # ORDER BY matches idx_opportunities_weighted / idx_opportunities_value, so
+        # SQLite walks the index backwards and stops after `limit` rows
+        db.cursor.execute(f"""
+                          SELECT opp.opp_id, opp.title, l.name, st.label,
+                                 opp.estimated_value_cents, opp.probability
+                          FROM {table} opp
+                                   JOIN leads l ON l.lead_id = opp.lead_id
+                                   LEFT JOIN opportunity_stages st ON st.code = opp.stage_id{closed_filter}
+                          ORDER BY {order_by} DESC
+                          LIMIT ?
+                          """, (limit,))
+        rows += db.cursor.fetchall()
+    db.close()
+    return rows
+
+
+def _top_accounts(db, limit):
+    """Up to `limit` rows (lead_id, company, won orders, won cents), largest first"""
+    db.connect()
+
+    archived = ""
+    if _archived(db):
+        archived = """
+                                UNION ALL
+                                SELECT lead_id, won_orders, won_cents
+                                FROM archive.archived_accounts"""
+
+    # Won orders are one range of idx_orders_won, which covers amount and quote_id
+    won = db.lookup_code('order_statuses', 'won')
+    db.cursor.execute(f"""
+                      SELECT l.lead_id, l.name, SUM(w.won_orders), SUM(w.won_cents) AS won_cents
+                      FROM (SELECT opp.lead_id, COUNT(*) AS won_orders, SUM(o.final_amount_cents) AS won_cents
+                            FROM orders o
+                                     JOIN quotes q ON o.quote_id = q.quote_id
+                                     JOIN opportunities opp ON q.opp_id = opp.opp_id
+                            WHERE o.status_id = ?
+                            GROUP BY opp.lead_id{archived}) w
+                               JOIN leads l ON l.lead_id = w.lead_id
+                      GROUP BY l.lead_id
+                      ORDER BY won_cents DESC
+                      LIMIT ?
+                      """, (won, limit))
+    rows = db.cursor.fetchall()
+    db.close()
+    return rows
 
 
 class Analytics:
     """Analytics calculator for sales pipeline"""
 
-    def __init__(self, db_path="sales_pipeline.db"):
-        self.db = Database(db_path)
-
+    def __init__(self, db_path="sales_pipeline.db", db=None, read_only=False, replica=None, replica_max_age=60.0,
+                 archive=None):
+        """
+        Pass `db` to share an existing Database (and its session connection).
+        read_only=True reads through mode=ro snapshot connections under WAL,
+        so reports never hold up ingestion. `replica` names a file that is
+        kept as a copy of db_path (refreshed when older than replica_max_age
+        seconds) and read instead of it. `archive` names an archive file
+        (see salespipe.archive) whose deals reports include; a shared `db`
+        includes its own archive_path, if any.
+        """
+        self.replica = None
+        self._owns_db = db is None
+        if db is not None:
+            self.db = db
+        elif replica:
+            from salespipe.replica import Replica
+            self.replica = Replica(db_path, replica, replica_max_age)
+            self.db = Database(replica, read_only=True, archive_path=archive)
+        elif read_only:
+            Database(db_path).enable_wal()
+            self.db = Database(db_path, read_only=True, archive_path=archive)
+        else:
+            self.db = Database(db_path, archive_path=archive)
+        self._cache = {}
+
+    def close(self):
+        """Close the database this engine opened itself; a shared `db` is left to its owner"""
+        if self._owns_db:
+            self.db.close()
+
+    def _gather(self, collect, *args):
+        """Run a collector against the data; returns the list of parts it produced"""
+        return [collect(self.db, *args)]
+
+    @metrics.instrumented
+    @cached_report
     def get_conversion_rates(self):
         """
         Calculate conversion rates for each stage of the funnel
         Returns dict with conversion rates
         """
-        self.db.connect()
-
-        # Count leads
-        self.db.cursor.execute("SELECT COUNT(*) FROM leads")
-        total_leads = self.db.cursor.fetchone()[0]
-
-        # Count opportunities
-        self.db.cursor.execute("SELECT COUNT(*) FROM opportunities")
-        total_opps = self.db.cursor.fetchone()[0]
-
-        # Count quotes
-        self.db.cursor.execute("SELECT COUNT(*) FROM quotes")
-        total_quotes = self.db.cursor.fetchone()[0]
-
-        # Count orders (won)
-        self.db.cursor.execute("SELECT COUNT(*) FROM orders WHERE status='won'")
-        total_won = self.db.cursor.fetchone()[0]
-
-        # Count all orders
-        self.db.cursor.execute("SELECT COUNT(*) FROM orders")
-        total_orders = self.db.cursor.fetchone()[0]
-
-        self.db.close()
+        counts = _add_up(self._gather(_funnel_counts))
+        total_leads = counts['leads']
+        total_opps = counts['opportunities']
+        total_quotes = counts['quotes']
+        total_orders = counts['orders']
+        total_won = counts['won']
 
         # Calculate conversion rates
         lead_to_opp = (total_opps / total_leads * 100) if total_leads > 0 else 0
@@ -60,19 +471,15 @@ class Analytics:
             'overall_conversion': round(lead_to_won, 2)
         }
 
+    @metrics.instrumented
+    @cached_report
     def get_win_rate(self):
         """
         Calculate overall win rate (won orders / total orders)
         """
-        self.db.connect()
-
-        self.db.cursor.execute("SELECT COUNT(*) FROM orders WHERE status='won'")
-        won_orders = self.db.cursor.fetchone()[0]
-
-        self.db.cursor.execute("SELECT COUNT(*) FROM orders")
-        total_orders = self.db.cursor.fetchone()[0]
-
-        self.db.close()
+        counts = _add_up(self._gather(_order_counts))
+        won_orders = counts['won']
+        total_orders = counts['orders']
 
         win_rate = (won_orders / total_orders * 100) if total_orders > 0 else 0
 
@@ -82,80 +489,36 @@ class Analytics:
             'win_rate': round(win_rate, 2)
         }
 
-    def get_pipeline_value(self):
+    @metrics.instrumented
+    @cached_report
+    def get_pipeline_value(self, exclude_expired=False):
         """
         Calculate total pipeline value from opportunities and quotes
+        Amounts are summed as exact integer cents in SQLite
+        With exclude_expired, quotes marked expired don't count towards quotes_value
         """
-        self.db.connect()
-
-        # Sum of estimated values from opportunities
-        self.db.cursor.execute("SELECT SUM(estimated_value) FROM opportunities")
-        opp_value = self.db.cursor.fetchone()[0] or 0
-
-        # Sum of quoted amounts
-        self.db.cursor.execute("SELECT SUM(quoted_amount) FROM quotes")
-        quote_value = self.db.cursor.fetchone()[0] or 0
-
-        # Sum of won orders
-        self.db.cursor.execute("SELECT SUM(final_amount) FROM orders WHERE status='won'")
-        won_value = self.db.cursor.fetchone()[0] or 0
-
-        # Sum of all orders (won + lost)
-        self.db.cursor.execute("SELECT SUM(final_amount) FROM orders")
-        total_closed_value = self.db.cursor.fetchone()[0] or 0
-
-        self.db.close()
+        cents = _add_up(self._gather(_pipeline_cents, exclude_expired))
+        opp_value = Money(cents['opportunities'])
+        quote_value = Money(cents['quotes'])
 
         return {
-            'opportunities_value': round(opp_value, 2),
-            'quotes_value': round(quote_value, 2),
-            'won_value': round(won_value, 2),
-            'total_closed_value': round(total_closed_value, 2),
-            'total_pipeline': round(opp_value + quote_value, 2)
+            'opportunities_value': float(opp_value),
+            'quotes_value': float(quote_value),
+            'won_value': float(Money(cents['won'])),
+            'total_closed_value': float(Money(cents['closed'])),
+            'total_pipeline': float(opp_value + quote_value)
         }
 
+    @metrics.instrumented
+    @cached_report
     def get_performance_by_industry(self):
         """
         Calculate performance metrics by industry
         """
-        self.db.connect()
-
-        # Get all industries
-        self.db.cursor.execute("SELECT DISTINCT industry FROM leads WHERE industry IS NOT NULL")
-        industries = [row[0] for row in self.db.cursor.fetchall()]
-
         results = {}
-
-        for industry in industries:
-            # Count leads per industry
-            self.db.cursor.execute("SELECT COUNT(*) FROM leads WHERE industry=?", (industry,))
-            leads_count = self.db.cursor.fetchone()[0]
-
-            # Count won orders per industry (via lead_id chain)
-            self.db.cursor.execute("""
-                                   SELECT COUNT(*)
-                                   FROM orders o
-                                            JOIN quotes q ON o.quote_id = q.quote_id
-                                            JOIN opportunities opp ON q.opp_id = opp.opp_id
-                                            JOIN leads l ON opp.lead_id = l.lead_id
-                                   WHERE l.industry = ?
-                                     AND o.status = 'won'
-                                   """, (industry,))
-            won_count = self.db.cursor.fetchone()[0]
-
-            # Average deal value per industry
-            self.db.cursor.execute("""
-                                   SELECT AVG(o.final_amount)
-                                   FROM orders o
-                                            JOIN quotes q ON o.quote_id = q.quote_id
-                                            JOIN opportunities opp ON q.opp_id = opp.opp_id
-                                            JOIN leads l ON opp.lead_id = l.lead_id
-                                   WHERE l.industry = ?
-                                     AND o.status = 'won'
-                                   """, (industry,))
-            avg_value = self.db.cursor.fetchone()[0] or 0
-
+        for industry, (leads_count, won_count, won_cents) in _add_up(self._gather(_industry_stats)).items():
             win_rate = (won_count / leads_count * 100) if leads_count > 0 else 0
+            avg_value = (won_cents / won_count / 100) if won_count > 0 else 0
 
             results[industry] = {
                 'leads': leads_count,
@@ -164,55 +527,95 @@ class Analytics:
                 'avg_deal_value': round(avg_value, 2)
             }
 
-        self.db.close()
         return results
 
+    @metrics.instrumented
+    @cached_report
     def get_performance_by_location(self):
         """
         Calculate performance metrics by geography location
         """
-        self.db.connect()
-
-        # Get all locations
-        self.db.cursor.execute("SELECT DISTINCT location FROM leads WHERE location IS NOT NULL")
-        locations = [row[0] for row in self.db.cursor.fetchall()]
-
         results = {}
-
-        for location in locations:
-            # Count leads per location
-            self.db.cursor.execute("SELECT COUNT(*) FROM leads WHERE location=?", (location,))
-            leads_count = self.db.cursor.fetchone()[0]
-
-            # Count won orders per location
-            self.db.cursor.execute("""
-                                   SELECT COUNT(*)
-                                   FROM orders o
-                                            JOIN quotes q ON o.quote_id = q.quote_id
-                                            JOIN opportunities opp ON q.opp_id = opp.opp_id
-                                            JOIN leads l ON opp.lead_id = l.lead_id
-                                   WHERE l.location = ?
-                                     AND o.status = 'won'
-                                   """, (location,))
-            won_count = self.db.cursor.fetchone()[0]
-
-            # Pipeline value per location
-            self.db.cursor.execute("""
-                                   SELECT SUM(opp.estimated_value)
-                                   FROM opportunities opp
-                                            JOIN leads l ON opp.lead_id = l.lead_id
-                                   WHERE l.location = ?
-                                   """, (location,))
-            pipeline_value = self.db.cursor.fetchone()[0] or 0
-
+        for location, (leads_count, won_count, pipeline_cents) in _add_up(self._gather(_location_stats)).items():
             win_rate = (won_count / leads_count * 100) if leads_count > 0 else 0
 
             results[location] = {
                 'leads': leads_count,
                 'won_orders': won_count,
                 'win_rate': round(win_rate, 2),
-                'pipeline_value': round(pipeline_value, 2)
+                'pipeline_value': float(Money(pipeline_cents))
+            }
+
+        return results
+
+    @metrics.instrumented
+    @cached_report
+    def get_time_in_stage(self):
+        """
+        Calculate how long opportunities stay in each stage, from the stage history
+        avg_days only counts completed stays; 'current' is how many opportunities
+        are in the stage right now
+        """
+        results = {}
+        for stage, (exits, days, current) in _add_up(self._gather(_stage_stays)).items():
+            results[stage] = {
+                'exits': exits,
+                'avg_days': round(days / exits if exits else 0.0, 2),
+                'current': current
+            }
+
+        return results
+
+    @metrics.instrumented
+    @cached_report
+    def get_stage_velocity(self):
+        """
+        Calculate stage-to-stage velocity: how many opportunities made each
+        transition and the average days spent in the stage before moving on
+        Keys are (from_stage, to_stage) tuples
+        """
+        results = {}
+        for transition, (transitions, timed, days) in _add_up(self._gather(_stage_transitions)).items():
+            results[transition] = {
+                'transitions': transitions,
+                'avg_days': round(days / timed if timed else 0.0, 2)
             }
 
-        self.db.close()
-        return results
\ No newline at end of file
+        return results
+
+    @metrics.instrumented
+    @cached_report
+    def get_top_opportunities(self, limit=20, by='weighted', include_closed=False):
+        """
+        Get the largest opportunities, by weighted value (value x probability)
+        or by estimated value
+        Open opportunities (no order on any of their quotes) only, unless include_closed
+        """
+        rows = [row for part in self._gather(_top_opportunities, limit, by, include_closed) for row in part]
+        rows.sort(key=TOP_OPPORTUNITY_ORDERS[by][1], reverse=True)
+
+        return [{
+            'opp_id': opp_id,
+            'title': title,
+            'company': company,
+            'stage': stage,
+            'estimated_value': float(Money(value_cents)),
+            'probability': probability,
+            'weighted_value': float(Money(value_cents * (probability or 0) // 100))
+        } for opp_id, title, company, stage, value_cents, probability in rows[:limit]]
+
+    @metrics.instrumented
+    @cached_report
+    def get_top_accounts(self, limit=20):
+        """
+        Get the accounts (leads) with the highest total won value
+        """
+        rows = [row for part in self._gather(_top_accounts, limit) for row in part]
+        rows.sort(key=lambda row: row[3], reverse=True)
+
+        return [{
+            'lead_id': lead_id,
+            'company': company,
+            'won_orders': won_orders,
+            'won_value': float(Money(won_cents))
+        } for lead_id, company, won_orders, won_cents in rows[:limit]]
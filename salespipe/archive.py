@@ -0,0 +1,237 @@
+"""
+Archival of closed deals for Sales Pipeline Manager
+Funnels whose orders all closed before a cutoff are moved, with their quotes
+and history, from the main file into an archive file attached as the
+`archive` schema. The main file keeps the leads and every open deal, so
+day-to-day scans stay small. The archive keeps pre-aggregated totals of what
+it holds, which Analytics adds when created with archive=<path>.
+"""
+import json
+import os
+
+from salespipe.database import Database, RECORDS
+
+# Tables moved with a closed funnel, parents first, and the temp table
+# listing the keys being moved in the current batch
+FUNNEL_TABLES = (
+    ('opportunities', 'opp_id', 'archiving_opps'),
+    ('opportunity_stage_history', 'opp_id', 'archiving_opps'),
+    ('quotes', 'quote_id', 'archiving_quotes'),
+    ('quote_status_history', 'quote_id', 'archiving_quotes'),
+    ('orders', 'quote_id', 'archiving_quotes'),
+)
+
+# Counters of everything archived, by the lead's location and industry (0: none)
+ARCHIVE_TOTALS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS archive.archive_totals
+    (
+        location_id         INTEGER NOT NULL,
+        industry_id         INTEGER NOT NULL,
+        opportunities       INTEGER NOT NULL DEFAULT 0,
+        opportunity_cents   INTEGER NOT NULL DEFAULT 0,
+        quotes              INTEGER NOT NULL DEFAULT 0,
+        quote_cents         INTEGER NOT NULL DEFAULT 0,
+        expired_quote_cents INTEGER NOT NULL DEFAULT 0,
+        orders              INTEGER NOT NULL DEFAULT 0,
+        won_orders          INTEGER NOT NULL DEFAULT 0,
+        won_cents           INTEGER NOT NULL DEFAULT 0,
+        closed_cents        INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (location_id, industry_id)
+    )
+'''
+
+# Won orders archived per lead, for account rankings
+ARCHIVED_ACCOUNTS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS archive.archived_accounts
+    (
+        lead_id    INTEGER PRIMARY KEY,
+        won_orders INTEGER NOT NULL DEFAULT 0,
+        won_cents  INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+ARCHIVE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_opportunities_lead ON opportunities (lead_id)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_stage_history_opp ON opportunity_stage_history (opp_id)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_quotes_opp ON quotes (opp_id)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_quote ON orders (quote_id)",
+)
+
+
+def default_archive_path(db_path):
+    """Archive file next to a database: sales_pipeline.db -> sales_pipeline.archive.db"""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.archive{ext or '.db'}"
+
+
+class Archiver:
+    """
+    Moves closed funnels from a database into its archive file
+
+        Archiver("sales_pipeline.db").archive(before="2024-01-01")
+
+    A funnel is an opportunity with its quotes, orders and history; it is
+    closed once it has an order, and old once its last order closed before
+    the cutoff. Funnels move in batches, each one transaction over both
+    files, so an interrupted run loses nothing and can simply be repeated.
+    """
+
+    def __init__(self, db_path="sales_pipeline.db", archive_path=None):
+        self.archive_path = archive_path or default_archive_path(db_path)
+        self.db = Database(db_path, archive_path=self.archive_path)
+        self.db.create_tables()
+
+    def create_tables(self):
+        """Create the archive file and its tables, matching the columns of the main tables"""
+        if not os.path.exists(self.archive_path):
+            # An empty file is an empty database; connections attach it once it exists
+            open(self.archive_path, 'ab').close()
+        with self.db.transaction():
+            for table, _, _ in FUNNEL_TABLES:
+                main_columns = self.db.cursor.execute(f"PRAGMA main.table_info({table})").fetchall()
+                archived = {row[1] for row in self.db.cursor.execute(f"PRAGMA archive.table_info({table})")}
+                if not archived:
+                    columns = ", ".join(f"{name} {kind}" + (" PRIMARY KEY" if pk else "")
+                                        for _, name, kind, _, _, pk in main_columns)
+                    self.db.cursor.execute(f"CREATE TABLE archive.{table} ({columns})")
+                else:
+                    # Columns added to the main table by later migrations
+                    for _, name, kind, _, _, _ in main_columns:
+                        if name not in archived:
+                            self.db.cursor.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {kind}")
+            self.db.cursor.execute(ARCHIVE_TOTALS_TABLE)
+            self.db.cursor.execute(ARCHIVED_ACCOUNTS_TABLE)
+            for index in ARCHIVE_INDEXES:
+                self.db.cursor.execute(index)
+
+    def archive(self, before, batch_size=1000):
+        """
+        Move every funnel whose orders all closed before `before` (YYYY-MM-DD)
+        Returns the number of opportunities, quotes and orders moved
+        """
+        self.create_tables()
+        moved = {'opportunities': 0, 'quotes': 0, 'orders': 0}
+        after = 0
+
+        self.db.open_session()
+        try:
+            self.db.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS archiving_opps "
+                                   "(opp_id INTEGER PRIMARY KEY, copied INTEGER NOT NULL)")
+            self.db.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS archiving_quotes "
+                                   "(quote_id INTEGER PRIMARY KEY, copied INTEGER NOT NULL)")
+            while True:
+                with self.db.transaction():
+                    # Walks idx_quotes_opp in opp_id order and stops after one batch
+                    self.db.cursor.execute('''
+                                           SELECT q.opp_id
+                                           FROM quotes q
+                                                    JOIN orders o ON o.quote_id = q.quote_id
+                                           WHERE q.opp_id > ?
+                                           GROUP BY q.opp_id
+                                           HAVING MAX(o.close_date) < ?
+                                           ORDER BY q.opp_id
+                                           LIMIT ?
+                                           ''', (after, before, batch_size))
+                    opp_ids = [row[0] for row in self.db.cursor.fetchall()]
+                    if not opp_ids:
+                        break
+                    for table, count in self._move(opp_ids).items():
+                        moved[table] += count
+                after = opp_ids[-1]
+        finally:
+            self.db.close_session()
+        return moved
+
+    def _move(self, opp_ids):
+        """Add a batch of funnels to the archive totals, copy them over and delete them from the main file"""
+        cursor = self.db.cursor
+        cursor.execute("DELETE FROM temp.archiving_opps")
+        cursor.execute("DELETE FROM temp.archiving_quotes")
+        # Funnels already copied (by a run interrupted between committing the two files) only need deleting
+        cursor.execute('''
+                       INSERT INTO temp.archiving_opps (opp_id, copied)
+                       SELECT value, value IN (SELECT opp_id FROM archive.opportunities)
+                       FROM json_each(?)
+                       ''', (json.dumps(opp_ids),))
+        cursor.execute('''
+                       INSERT INTO temp.archiving_quotes (quote_id, copied)
+                       SELECT q.quote_id, a.copied
+                       FROM main.quotes q
+                                JOIN temp.archiving_opps a ON a.opp_id = q.opp_id
+                       ''')
+
+        self._add_totals()
+
+        for table, key, batch in FUNNEL_TABLES:
+            columns = [row[1] for row in cursor.execute(f"PRAGMA main.table_info({table})")
+                       if table in RECORDS or not row[5]]  # History rows get new IDs in the archive
+            columns = ", ".join(columns)
+            cursor.execute(f'''
+                           INSERT INTO archive.{table} ({columns})
+                           SELECT {columns}
+                           FROM main.{table}
+                           WHERE {key} IN (SELECT {key} FROM temp.{batch} WHERE NOT copied)
+                           ''')
+
+        moved = {}
+        for table, key, batch in reversed(FUNNEL_TABLES):
+            cursor.execute(f"DELETE FROM main.{table} WHERE {key} IN (SELECT {key} FROM temp.{batch})")
+            if table in RECORDS:
+                moved[table] = cursor.rowcount
+        return moved
+
+    def _add_totals(self):
+        """Add the batch's not yet archived funnels onto archive_totals and archived_accounts"""
+        expired = self.db.lookup_code('quote_statuses', 'expired')
+        won = self.db.lookup_code('order_statuses', 'won')
+        funnels = "SELECT opp_id FROM temp.archiving_opps WHERE NOT copied"
+
+        self._add_to('archive_totals', ['location_id', 'industry_id'], ['opportunities', 'opportunity_cents'], f'''
+                     SELECT IFNULL(l.location_id, 0), IFNULL(l.industry_id, 0), COUNT(*), SUM(o.estimated_value_cents)
+                     FROM main.opportunities o
+                              JOIN main.leads l ON l.lead_id = o.lead_id
+                     WHERE o.opp_id IN ({funnels})
+                     GROUP BY 1, 2
+                     ''')
+        self._add_to('archive_totals', ['location_id', 'industry_id'],
+                     ['quotes', 'quote_cents', 'expired_quote_cents'], f'''
+                     SELECT IFNULL(l.location_id, 0), IFNULL(l.industry_id, 0), COUNT(*), SUM(q.quoted_amount_cents),
+                            SUM(CASE WHEN q.status_id = ? THEN q.quoted_amount_cents ELSE 0 END)
+                     FROM main.quotes q
+                              JOIN main.opportunities o ON o.opp_id = q.opp_id
+                              JOIN main.leads l ON l.lead_id = o.lead_id
+                     WHERE q.opp_id IN ({funnels})
+                     GROUP BY 1, 2
+                     ''', (expired,))
+        self._add_to('archive_totals', ['location_id', 'industry_id'],
+                     ['orders', 'won_orders', 'won_cents', 'closed_cents'], f'''
+                     SELECT IFNULL(l.location_id, 0), IFNULL(l.industry_id, 0), COUNT(*), SUM(r.status_id = ?),
+                            SUM(CASE WHEN r.status_id = ? THEN r.final_amount_cents ELSE 0 END), SUM(r.final_amount_cents)
+                     FROM main.orders r
+                              JOIN main.quotes q ON q.quote_id = r.quote_id
+                              JOIN main.opportunities o ON o.opp_id = q.opp_id
+                              JOIN main.leads l ON l.lead_id = o.lead_id
+                     WHERE q.opp_id IN ({funnels})
+                     GROUP BY 1, 2
+                     ''', (won, won))
+        self._add_to('archived_accounts', ['lead_id'], ['won_orders', 'won_cents'], f'''
+                     SELECT o.lead_id, COUNT(*), SUM(r.final_amount_cents)
+                     FROM main.orders r
+                              JOIN main.quotes q ON q.quote_id = r.quote_id
+                              JOIN main.opportunities o ON o.opp_id = q.opp_id
+                     WHERE q.opp_id IN ({funnels})
+                       AND r.status_id = ?
+                     GROUP BY o.lead_id
+                     ''', (won,))
+
+    def _add_to(self, table, keys, counters, select, params=()):
+        """Add the rows of `select` (keys, then counters) onto a totals table"""
+        updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in counters)
+        self.db.cursor.execute(f"INSERT INTO archive.{table} ({', '.join(keys + counters)}) {select} "
+                               f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}", params)
+
+    def vacuum(self):
+        """Rebuild the main file so the space freed by archiving is returned to the filesystem"""
+        self.db.connect()
+        self.db.cursor.execute("VACUUM main")
+        self.db.close()
@@ -0,0 +1,220 @@
+"""
+Async access to the Sales Pipeline database
+SQLite calls block, so AsyncDatabase runs them on its own threads and hands
+back awaitables. Each thread keeps one connection for its whole life; under
+WAL the reader threads query in parallel while a single writer commits.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import queue
+import threading
+
+from salespipe.analytics import Analytics
+from salespipe.database import Database
+
+
+class ConnectionPool:
+    """
+    Runs database work on threads that each own one connection
+    `readers` threads share the read queue; one writer thread takes every
+    write, so writes never compete for SQLite's write lock. Jobs are called
+    as job(db, analytics) and their results come back as asyncio futures.
+    Cancelling a future drops a queued job, or interrupts a running query.
+    """
+
+    def __init__(self, db_path, readers=4):
+        self.db_path = db_path
+        self._reads = queue.Queue()
+        self._writes = queue.Queue()
+        self._running = {}  # concurrent future -> connection running its job
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, args=(self._reads,),
+                                          name=f"salespipe-reader-{n}", daemon=True)
+                         for n in range(readers)]
+        self._threads.append(threading.Thread(target=self._work, args=(self._writes,),
+                                              name="salespipe-writer", daemon=True))
+
+    def start(self):
+        """Bring the schema up to date, switch to WAL and start the threads"""
+        db = Database(self.db_path)
+        db.create_tables()
+        # WAL lets readers keep reading while the writer commits
+        db.enable_wal()
+        for thread in self._threads:
+            thread.start()
+
+    def close(self):
+        """Finish queued jobs, then stop the threads and close their connections"""
+        for thread in self._threads[:-1]:
+            self._reads.put(None)
+        self._writes.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def read(self, job):
+        """Run job(db, analytics) on a reader thread"""
+        return self._submit(self._reads, job)
+
+    def write(self, job):
+        """Run job(db, analytics) on the writer thread"""
+        return self._submit(self._writes, job)
+
+    def _submit(self, jobs, job):
+        future = concurrent.futures.Future()
+        jobs.put((future, job))
+        awaitable = asyncio.wrap_future(future)
+        awaitable.add_done_callback(lambda f: f.cancelled() and self._interrupt(future))
+        return awaitable
+
+    def _interrupt(self, future):
+        """Abort the query of a job that was already running when it was cancelled"""
+        with self._lock:
+            conn = self._running.get(future)
+            if conn is not None:
+                conn.interrupt()
+
+    def _work(self, jobs):
+        # Readers get mode=ro snapshot connections, so reports never hold up the writer
+        db = Database(self.db_path, read_only=jobs is self._reads)
+        db.open_session()
+        analytics = Analytics(db=db)
+        try:
+            while True:
+                item = jobs.get()
+                if item is None:
+                    break
+                future, job = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                with self._lock:
+                    self._running[future] = db.conn
+                try:
+                    result = job(db, analytics)
+                except BaseException as e:
+                    db.rollback()
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                finally:
+                    with self._lock:
+                        del self._running[future]
+        finally:
+            db.close_session()
+
+
+def _reader(name, source=Database):
+    """Awaitable version of a read-only Database (or Analytics) method"""
+    method = getattr(source, name)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if source is Analytics:
+            return await self.pool.read(lambda db, analytics: method(analytics, *args, **kwargs))
+        return await self.pool.read(lambda db, analytics: method(db, *args, **kwargs))
+
+    return wrapper
+
+
+def _writer(name):
+    """Awaitable version of a Database method that changes data"""
+    method = getattr(Database, name)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await self.pool.write(lambda db, analytics: method(db, *args, **kwargs))
+
+    return wrapper
+
+
+class AsyncDatabase:
+    """
+    Awaitable counterpart of Database and Analytics, for asyncio applications
+
+        async with AsyncDatabase("sales_pipeline.db") as db:
+            lead_id = await db.add_lead(lead)
+            async for lead in db.iter_leads(industry="automotive"):
+                ...
+            pipeline = await db.get_pipeline_value()
+    """
+
+    def __init__(self, db_path="sales_pipeline.db", readers=4):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, readers)
+
+    def start(self):
+        """Start the worker threads (done by `async with`)"""
+        self.pool.start()
+
+    async def close(self):
+        """Wait for queued work, then close every connection"""
+        await asyncio.get_running_loop().run_in_executor(None, self.pool.close)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # Writes, all on the single writer thread
+    add_lead = _writer('add_lead')
+    add_opportunity = _writer('add_opportunity')
+    add_quote = _writer('add_quote')
+    add_order = _writer('add_order')
+    update_lead = _writer('update_lead')
+    update_opportunity_stage = _writer('update_opportunity_stage')
+    update_opportunity_stages = _writer('update_opportunity_stages')
+    update_quote_status = _writer('update_quote_status')
+    update_quote_statuses = _writer('update_quote_statuses')
+    expire_quotes = _writer('expire_quotes')
+    delete_record = _writer('delete_record')
+
+    # Reads, spread over the reader threads
+    get_all_leads = _reader('get_all_leads')
+    get_all_opportunities = _reader('get_all_opportunities')
+    get_all_quotes = _reader('get_all_quotes')
+    get_all_orders = _reader('get_all_orders')
+    get_record = _reader('get_record')
+    record_columns = _reader('record_columns')
+
+    # Analytics reports, cached per reader thread until the data changes
+    get_conversion_rates = _reader('get_conversion_rates', Analytics)
+    get_win_rate = _reader('get_win_rate', Analytics)
+    get_pipeline_value = _reader('get_pipeline_value', Analytics)
+    get_performance_by_industry = _reader('get_performance_by_industry', Analytics)
+    get_performance_by_location = _reader('get_performance_by_location', Analytics)
+    get_time_in_stage = _reader('get_time_in_stage', Analytics)
+    get_stage_velocity = _reader('get_stage_velocity', Analytics)
+    get_top_opportunities = _reader('get_top_opportunities', Analytics)
+    get_top_accounts = _reader('get_top_accounts', Analytics)
+
+    async def iter_leads(self, page_size=500, limit=None, **filters):
+        """
+        Async iterator over leads, taking the filters and sort options of
+        Database.iter_leads; rows are fetched a page at a time off the loop
+        """
+        after_id = filters.pop('after_id', None)
+        async for row in self._pages(lambda db, after, size: list(db.iter_leads(after_id=after, limit=size,
+                                                                                  **filters)),
+                                     after_id, page_size, limit):
+            yield row
+
+    async def iter_records(self, table, page_size=500, limit=None, after_id=None):
+        """Async iterator over the rows of a record type, in ID order"""
+        async for row in self._pages(lambda db, after, size: list(db.iter_records(table, after, size)),
+                                     after_id, page_size, limit):
+            yield row
+
+    async def _pages(self, fetch, after_id, page_size, limit):
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            rows = await self.pool.read(lambda db, _: fetch(db, after_id, size))
+            for row in rows:
+                yield row
+            if len(rows) < size:
+                break
+            after_id = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
@@ -0,0 +1,168 @@
+"""
+Online backups for Sales Pipeline Manager
+Copies the live database with SQLite's online backup API, a few megabytes
+per step, from a single read snapshot. The file is switched to WAL first
+(as for read replicas), so the copy never holds up writers: ingestion
+keeps committing while a multi-GB backup runs, and the backup never has
+to start over because of it.
+
+Backups are named after the database and the time they were taken, e.g.
+backups/sales_pipeline-20250114-093000.db.gz, optionally gzip-compressed,
+and older ones beyond a retention count are deleted.
+
+    path = create_backup("sales_pipeline.db", "backups", compress=True, keep=7)
+    restore_backup(path, "sales_pipeline.db")
+"""
+import datetime
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+
+from salespipe import metrics
+from salespipe.database import Database, forget_schema
+
+# Pages copied per backup step: 4 MB at SQLite's default 4 KiB page size
+BACKUP_PAGES = 1024
+
+# Seconds between backup steps, leaving the disk to other work
+STEP_SLEEP = 0.005
+
+# Timestamp in backup file names
+STAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+# Bytes read and written at a time when compressing or decompressing
+COPY_CHUNK = 1024 * 1024
+
+
+def backup_prefix(db_path):
+    """Start of the backup file names of a database: sales_pipeline.db -> sales_pipeline-"""
+    return os.path.splitext(os.path.basename(db_path))[0] + "-"
+
+
+def list_backups(db_path, directory):
+    """Backups of a database in a directory, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    pattern = re.compile(re.escape(backup_prefix(db_path)) + r"(\d{8}-\d{6})(?:-(\d+))?\.db(?:\.gz)?$")
+    found = []
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            # Ordered by time taken, then by the counter of backups taken within the same second
+            found.append(((match.group(1), int(match.group(2) or 1)), name))
+    return [os.path.join(directory, name) for _, name in sorted(found, reverse=True)]
+
+
+def prune_backups(db_path, directory, keep):
+    """Delete all but the `keep` newest backups of a database; returns the paths deleted"""
+    expired = list_backups(db_path, directory)[keep:]
+    for path in expired:
+        os.remove(path)
+    return expired
+
+
+def _compress(source, target):
+    with open(source, 'rb') as src, gzip.open(target, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK)
+
+
+@metrics.instrumented
+def create_backup(db_path, directory, compress=False, keep=None, pages=BACKUP_PAGES, sleep=STEP_SLEEP,
+                  progress=None):
+    """
+    Back up a database into a new timestamped file in `directory` and
+    return its path. progress(remaining, total) gets the pages left after
+    each step. With keep, only that many newest backups are kept.
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database {db_path} not found")
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.now().strftime(STAMP_FORMAT)
+    name = os.path.join(directory, backup_prefix(db_path) + stamp)
+    taken = 1
+    while any(os.path.exists(f"{name}{suffix}") for suffix in ('.db', '.db.gz')):
+        taken += 1  # Several backups within one second
+        name = os.path.join(directory, f"{backup_prefix(db_path)}{stamp}-{taken}")
+    path = name + ('.db.gz' if compress else '.db')
+
+    # Under WAL the snapshot read never holds up writers
+    Database(db_path).enable_wal()
+    partial = f"{name}.db.partial"
+
+    def steps(status, remaining, total):
+        if progress:
+            progress(remaining, total)
+
+    try:
+        Database(db_path, read_only=True).backup_to(partial, pages, steps, sleep)
+        # The copy inherits WAL mode; a plain journal keeps it a single self-contained file
+        copy = sqlite3.connect(partial)
+        copy.execute("PRAGMA journal_mode=DELETE").fetchone()
+        copy.close()
+        if compress:
+            _compress(partial, path)
+            os.remove(partial)
+        else:
+            os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    if keep is not None:
+        prune_backups(db_path, directory, keep)
+    return path
+
+
+@metrics.instrumented
+def restore_backup(backup_path, db_path):
+    """
+    Replace a database with a backup, compressed or not. The backup is
+    unpacked next to the database and checked before being renamed over it,
+    so a bad backup leaves the database untouched. The replaced database is
+    kept as <db_path>.pre-restore; returns that path, or None if there was
+    none. A backup from an older schema version is migrated right away.
+    Close every connection to the database first, including those of
+    this process (sessions, other threads): they would keep reading the
+    replaced file.
+    """
+    if not os.path.exists(backup_path):
+        raise FileNotFoundError(f"Backup {backup_path} not found")
+    partial = f"{db_path}.restoring"
+    try:
+        if backup_path.endswith('.gz'):
+            with gzip.open(backup_path, 'rb') as src, open(partial, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+        else:
+            shutil.copyfile(backup_path, partial)
+        check = sqlite3.connect(partial)
+        try:
+            result = check.execute("PRAGMA quick_check").fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            result = str(e)
+        finally:
+            check.close()
+        if result != 'ok':
+            raise ValueError(f"Backup {backup_path} is damaged: {result}")
+
+        previous = None
+        if os.path.exists(db_path):
+            # Fold the write-ahead log into the file, so the kept copy is complete on its own
+            live = sqlite3.connect(db_path)
+            live.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            live.close()
+            previous = f"{db_path}.pre-restore"
+            os.replace(db_path, previous)
+        for leftover in (f"{db_path}-wal", f"{db_path}-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        os.replace(partial, db_path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    # This process may have seen the replaced file at the current version
+    forget_schema(db_path)
+    Database(db_path).create_tables()
+    return previous
@@ -0,0 +1,127 @@
+"""
+Batch mode for Sales Pipeline Manager
+Applies a whole file of commands as one transaction: either every line is
+stored or, if any line fails, none of them are
+"""
+import contextlib
+import io
+import json
+import shlex
+import time
+
+from salespipe.cli import CommandError
+
+# Commands that only write data; reports and interactive commands are refused
+BATCH_COMMANDS = ('add-lead', 'add-opportunity', 'add-quote', 'add-order',
+                  'set-stage', 'set-quote-status', 'import')
+
+
+class BatchError(Exception):
+    """A batch line could not be parsed or applied; nothing was committed"""
+
+    def __init__(self, line_no, message):
+        super().__init__(f"line {line_no}: {message}")
+        self.line_no = line_no
+
+
+def json_to_argv(record):
+    """
+    Turn a JSON Lines record into CLI arguments:
+    {"command": "add-lead", "name": "ACME", "company_size": "large"}
+    -> ['add-lead', '--name', 'ACME', '--company-size', 'large']
+    """
+    record = dict(record)
+    argv = [record.pop('command')]
+    for key, value in record.items():
+        if value is None or value is False:
+            continue
+        flag = '--' + key.replace('_', '-')
+        if value is True:
+            argv.append(flag)
+        elif isinstance(value, list):
+            argv.append(flag)
+            argv.extend(str(item) for item in value)
+        else:
+            argv.extend([flag, str(value)])
+    return argv
+
+
+def line_to_argv(line):
+    """Split one batch line (CLI syntax or a JSON object) into CLI arguments"""
+    if line.startswith('{'):
+        return json_to_argv(json.loads(line))
+    argv = shlex.split(line)
+    # Accept lines copied from a terminal: "python main.py add-lead ..."
+    if argv and argv[0] in ('python', 'python3'):
+        argv = argv[1:]
+    if argv and argv[0].endswith('main.py'):
+        argv = argv[1:]
+    return argv
+
+
+class BatchRunner:
+    """Parses a command file up front, then runs it inside one transaction"""
+
+    def __init__(self, cli, parser):
+        self.cli = cli
+        self.parser = parser
+
+    def parse(self, lines):
+        """Parse every line before touching the database: [(line_no, args)]"""
+        commands = []
+        for line_no, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                argv = line_to_argv(line)
+            except (ValueError, KeyError) as e:
+                raise BatchError(line_no, f"cannot parse line ({e!r})")
+            if not argv or argv[0] not in BATCH_COMMANDS:
+                raise BatchError(line_no, f"command not allowed in a batch: {' '.join(argv[:1])}")
+            try:
+                with contextlib.redirect_stderr(io.StringIO()) as err:
+                    args = self.parser.parse_args(argv)
+            except SystemExit:
+                message = err.getvalue().strip().splitlines()
+                raise BatchError(line_no, message[-1] if message else "invalid arguments")
+            commands.append((line_no, args))
+        return commands
+
+    def run(self, lines, verbose=False):
+        """
+        Apply all commands in one transaction and return a summary
+        {'commands': {name: count}, 'total', 'seconds', 'rate'}.
+        Raises BatchError (after rolling back) if any command fails.
+        """
+        commands = self.parse(lines)
+        counts = {}
+        start = time.perf_counter()
+
+        # Names resolved once are reused for the rest of the batch
+        self.cli.name_cache = {}
+        try:
+            with self.cli.db.transaction():
+                for line_no, args in commands:
+                    try:
+                        if verbose:
+                            self.cli.commands[args.command](args)
+                        else:
+                            with contextlib.redirect_stdout(io.StringIO()):
+                                self.cli.commands[args.command](args)
+                    except CommandError as e:
+                        raise BatchError(line_no, str(e))
+                    except Exception as e:
+                        raise BatchError(line_no, f"{type(e).__name__}: {e}")
+                    counts[args.command] = counts.get(args.command, 0) + 1
+        finally:
+            self.cli.name_cache = None
+
+        seconds = time.perf_counter() - start
+        total = sum(counts.values())
+        return {
+            'commands': counts,
+            'total': total,
+            'seconds': seconds,
+            'rate': total / seconds if seconds else 0.0,
+        }
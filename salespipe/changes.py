@@ -0,0 +1,71 @@
+"""
+Change data capture for Sales Pipeline Manager
+Triggers log every insert, update and delete of a lead, opportunity, quote
+or order in the append-only `changes` table, numbered by an ever-growing
+`seq`. Downstream systems (ERP, BI) read the log from the last seq they
+processed instead of re-reading whole tables, then fetch the records they
+care about. Records only say what changed; deleted records are gone.
+
+    consumer = Consumer(Database("sales_pipeline.db"), "erp")
+    for seq, table, record_id, operation, changed_at in consumer.tail():
+        ...
+        consumer.commit(seq)
+
+Named consumers remember their position in the database, so compaction
+(Database.compact_changes) drops only what every consumer has processed.
+Score refreshes aren't logged; archiving logs the moved records as deletes.
+Bulk loads (generated data, imports with log_changes=False) skip the log
+through Database.changes_paused.
+"""
+import time
+
+# Column names of a change record
+CHANGE_COLUMNS = ('seq', 'table_name', 'record_id', 'operation', 'changed_at')
+
+# Changes read per query while tailing
+TAIL_BATCH = 1000
+
+# Seconds between looks at the log once it is caught up
+POLL_INTERVAL = 1.0
+
+
+def tail(db, since=0, tables=None, poll_interval=POLL_INTERVAL, batch_size=TAIL_BATCH, follow=True):
+    """
+    Yield change records logged after `since`, oldest first. With follow,
+    keep waiting for new ones (polling every poll_interval seconds once
+    caught up) until the caller stops iterating.
+    """
+    while True:
+        batch = list(db.iter_changes(since, tables, batch_size))
+        yield from batch
+        if batch:
+            since = batch[-1][0]
+        if len(batch) < batch_size:
+            if not follow:
+                return
+            time.sleep(poll_interval)
+
+
+class Consumer:
+    """A named reader of the change log whose position is kept in the database"""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    @property
+    def position(self):
+        """Seq of the last change this consumer committed"""
+        return self.db.consumer_position(self.name)
+
+    def read(self, limit=TAIL_BATCH, tables=None):
+        """The next changes after the committed position, without committing them"""
+        return list(self.db.iter_changes(self.position, tables, limit))
+
+    def tail(self, tables=None, poll_interval=POLL_INTERVAL, follow=True):
+        """tail() from the committed position"""
+        return tail(self.db, self.position, tables, poll_interval, follow=follow)
+
+    def commit(self, seq):
+        """Mark every change up to seq as processed"""
+        self.db.set_consumer_position(self.name, seq)
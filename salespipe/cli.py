@@ -2,19 +2,164 @@
 Command Line Interface for Sales Pipeline Manager
 """
 import argparse
-from salespipe.database import Database
-from salespipe.models import Lead, Opportunity, Quote, Order
-from salespipe.csv_handler import CSVHandler
-from salespipe.analytics import Analytics
+import sys
+from salespipe.database import Database, LEAD_SORTS
+from salespipe.models import (Lead, Opportunity, Quote, Order, LEAD_STATUSES, LOCATIONS, INDUSTRIES, COMPANY_SIZES,
+                              OPPORTUNITY_STAGES, QUOTE_STATUSES, ORDER_STATUSES)
+
+
+# Column names of a lead row, as returned by Database.get_all_leads/iter_leads
+LEAD_COLUMNS = ('lead_id', 'name', 'email', 'phone', 'source', 'status',
+                'location', 'industry', 'company_size', 'created_at', 'score')
+
+# list-leads hands output to stdout in chunks of this many rows (or bytes, for CSV)
+LIST_CHUNK_ROWS = 500
+LIST_CHUNK_BYTES = 64 * 1024
+
+
+class CommandError(Exception):
+    """A command could not be carried out (e.g. no record matches the given name)"""
 
 
 class CLI:
     """Command Line Interface handler"""
 
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db_path="sales_pipeline.db"):
+        self.db = Database(db_path)
         self.db.create_tables()
-        self.analytics = Analytics()
+        self._analytics = None
+        self.name_cache = None  # Set to a dict to remember name -> record lookups (batch mode)
+        self.commands = {
+            'add-lead': self.add_lead,
+            'list-leads': self.list_leads,
+            'export': self.export_leads,
+            'import': self.import_leads,
+            'analytics': self.show_analytics,
+            'top': self.show_top,
+            'company': self.show_company,
+            'add-opportunity': self.add_opportunity_cmd,
+            'add-quote': self.add_quote_cmd,
+            'add-order': self.add_order_cmd,
+            'expire-quotes': self.expire_quotes_cmd,
+            'archive': self.archive_cmd,
+            'generate': self.generate_cmd,
+            'dedup': self.dedup,
+            'merge-leads': self.merge_leads_cmd,
+            'score-leads': self.score_leads_cmd,
+            'changes': self.changes_cmd,
+            'compact-changes': self.compact_changes_cmd,
+            'backup': self.backup_cmd,
+            'restore': self.restore_cmd,
+            'set-stage': self.set_stage_cmd,
+            'set-quote-status': self.set_quote_status_cmd,
+            'shell': self.shell,
+            'batch': self.batch,
+            'serve': self.serve,
+        }
+
+    @property
+    def analytics(self):
+        """Analytics engine, imported and created on first use"""
+        if self._analytics is None:
+            from salespipe.analytics import Analytics
+            self._analytics = Analytics(db=self.db)
+        return self._analytics
+
+    def dispatch(self, args):
+        """Run the handler for a parsed command; returns False if the command is unknown"""
+        handler = self.commands.get(args.command)
+        if handler is None:
+            return False
+        try:
+            handler(args)
+        except CommandError as e:
+            print(f"Error: {e}")
+        return True
+
+    def _find(self, kind, term, query, error):
+        """Run a partial-match lookup, raising CommandError when nothing matches"""
+        key = (kind, term)
+        if self.name_cache is not None and key in self.name_cache:
+            return self.name_cache[key]
+
+        self.db.connect()
+        self.db.cursor.execute(query, (f"%{term}%",))
+        row = self.db.cursor.fetchone()
+        self.db.close()
+
+        if not row:
+            raise CommandError(error)
+        if self.name_cache is not None:
+            self.name_cache[key] = row
+        return row
+
+    def _find_lead(self, name):
+        """First lead whose name contains `name`: (lead_id, name)"""
+        return self._find('lead', name,
+                          "SELECT lead_id, name FROM leads WHERE name LIKE ? ORDER BY lead_id LIMIT 1",
+                          f"No lead found matching '{name}'")
+
+    def _find_opportunity(self, title):
+        """First opportunity whose title contains `title`: (opp_id, title, company name)"""
+        return self._find('opportunity', title,
+                          """
+                          SELECT o.opp_id, o.title, l.name
+                          FROM opportunities o
+                                   JOIN leads l ON o.lead_id = l.lead_id
+                          WHERE o.title LIKE ?
+                          ORDER BY o.opp_id
+                          LIMIT 1
+                          """,
+                          f"No opportunity found matching '{title}'")
+
+    def _find_quote(self, number):
+        """First quote whose number contains `number`: (quote_id, quote_number, opportunity title, company name)"""
+        return self._find('quote', number,
+                          """
+                          SELECT q.quote_id, q.quote_number, o.title, l.name
+                          FROM quotes q
+                                   JOIN opportunities o ON q.opp_id = o.opp_id
+                                   JOIN leads l ON o.lead_id = l.lead_id
+                          WHERE q.quote_number LIKE ?
+                          ORDER BY q.quote_id
+                          LIMIT 1
+                          """,
+                          f"No quote found matching '{number}'")
+
+    def shell(self, args):
+        """Start an interactive session over one open database connection"""
+        from salespipe.shell import Shell
+        Shell(self, create_parser()).run()
+
+    def batch(self, args):
+        """Apply a file of commands (or stdin) in one all-or-nothing transaction"""
+        from salespipe.batch import BatchRunner, BatchError
+        runner = BatchRunner(self, create_parser())
+        try:
+            if args.file == '-':
+                summary = runner.run(sys.stdin, verbose=args.verbose)
+            else:
+                with open(args.file, encoding='utf-8') as f:
+                    summary = runner.run(f, verbose=args.verbose)
+        except OSError as e:
+            raise CommandError(f"Cannot read batch file: {e}")
+        except BatchError as e:
+            raise CommandError(f"{e} - batch rolled back, nothing was saved")
+
+        print(f"\n✓ Batch committed: {summary['total']} commands "
+              f"in {summary['seconds']:.2f}s ({summary['rate']:,.0f}/s)")
+        for command, count in sorted(summary['commands'].items()):
+            print(f"  {command:<20} {count}")
+
+    def serve(self, args):
+        """Run the HTTP/JSON API server until Ctrl+C"""
+        import asyncio
+        from salespipe.server import serve
+        log = None if args.quiet else print
+        try:
+            asyncio.run(serve(self.db.db_path, args.host, args.port, args.readers, log))
+        except KeyboardInterrupt:
+            print("\nServer stopped.")
 
     def add_lead(self, args):
         """Add a new lead"""
@@ -32,50 +177,162 @@ class CLI:
         lead_id = self.db.add_lead(lead)
         print(f"✓ Lead added successfully! ID: {lead_id}")
 
+    def _check_shards(self):
+        """Make sure the per-market files of a sharded database exist, so reading them doesn't create them"""
+        import os
+        from salespipe.sharding import shard_path
+        missing = [shard_path(self.db.db_path, market) for market in LOCATIONS
+                   if not os.path.exists(shard_path(self.db.db_path, market))]
+        if missing:
+            raise CommandError(f"No sharded database: {', '.join(missing)} not found "
+                               f"(create the files with generate --sharded)")
+
     def list_leads(self, args):
-        """List all leads"""
-        leads = self.db.get_all_leads()
-        if not leads:
+        """List leads page by page, streamed to stdout as a table, CSV or JSON Lines"""
+        db = self.db
+        if args.sharded:
+            from salespipe.sharding import ShardedDatabase
+            self._check_shards()
+            db = ShardedDatabase(self.db.db_path)
+            db.create_tables()
+        try:
+            leads = db.iter_leads(status=args.status, industry=args.industry, location=args.location,
+                                  source=args.source, sort=args.sort, descending=args.desc,
+                                  after_id=args.after_id, limit=args.limit)
+            if args.format == 'csv':
+                self._write_leads_csv(leads)
+            elif args.format == 'jsonl':
+                self._write_leads_jsonl(leads)
+            else:
+                self._write_leads_table(leads, args.limit)
+        finally:
+            if args.sharded:
+                db.close()
+
+    @staticmethod
+    def _write_buffered(lines):
+        """Write text lines to stdout in large chunks instead of one write per row"""
+        out = sys.stdout
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= LIST_CHUNK_ROWS:
+                out.write("".join(chunk))
+                chunk.clear()
+        out.write("".join(chunk))
+        out.flush()
+
+    def _write_leads_table(self, leads, limit):
+        """Aligned table with a footer pointing at the next page"""
+        shown = 0
+        last_id = None
+
+        def lines():
+            nonlocal shown, last_id
+            for lead in leads:
+                if not shown:
+                    yield (f"\n{'ID':<5} {'Name':<20} {'Email':<30} {'Status':<15} "
+                           f"{'Industry':<20} {'Location':<15} {'Score':>6}\n")
+                    yield "-" * 117 + "\n"
+                shown += 1
+                last_id = lead[0]
+                yield (f"{lead[0]:<5} {lead[1]:<20} {lead[2]:<30} {lead[5]:<15} "
+                       f"{lead[7] or 'N/A':<20} {lead[6] or 'N/A':<15} {lead[10]:>6.1f}\n")
+
+        self._write_buffered(lines())
+        if not shown:
             print("No leads found.")
             return
-
-        print(f"\n{'ID':<5} {'Name':<20} {'Email':<30} {'Status':<15} {'Industry':<20} {'Location':<15}")
-        print("-" * 110)
-        for lead in leads:
-            print(
-                f"{lead[0]:<5} {lead[1]:<20} {lead[2]:<30} {lead[5]:<15} {lead[7] or 'N/A':<20} {lead[6] or 'N/A':<15}")
-        print(f"\nTotal: {len(leads)} leads")
+        print(f"\nTotal: {shown} leads")
+        if limit is not None and shown == limit:
+            print(f"Next page: --after-id {last_id}")
+
+    def _write_leads_csv(self, leads):
+        """CSV with the export command's columns, plus the lead score"""
+        import csv
+        import io
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def lines():
+            writer.writerow(LEAD_COLUMNS)
+            for lead in leads:
+                writer.writerow(lead)
+                if buffer.tell() >= LIST_CHUNK_BYTES:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
+        self._write_buffered(lines())
+
+    def _write_leads_jsonl(self, leads):
+        """One JSON object per lead"""
+        import json
+        self._write_buffered(json.dumps(dict(zip(LEAD_COLUMNS, lead)), ensure_ascii=False) + "\n"
+                             for lead in leads)
 
     def export_leads(self, args):
         """Export leads to CSV"""
+        from salespipe.csv_handler import CSVHandler
         leads = self.db.get_all_leads()
         CSVHandler.export_leads_to_csv(leads, args.output)
 
     def import_leads(self, args):
         """Import leads from CSV"""
-        leads = CSVHandler.import_leads_from_csv(args.input)
-        for lead in leads:
-            self.db.add_lead(lead)
-        print(f"✓ Imported {len(leads)} leads to database")
+        from salespipe.csv_handler import CSVHandler
+        imported, duplicates = CSVHandler.import_leads_to_database(
+            self.db, args.input, skip_duplicates=not args.allow_duplicates, batch_size=args.batch_size,
+            log_changes=not args.no_change_log)
+        if args.duplicates_report and duplicates:
+            CSVHandler.write_duplicates_report(duplicates, args.duplicates_report)
+            print(f"Duplicates listed in {args.duplicates_report}")
+        print(f"✓ Imported {imported} leads to database")
 
     def show_analytics(self, args):
         """Show analytics based on type"""
-        if args.type == 'conversion':
-            self._show_conversion_rates()
-        elif args.type == 'winrate':
-            self._show_win_rate()
-        elif args.type == 'pipeline':
-            self._show_pipeline_value()
-        elif args.type == 'industry':
-            self._show_industry_performance()
-        elif args.type == 'location':
-            self._show_location_performance()
-        else:
-            print("Unknown analytics type. Use: conversion, winrate, pipeline, industry, or location")
+        # Flagged reports get an engine of their own, closed afterwards; the
+        # shared one (warm cache, shell session) stays as it was for later commands
+        analytics = self.analytics
+        if args.sharded:
+            if args.replica or args.include_archived:
+                raise CommandError("--sharded can't be combined with --replica or --include-archived")
+            from salespipe.sharding import ShardedAnalytics
+            self._check_shards()
+            analytics = ShardedAnalytics(self.db.db_path, read_only=args.read_only)
+        elif args.read_only or args.replica or args.include_archived:
+            from salespipe.analytics import Analytics
+            archive = None
+            if args.include_archived:
+                from salespipe.archive import default_archive_path
+                archive = args.archive_file or default_archive_path(self.db.db_path)
+            analytics = Analytics(self.db.db_path, read_only=args.read_only, replica=args.replica,
+                                  replica_max_age=args.replica_max_age, archive=archive)
+        try:
+            if args.type == 'conversion':
+                self._show_conversion_rates(analytics)
+            elif args.type == 'winrate':
+                self._show_win_rate(analytics)
+            elif args.type == 'pipeline':
+                self._show_pipeline_value(analytics, args.exclude_expired)
+            elif args.type == 'industry':
+                self._show_industry_performance(analytics)
+            elif args.type == 'location':
+                self._show_location_performance(analytics)
+            elif args.type == 'stages':
+                self._show_time_in_stage(analytics)
+            elif args.type == 'velocity':
+                self._show_stage_velocity(analytics)
+            else:
+                print("Unknown analytics type. Use: conversion, winrate, pipeline, industry, location, stages, "
+                      "or velocity")
+        finally:
+            if analytics is not self._analytics:
+                analytics.close()
 
-    def _show_conversion_rates(self):
+    def _show_conversion_rates(self, analytics):
         """Display conversion rates"""
-        rates = self.analytics.get_conversion_rates()
+        rates = analytics.get_conversion_rates()
 
         print("\n=== CONVERSION RATES ===")
         print(f"\nFunnel Overview:")
@@ -92,18 +349,18 @@ class CLI:
         print(f"  Order Win Rate:       {rates['order_win_rate']}%")
         print(f"  Overall (Lead → Won): {rates['overall_conversion']}%")
 
-    def _show_win_rate(self):
+    def _show_win_rate(self, analytics):
         """Display win rate"""
-        data = self.analytics.get_win_rate()
+        data = analytics.get_win_rate()
 
         print("\n=== WIN RATE ===")
         print(f"  Won Orders:   {data['won_orders']}")
         print(f"  Total Orders: {data['total_orders']}")
         print(f"  Win Rate:     {data['win_rate']}%")
 
-    def _show_pipeline_value(self):
+    def _show_pipeline_value(self, analytics, exclude_expired=False):
         """Display pipeline value"""
-        data = self.analytics.get_pipeline_value()
+        data = analytics.get_pipeline_value(exclude_expired)
 
         print("\n=== PIPELINE VALUE ===")
         print(f"  Opportunities Value: €{data['opportunities_value']:,.2f}")
@@ -112,9 +369,9 @@ class CLI:
         print(f"\n  Won Value:           €{data['won_value']:,.2f}")
         print(f"  Total Closed:        €{data['total_closed_value']:,.2f}")
 
-    def _show_industry_performance(self):
+    def _show_industry_performance(self, analytics):
         """Display performance by industry"""
-        data = self.analytics.get_performance_by_industry()
+        data = analytics.get_performance_by_industry()
 
         if not data:
             print("\nNo industry data available.")
@@ -128,9 +385,9 @@ class CLI:
             print(f"{industry:<25} {metrics['leads']:<10} {metrics['won_orders']:<10} "
                   f"{metrics['win_rate']:<11}% €{metrics['avg_deal_value']:>12,.2f}")
 
-    def _show_location_performance(self):
+    def _show_location_performance(self, analytics):
         """Display performance by location"""
-        data = self.analytics.get_performance_by_location()
+        data = analytics.get_performance_by_location()
 
         if not data:
             print("\nNo location data available.")
@@ -144,6 +401,67 @@ class CLI:
             print(f"{location:<20} {metrics['leads']:<10} {metrics['won_orders']:<10} "
                   f"{metrics['win_rate']:<11}% €{metrics['pipeline_value']:>12,.2f}")
 
+    def _show_time_in_stage(self, analytics):
+        """Display time spent in each stage"""
+        data = analytics.get_time_in_stage()
+
+        if not data:
+            print("\nNo stage history available.")
+            return
+
+        print("\n=== TIME IN STAGE ===")
+        print(f"\n{'Stage':<25} {'Exits':<10} {'Avg Days':<12} {'Current':<10}")
+        print("-" * 60)
+
+        for stage, metrics in data.items():
+            print(f"{stage:<25} {metrics['exits']:<10} {metrics['avg_days']:<12} {metrics['current']:<10}")
+
+    def _show_stage_velocity(self, analytics):
+        """Display stage-to-stage velocity"""
+        data = analytics.get_stage_velocity()
+
+        if not data:
+            print("\nNo stage transitions recorded yet.")
+            return
+
+        print("\n=== STAGE VELOCITY ===")
+        print(f"\n{'Transition':<50} {'Count':<10} {'Avg Days':<10}")
+        print("-" * 70)
+
+        for (from_stage, to_stage), metrics in data.items():
+            transition = f"{from_stage} → {to_stage}"
+            print(f"{transition:<50} {metrics['transitions']:<10} {metrics['avg_days']:<10}")
+
+    def show_top(self, args):
+        """Show the top opportunities or accounts"""
+        if args.type == 'accounts':
+            accounts = self.analytics.get_top_accounts(args.limit)
+            if not accounts:
+                print("\nNo won orders yet.")
+                return
+
+            print(f"\n=== TOP {args.limit} ACCOUNTS BY WON VALUE ===")
+            print(f"\n{'#':<4} {'Company':<30} {'Won Orders':<12} {'Won Value':>16}")
+            print("-" * 65)
+            for rank, account in enumerate(accounts, 1):
+                print(f"{rank:<4} {account['company']:<30} {account['won_orders']:<12} "
+                      f"€{account['won_value']:>15,.2f}")
+            return
+
+        opportunities = self.analytics.get_top_opportunities(args.limit, args.by, args.include_closed)
+        if not opportunities:
+            print("\nNo opportunities found.")
+            return
+
+        label = 'WEIGHTED VALUE' if args.by == 'weighted' else 'ESTIMATED VALUE'
+        print(f"\n=== TOP {args.limit} OPPORTUNITIES BY {label} ===")
+        print(f"\n{'#':<4} {'Opportunity':<30} {'Company':<25} {'Stage':<22} {'Value':>15} {'Prob':>5} "
+              f"{'Weighted':>15}")
+        print("-" * 124)
+        for rank, opp in enumerate(opportunities, 1):
+            print(f"{rank:<4} {opp['title']:<30} {opp['company']:<25} {opp['stage']:<22} "
+                  f"€{opp['estimated_value']:>14,.2f} {opp['probability']:>4}% €{opp['weighted_value']:>14,.2f}")
+
     def show_company(self, args):
         """Show all records for a company and provide interactive options"""
         company_name = args.name
@@ -151,7 +469,7 @@ class CLI:
         # Search for leads with this company name
         self.db.connect()
         self.db.cursor.execute(
-            "SELECT * FROM leads WHERE name LIKE ?",
+            "SELECT * FROM leads_view WHERE name LIKE ?",
             (f"%{company_name}%",)
         )
         leads = self.db.cursor.fetchall()
@@ -183,7 +501,7 @@ class CLI:
             # Get opportunities for this lead
             self.db.connect()
             self.db.cursor.execute(
-                "SELECT * FROM opportunities WHERE lead_id=?",
+                "SELECT * FROM opportunities_view WHERE lead_id=?",
                 (lead_id,)
             )
             opportunities = self.db.cursor.fetchall()
@@ -197,7 +515,7 @@ class CLI:
                     # Get quotes for this opportunity
                     self.db.connect()
                     self.db.cursor.execute(
-                        "SELECT * FROM quotes WHERE opp_id=?",
+                        "SELECT * FROM quotes_view WHERE opp_id=?",
                         (opp[0],)
                     )
                     quotes = self.db.cursor.fetchall()
@@ -211,7 +529,7 @@ class CLI:
                             # Get orders for this quote
                             self.db.connect()
                             self.db.cursor.execute(
-                                "SELECT * FROM orders WHERE quote_id=?",
+                                "SELECT * FROM orders_view WHERE quote_id=?",
                                 (quote[0],)
                             )
                             orders = self.db.cursor.fetchall()
@@ -230,19 +548,7 @@ class CLI:
     def add_opportunity_cmd(self, args):
         """Add an opportunity for an existing lead"""
         # Find lead by name
-        self.db.connect()
-        self.db.cursor.execute(
-            "SELECT lead_id, name FROM leads WHERE name LIKE ?",
-            (f"%{args.lead_name}%",)
-        )
-        lead = self.db.cursor.fetchone()
-        self.db.close()
-
-        if not lead:
-            print(f"Error: No lead found matching '{args.lead_name}'")
-            return
-
-        lead_id, lead_name = lead
+        lead_id, lead_name = self._find_lead(args.lead_name)
 
         # Create opportunity
         opp = Opportunity(
@@ -265,25 +571,8 @@ class CLI:
 
     def add_quote_cmd(self, args):
         """Add a quote for an existing opportunity"""
-        # Find opportunity by title
-        self.db.connect()
-        self.db.cursor.execute(
-            "SELECT opp_id, title, lead_id FROM opportunities WHERE title LIKE ?",
-            (f"%{args.opportunity_title}%",)
-        )
-        opp = self.db.cursor.fetchone()
-
-        if not opp:
-            self.db.close()
-            print(f"Error: No opportunity found matching '{args.opportunity_title}'")
-            return
-
-        opp_id, opp_title, lead_id = opp
-
-        # Get company name
-        self.db.cursor.execute("SELECT name FROM leads WHERE lead_id=?", (lead_id,))
-        company_name = self.db.cursor.fetchone()[0]
-        self.db.close()
+        # Find opportunity by title, with its company name
+        opp_id, opp_title, company_name = self._find_opportunity(args.opportunity_title)
 
         # Create quote
         quote = Quote(
@@ -307,29 +596,8 @@ class CLI:
 
     def add_order_cmd(self, args):
         """Add an order (close a quote)"""
-        # Find quote by number
-        self.db.connect()
-        self.db.cursor.execute(
-            "SELECT quote_id, quote_number, opp_id, quoted_amount FROM quotes WHERE quote_number LIKE ?",
-            (f"%{args.quote_number}%",)
-        )
-        quote = self.db.cursor.fetchone()
-
-        if not quote:
-            self.db.close()
-            print(f"Error: No quote found matching '{args.quote_number}'")
-            return
-
-        quote_id, quote_number, opp_id, quoted_amount = quote
-
-        # Get opportunity and company info
-        self.db.cursor.execute(
-            "SELECT o.title, l.name FROM opportunities o JOIN leads l ON o.lead_id = l.lead_id WHERE o.opp_id=?",
-            (opp_id,)
-        )
-        opp_info = self.db.cursor.fetchone()
-        opp_title, company_name = opp_info
-        self.db.close()
+        # Find quote by number, with its opportunity and company
+        quote_id, quote_number, opp_title, company_name = self._find_quote(args.quote_number)
 
         # Create order
         order = Order(
@@ -352,6 +620,226 @@ class CLI:
         print(f"  Status: {status_symbol}")
         print(f"  Final Amount: EUR {args.final_amount:,.2f}")
 
+    def set_stage_cmd(self, args):
+        """Move one opportunity (by title) or many (by id) to a new stage"""
+        if args.ids:
+            changed = self.db.update_opportunity_stages(args.ids, args.stage)
+            print(f"✓ Moved {changed} of {len(args.ids)} opportunities to {args.stage}")
+            return
+
+        opp_id, opp_title, _ = self._find_opportunity(args.opportunity_title)
+        if self.db.update_opportunity_stage(opp_id, args.stage):
+            print(f"✓ Opportunity '{opp_title}' moved to {args.stage}")
+        else:
+            print(f"Opportunity '{opp_title}' is already in {args.stage}")
+
+    def set_quote_status_cmd(self, args):
+        """Change the status of one quote (by number) or many (by id)"""
+        if args.ids:
+            changed = self.db.update_quote_statuses(args.ids, args.status)
+            print(f"✓ Set {changed} of {len(args.ids)} quotes to {args.status}")
+            return
+
+        quote_id, quote_number, _, _ = self._find_quote(args.quote_number)
+        if self.db.update_quote_status(quote_id, args.status):
+            print(f"✓ Quote {quote_number} set to {args.status}")
+        else:
+            print(f"Quote {quote_number} is already {args.status}")
+
+    def expire_quotes_cmd(self, args):
+        """Expire out-of-date quotes once, or periodically with --every"""
+        from salespipe.sweeper import QuoteExpirySweeper
+
+        sweeper = QuoteExpirySweeper(self.db.db_path)
+        if args.every is None:
+            report = sweeper.run_once(args.as_of)
+            print(f"✓ Expired {report['expired']} quotes")
+            return
+
+        def show(report):
+            print(f"[{report['swept_at']}] expired {report['expired']} quotes "
+                  f"(total {report['total_expired']} over {report['runs']} runs)")
+
+        print(f"Sweeping expired quotes every {args.every:g}s (Ctrl+C to stop)")
+        try:
+            sweeper.run_forever(args.every, on_sweep=show)
+        except KeyboardInterrupt:
+            print(f"\nStopped after {sweeper.runs} runs, {sweeper.total_expired} quotes expired")
+
+    def archive_cmd(self, args):
+        """Move closed deals older than a cutoff into the archive file"""
+        from salespipe.archive import Archiver
+
+        archiver = Archiver(self.db.db_path, args.archive_file)
+        moved = archiver.archive(args.before, args.batch_size)
+        print(f"✓ Archived {moved['opportunities']} opportunities, {moved['quotes']} quotes and "
+              f"{moved['orders']} orders closed before {args.before} into {archiver.archive_path}")
+        if args.vacuum:
+            archiver.vacuum()
+            print(f"✓ Compacted {self.db.db_path}")
+
+    def generate_cmd(self, args):
+        """Add generated leads with their deals, for load testing"""
+        import json
+        import time
+        from salespipe import generator
+
+        overrides = {}
+        if args.config:
+            with open(args.config, encoding='utf-8') as f:
+                overrides.update(json.load(f))
+        for key in ('industries', 'locations', 'stages'):
+            if getattr(args, key):
+                overrides[key] = generator.parse_weights(getattr(args, key))
+        for key in ('opportunity_rate', 'quote_rate', 'acceptance_rate', 'win_rate', 'start_date', 'days'):
+            if getattr(args, key) is not None:
+                overrides[key] = getattr(args, key)
+
+        start = time.perf_counter()
+        if args.sharded:
+            counts = generator.generate_sharded(self.db.db_path, args.leads, args.seed, overrides, args.workers,
+                                                args.chunk_size)
+        else:
+            def progress(done, total):
+                print(f"\r  {done:,}/{total:,} leads", end='', flush=True)
+
+            counts = generator.generate(self.db.db_path, args.leads, args.seed, overrides,
+                                        chunk_size=args.chunk_size, progress=progress)
+            print()
+        print(f"✓ Generated {counts['leads']:,} leads, {counts['opportunities']:,} opportunities, "
+              f"{counts['quotes']:,} quotes and {counts['orders']:,} orders "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    def dedup(self, args):
+        """List probable duplicate leads, and merge each group into its oldest lead with --merge"""
+        from salespipe.dedup import find_duplicates
+
+        groups = find_duplicates(self.db, args.threshold, args.max_block_size)
+        if not groups:
+            print("No probable duplicates found")
+            return
+        for number, group in enumerate(groups[:args.limit], start=1):
+            print(f"\nGroup {number} (score {group.score:.2f}):")
+            for lead_id in group.lead_ids:
+                lead = self.db.get_record('leads', lead_id)
+                print(f"  [{lead[0]}] {lead[1]} <{lead[2]}> {lead[3] or ''} ({lead[4]})")
+        if len(groups) > args.limit:
+            print(f"\n... and {len(groups) - args.limit} more groups")
+
+        if args.merge:
+            moved = 0
+            with self.db.transaction():
+                for group in groups:
+                    moved += self.db.merge_leads(group.lead_ids[0], group.lead_ids[1:])
+            merged = sum(len(group.lead_ids) - 1 for group in groups)
+            print(f"\n✓ Merged {merged} duplicate leads into {len(groups)} leads, moving {moved} opportunities")
+        else:
+            print(f"\n{len(groups)} groups of probable duplicates; run with --merge to merge each into its oldest lead")
+
+    def merge_leads_cmd(self, args):
+        """Merge leads into one, moving their opportunities to it"""
+        try:
+            moved = self.db.merge_leads(args.into, args.ids)
+        except ValueError as e:
+            raise CommandError(str(e))
+        print(f"✓ Merged leads {', '.join(map(str, args.ids))} into lead {args.into}, moving {moved} opportunities")
+
+    def score_leads_cmd(self, args):
+        """Score new and changed leads (every lead with --all) from historical win rates"""
+        import time
+        from salespipe.scoring import score_leads
+
+        db = self.db
+        if args.include_archived:
+            from salespipe.archive import default_archive_path
+            db = Database(self.db.db_path, archive_path=args.archive_file or default_archive_path(self.db.db_path))
+        start = time.perf_counter()
+        scored = score_leads(db, rescore_all=args.all, batch_size=args.batch_size)
+        print(f"✓ Scored {scored:,} leads in {time.perf_counter() - start:.1f}s")
+
+    def changes_cmd(self, args):
+        """Stream the change log as JSON Lines, from --since or a consumer's position"""
+        import json
+        from salespipe.changes import CHANGE_COLUMNS, Consumer, tail
+
+        self.db.create_tables()
+        consumer = Consumer(self.db, args.consumer) if args.consumer else None
+        since = args.since if args.since is not None else (consumer.position if consumer else 0)
+        changes = tail(self.db, since, args.table, args.poll, follow=args.follow)
+        last = None
+        try:
+            for shown, change in enumerate(changes, start=1):
+                sys.stdout.write(json.dumps(dict(zip(CHANGE_COLUMNS, change))) + "\n")
+                last = change[0]
+                if args.follow:
+                    sys.stdout.flush()
+                if shown == args.limit:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sys.stdout.flush()
+            if consumer and last is not None:
+                consumer.commit(last)
+
+    def compact_changes_cmd(self, args):
+        """Delete change records every consumer has processed"""
+        self.db.create_tables()
+        if args.up_to is None and not self.db.change_consumers():
+            raise CommandError("No consumers have registered a position; give --up-to SEQ")
+        deleted = self.db.compact_changes(args.up_to)
+        print(f"✓ Deleted {deleted:,} change records (latest seq {self.db.last_change_seq():,})")
+
+    def backup_cmd(self, args):
+        """Back up the database online into a timestamped file, or list the backups"""
+        import os
+        import time
+        from salespipe import backup
+
+        if args.list:
+            backups = backup.list_backups(self.db.db_path, args.dir)
+            for path in backups:
+                print(f"{path}  {os.path.getsize(path) / 1e6:,.1f} MB")
+            if not backups:
+                print(f"No backups of {self.db.db_path} in {args.dir}")
+            return
+
+        def progress(remaining, total):
+            if sys.stdout.isatty():
+                print(f"\r  {(total - remaining) * 100 // max(total, 1)}% of {total:,} pages", end="", flush=True)
+
+        start = time.perf_counter()
+        try:
+            path = backup.create_backup(self.db.db_path, args.dir, args.compress, args.keep, args.pages,
+                                        progress=progress)
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        if sys.stdout.isatty():
+            print()
+        print(f"✓ Backed up {self.db.db_path} to {path} ({os.path.getsize(path) / 1e6:,.1f} MB) "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    def restore_cmd(self, args):
+        """Replace the database with a backup"""
+        from salespipe import backup
+
+        if self.db.in_session:
+            # The session's connection would keep reading the replaced file
+            raise CommandError("Can't restore from the shell; leave it and run restore on its own")
+        source = args.file
+        if args.latest:
+            backups = backup.list_backups(self.db.db_path, args.dir)
+            if not backups:
+                raise CommandError(f"No backups of {self.db.db_path} in {args.dir}")
+            source = backups[0]
+        try:
+            previous = backup.restore_backup(source, self.db.db_path)
+        except (FileNotFoundError, ValueError) as e:
+            raise CommandError(str(e))
+        print(f"✓ Restored {self.db.db_path} from {source}")
+        if previous:
+            print(f"  The replaced database was kept as {previous}")
+
 
 def create_parser():
     """
@@ -370,6 +858,11 @@ def create_parser():
         epilog="Track your sales funnel: Lead → Opportunity → Quote → Order"
     )
 
+    parser.add_argument('--profile', action='store_true',
+                        help='Time every database query and print a summary to stderr')
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help='Write operational metrics in Prometheus text format to PATH after the command')
+
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
     # Add lead command
@@ -378,13 +871,28 @@ def create_parser():
     add_parser.add_argument('--email', required=True, help='Lead email')
     add_parser.add_argument('--phone', default='', help='Lead phone')
     add_parser.add_argument('--source', default='manual', help='Lead source')
-    add_parser.add_argument('--location', default=None, help='Location (Germany, Italy, France, Benelux)')
-    add_parser.add_argument('--industry', default=None,
+    add_parser.add_argument('--location', default=None, choices=LOCATIONS,
+                            help='Location (Germany, Italy, France, Benelux)')
+    add_parser.add_argument('--industry', default=None, choices=INDUSTRIES,
                             help='Industry (automotive, industrial_components, food_beverage, logistics)')
-    add_parser.add_argument('--company-size', default=None, help='Company size (small, medium, large)')
+    add_parser.add_argument('--company-size', default=None, choices=COMPANY_SIZES,
+                            help='Company size (small, medium, large)')
 
     # List leads command
-    subparsers.add_parser('list-leads', help='List all leads')
+    list_parser = subparsers.add_parser('list-leads', help='List leads (filtered, sorted, one page at a time)')
+    list_parser.add_argument('--status', choices=LEAD_STATUSES, help='Only leads with this status')
+    list_parser.add_argument('--industry', choices=INDUSTRIES, help='Only leads in this industry')
+    list_parser.add_argument('--location', choices=LOCATIONS, help='Only leads in this market')
+    list_parser.add_argument('--source', help='Only leads from this source')
+    list_parser.add_argument('--sort', default='id', choices=list(LEAD_SORTS), help='Sort order (default: id)')
+    list_parser.add_argument('--desc', action='store_true', help='Sort in descending order')
+    list_parser.add_argument('--limit', type=int, help='Show at most this many leads')
+    list_parser.add_argument('--after-id', type=int,
+                             help='Continue after this lead ID (use the ID printed under the previous page)')
+    list_parser.add_argument('--format', default='table', choices=['table', 'csv', 'jsonl'],
+                             help='Output format (default: table)')
+    list_parser.add_argument('--sharded', action='store_true',
+                             help='List the leads of the per-market files written by generate --sharded')
 
     # Export command
     export_parser = subparsers.add_parser('export', help='Export leads to CSV')
@@ -393,12 +901,62 @@ def create_parser():
     # Import command
     import_parser = subparsers.add_parser('import', help='Import leads from CSV')
     import_parser.add_argument('--input', required=True, help='Input CSV file')
+    import_parser.add_argument('--allow-duplicates', action='store_true',
+                               help='Import rows whose email a lead already has (default: skip them)')
+    import_parser.add_argument('--duplicates-report', metavar='PATH',
+                               help='Write the skipped rows (line, email, duplicate_of) to this CSV file')
+    import_parser.add_argument('--batch-size', type=int, default=5000,
+                               help='Rows checked and inserted per transaction (default: 5000)')
+    import_parser.add_argument('--no-change-log', action='store_true',
+                               help="Don't write the imported leads to the change log (for initial loads)")
 
     # Analytics command
     analytics_parser = subparsers.add_parser('analytics', help='Show analytics and reports')
     analytics_parser.add_argument('--type', required=True,
-                                  choices=['conversion', 'winrate', 'pipeline', 'industry', 'location'],
+                                  choices=['conversion', 'winrate', 'pipeline', 'industry', 'location',
+                                           'stages', 'velocity'],
                                   help='Type of analytics to display')
+    analytics_parser.add_argument('--read-only', action='store_true',
+                                  help='Read through a read-only snapshot connection (never blocks writers)')
+    analytics_parser.add_argument('--replica', metavar='PATH',
+                                  help='Report from a copy of the database kept in PATH')
+    analytics_parser.add_argument('--replica-max-age', type=float, default=60.0, metavar='SECONDS',
+                                  help='Refresh the replica when it is older than this (default: 60)')
+    analytics_parser.add_argument('--exclude-expired', action='store_true',
+                                  help='Leave expired quotes out of the pipeline value')
+    analytics_parser.add_argument('--include-archived', action='store_true',
+                                  help='Include deals moved to the archive file')
+    analytics_parser.add_argument('--archive-file', metavar='PATH',
+                                  help='Archive file (default: <database>.archive.db)')
+    analytics_parser.add_argument('--sharded', action='store_true',
+                                  help='Report on the per-market files written by generate --sharded')
+
+    # Interactive shell command
+    subparsers.add_parser('shell', help='Interactive session: run many commands over one open connection')
+
+    # Batch command
+    batch_parser = subparsers.add_parser('batch', help='Apply a file of commands in one transaction')
+    batch_parser.add_argument('--file', required=True,
+                              help='Command file, one CLI command or JSON object per line (- for stdin)')
+    batch_parser.add_argument('--verbose', action='store_true', help='Show the output of every command')
+
+    # API server command
+    serve_parser = subparsers.add_parser('serve', help='Serve records and reports as an HTTP/JSON API')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8080, help='Port to listen on (default: 8080)')
+    serve_parser.add_argument('--readers', type=int, default=4,
+                              help='Reader threads, each with its own connection (default: 4)')
+    serve_parser.add_argument('--quiet', action='store_true', help='Do not log every request')
+
+    # Top-N command
+    top_parser = subparsers.add_parser('top', help='Show the largest deals or most valuable accounts')
+    top_parser.add_argument('--type', default='opportunities', choices=['opportunities', 'accounts'],
+                            help='Rank open opportunities or accounts by won value')
+    top_parser.add_argument('--limit', type=int, default=20, help='Number of results (default: 20)')
+    top_parser.add_argument('--by', default='weighted', choices=['weighted', 'value'],
+                            help='Rank opportunities by weighted value (value x probability) or estimated value')
+    top_parser.add_argument('--include-closed', action='store_true',
+                            help='Include opportunities that already have an order')
 
     # Company search command
     company_parser = subparsers.add_parser('company', help='View all records for a company')
@@ -409,7 +967,7 @@ def create_parser():
     add_opp_parser.add_argument('--lead-name', required=True, help='Lead/Company name')
     add_opp_parser.add_argument('--title', required=True, help='Opportunity title')
     add_opp_parser.add_argument('--value', type=float, required=True, help='Estimated value')
-    add_opp_parser.add_argument('--stage', default='initial_inquiry',
+    add_opp_parser.add_argument('--stage', default='initial_inquiry', choices=OPPORTUNITY_STAGES,
                                 help='Stage (initial_inquiry, qualification, proposal_development, negotiation, order_confirmation, delivery)')
     add_opp_parser.add_argument('--probability', type=int, default=0, help='Probability 0-100')
     add_opp_parser.add_argument('--expected-close', help='Expected close date (YYYY-MM-DD)')
@@ -421,14 +979,124 @@ def create_parser():
     add_quote_parser.add_argument('--amount', type=float, required=True, help='Quoted amount')
     add_quote_parser.add_argument('--valid-until', required=True, help='Valid until date (YYYY-MM-DD)')
     add_quote_parser.add_argument('--terms', default='', help='Payment terms')
-    add_quote_parser.add_argument('--status', default='draft', help='Status (draft, sent, accepted, rejected)')
+    add_quote_parser.add_argument('--status', default='draft', choices=QUOTE_STATUSES,
+                                  help='Status (draft, sent, accepted, rejected, expired)')
 
     # Add order command
     add_order_parser = subparsers.add_parser('add-order', help='Create order (close quote)')
     add_order_parser.add_argument('--quote-number', required=True, help='Quote number')
-    add_order_parser.add_argument('--status', required=True, choices=['won', 'lost'], help='Order status')
+    add_order_parser.add_argument('--status', required=True, choices=ORDER_STATUSES, help='Order status')
     add_order_parser.add_argument('--final-amount', type=float, required=True, help='Final amount')
     add_order_parser.add_argument('--close-date', required=True, help='Close date (YYYY-MM-DD)')
     add_order_parser.add_argument('--notes', default='', help='Notes')
 
+    # Expire quotes command
+    expire_parser = subparsers.add_parser('expire-quotes', help='Mark quotes past their valid-until date as expired')
+    expire_parser.add_argument('--as-of', help='Expire quotes valid until before this date (YYYY-MM-DD, default today)')
+    expire_parser.add_argument('--every', type=float, metavar='SECONDS',
+                               help='Keep running, sweeping every SECONDS (Ctrl+C to stop)')
+
+    # Archive command
+    archive_parser = subparsers.add_parser('archive', help='Move closed deals into the archive file')
+    archive_parser.add_argument('--before', required=True,
+                                help='Archive deals whose orders all closed before this date (YYYY-MM-DD)')
+    archive_parser.add_argument('--archive-file', metavar='PATH',
+                                help='Archive file (default: <database>.archive.db)')
+    archive_parser.add_argument('--batch-size', type=int, default=1000,
+                                help='Deals moved per transaction (default: 1000)')
+    archive_parser.add_argument('--vacuum', action='store_true',
+                                help='Compact the database file afterwards')
+
+    # Generate command
+    generate_parser = subparsers.add_parser('generate', help='Add generated leads and deals for load testing')
+    generate_parser.add_argument('--leads', type=int, required=True, help='Number of leads to generate')
+    generate_parser.add_argument('--seed', type=int, default=0, help='Random seed; same seed, same data (default: 0)')
+    generate_parser.add_argument('--config', metavar='JSON',
+                                 help='JSON file overriding any of the default distributions')
+    generate_parser.add_argument('--industries', metavar='WEIGHTS', help='e.g. automotive=3,logistics=1')
+    generate_parser.add_argument('--locations', metavar='WEIGHTS', help='e.g. Germany=2,Italy=1')
+    generate_parser.add_argument('--stages', metavar='WEIGHTS', help='e.g. initial_inquiry=5,negotiation=1')
+    generate_parser.add_argument('--opportunity-rate', type=float, help='Share of leads with an opportunity')
+    generate_parser.add_argument('--quote-rate', type=float, help='Share of opportunities with a quote')
+    generate_parser.add_argument('--acceptance-rate', type=float, help='Share of quotes closed with an order')
+    generate_parser.add_argument('--win-rate', type=float, help='Share of orders won')
+    generate_parser.add_argument('--start-date', help='First day leads are created (YYYY-MM-DD)')
+    generate_parser.add_argument('--days', type=int, help='Days over which lead creation is spread')
+    generate_parser.add_argument('--chunk-size', type=int, default=50_000,
+                                 help='Leads written per transaction (default: 50000)')
+    generate_parser.add_argument('--sharded', action='store_true',
+                                 help='Write one file per market (see sharding), each from its own process')
+    generate_parser.add_argument('--workers', type=int, help='Processes used with --sharded (default: one per CPU)')
+
+    # Dedup commands
+    dedup_parser = subparsers.add_parser('dedup', help='Find probable duplicate leads')
+    dedup_parser.add_argument('--threshold', type=float, default=0.6,
+                              help='Minimum similarity, 0 to 1, to count as duplicates (default: 0.6)')
+    dedup_parser.add_argument('--max-block-size', type=int, default=100,
+                              help='Ignore blocking keys shared by more leads than this (default: 100)')
+    dedup_parser.add_argument('--limit', type=int, default=50, help='Groups to show (default: 50)')
+    dedup_parser.add_argument('--merge', action='store_true',
+                              help='Merge every group into its oldest lead, in one transaction')
+
+    merge_parser = subparsers.add_parser('merge-leads', help='Merge duplicate leads into one')
+    merge_parser.add_argument('--into', type=int, required=True, help='ID of the lead to keep')
+    merge_parser.add_argument('--ids', type=int, nargs='+', required=True, help='IDs of the leads merged into it')
+
+    # Score command
+    score_parser = subparsers.add_parser('score-leads', help='Score leads from historical win rates')
+    score_parser.add_argument('--all', action='store_true',
+                              help='Rescore every lead with fresh win rates (default: only new and changed leads)')
+    score_parser.add_argument('--include-archived', action='store_true',
+                              help='Count archived orders in the win rates')
+    score_parser.add_argument('--archive-file', metavar='PATH',
+                              help='Archive file (default: <database>.archive.db)')
+    score_parser.add_argument('--batch-size', type=int, default=50000,
+                              help='Leads scored per transaction (default: 50000)')
+
+    # Change log commands
+    changes_parser = subparsers.add_parser('changes', help='Stream the change log as JSON Lines')
+    changes_parser.add_argument('--since', type=int, metavar='SEQ',
+                                help="Show changes after this seq (default: the consumer's position, or 0)")
+    changes_parser.add_argument('--consumer', metavar='NAME',
+                                help='Read from and save the position of this named consumer')
+    changes_parser.add_argument('--table', action='append', choices=['leads', 'opportunities', 'quotes', 'orders'],
+                                help='Only changes of this table (repeatable)')
+    changes_parser.add_argument('--limit', type=int, help='Stop after this many changes')
+    changes_parser.add_argument('--follow', action='store_true', help='Keep waiting for new changes (Ctrl+C to stop)')
+    changes_parser.add_argument('--poll', type=float, default=1.0,
+                                help='Seconds between checks for new changes with --follow (default: 1)')
+
+    compact_parser = subparsers.add_parser('compact-changes', help='Delete change records already processed')
+    compact_parser.add_argument('--up-to', type=int, metavar='SEQ',
+                                help='Delete nothing after this seq (required when no consumer is registered)')
+
+    # Backup commands
+    backup_parser = subparsers.add_parser('backup', help='Back up the database while it stays in use')
+    backup_parser.add_argument('--dir', default='backups', help='Backup directory (default: backups)')
+    backup_parser.add_argument('--compress', action='store_true', help='Write a gzip-compressed backup (.db.gz)')
+    backup_parser.add_argument('--keep', type=int, metavar='N', help='Delete all but the N newest backups afterwards')
+    backup_parser.add_argument('--pages', type=int, default=1024,
+                               help='Pages copied per step; writers get in between steps (default: 1024)')
+    backup_parser.add_argument('--list', action='store_true', help='List the backups instead, newest first')
+
+    restore_parser = subparsers.add_parser('restore', help='Replace the database with a backup')
+    restore_source = restore_parser.add_mutually_exclusive_group(required=True)
+    restore_source.add_argument('--file', metavar='PATH', help='Backup file (.db or .db.gz)')
+    restore_source.add_argument('--latest', action='store_true', help='The newest backup in --dir')
+    restore_parser.add_argument('--dir', default='backups', help='Backup directory (default: backups)')
+
+    # Set stage command
+    set_stage_parser = subparsers.add_parser('set-stage', help='Move opportunities to a new stage')
+    target = set_stage_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--opportunity-title', help='Opportunity title (partial match)')
+    target.add_argument('--ids', type=int, nargs='+', help='Opportunity IDs (moved in one transaction)')
+    set_stage_parser.add_argument('--stage', required=True, choices=OPPORTUNITY_STAGES, help='New stage')
+
+    # Set quote status command
+    set_status_parser = subparsers.add_parser('set-quote-status', help='Change the status of quotes')
+    target = set_status_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--quote-number', help='Quote number (partial match)')
+    target.add_argument('--ids', type=int, nargs='+', help='Quote IDs (changed in one transaction)')
+    set_status_parser.add_argument('--status', required=True, choices=QUOTE_STATUSES, help='New status')
+
     return parser
\ No newline at end of file
@@ -1,15 +1,33 @@
 """
 CSV import/export functionality
 """
+import contextlib
 import csv
 from pathlib import Path
+from salespipe import metrics
+from salespipe.bloom import BloomFilter, FALSE_POSITIVE_RATE
 from salespipe.models import Lead, Opportunity
 
+# Rows checked and inserted per transaction by import_leads_to_database
+IMPORT_BATCH_SIZE = 5000
+
+# Rough size of a CSV row, to make room in the Bloom filter for the file's own emails
+IMPORT_ROW_BYTES = 100
+
+# Characters SQLite's lower() changes; it leaves non-ASCII letters alone
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def normalize_email(email):
+    """The email as idx_leads_email stores it: lower(trim(email)) in SQLite terms"""
+    return (email or '').strip(' ').translate(_ASCII_LOWER)
+
 
 class CSVHandler:
     """Handles CSV import and export operations"""
 
     @staticmethod
+    @metrics.instrumented
     def export_leads_to_csv(leads, filename="leads_export.csv"):
         """Export leads to CSV file"""
         if not leads:
@@ -42,17 +60,12 @@ class CSVHandler:
                     # From Lead object
                     writer.writerow(lead.to_dict())
 
+        metrics.CSV_ROWS.inc('exported', amount=len(leads))
         print(f"Exported {len(leads)} leads to {filename}")
 
     @staticmethod
-    def import_leads_from_csv(filename):
-        """Import leads from CSV file"""
-        leads = []
-
-        if not Path(filename).exists():
-            print(f"File {filename} not found")
-            return leads
-
+    def _read_leads(filename):
+        """Yield (line number, Lead) for every row of a lead CSV file"""
         with open(filename, 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
 
@@ -63,13 +76,109 @@ class CSVHandler:
                     email=row['email'],
                     phone=row.get('phone', ''),
                     source=row.get('source', 'import'),
-                    status=row.get('status', 'new'),
-                    location=row.get('location'),
-                    industry=row.get('industry'),
-                    company_size=row.get('company_size'),
+                    # Blank cells (as exported for missing values) mean no value
+                    status=row.get('status') or 'new',
+                    location=row.get('location') or None,
+                    industry=row.get('industry') or None,
+                    company_size=row.get('company_size') or None,
                     created_at=row.get('created_at')
                 )
-                leads.append(lead)
+                yield reader.line_num, lead
+
+    @staticmethod
+    @metrics.instrumented
+    def import_leads_from_csv(filename):
+        """Import leads from CSV file"""
+        leads = []
 
+        if not Path(filename).exists():
+            print(f"File {filename} not found")
+            return leads
+
+        leads = [lead for _, lead in CSVHandler._read_leads(filename)]
+
+        metrics.CSV_ROWS.inc('imported', amount=len(leads))
         print(f"Imported {len(leads)} leads from {filename}")
-        return leads
\ No newline at end of file
+        return leads
+
+    @staticmethod
+    @metrics.instrumented
+    def import_leads_to_database(db, filename, skip_duplicates=True, batch_size=IMPORT_BATCH_SIZE,
+                                 false_positive_rate=FALSE_POSITIVE_RATE, log_changes=True):
+        """
+        Stream leads from a CSV file into the database, skipping duplicates
+        With skip_duplicates, rows whose normalised email a lead already has,
+        or an earlier row of the file, are left out. Existing emails are
+        loaded into a Bloom filter first; only rows it flags are looked up in
+        the database, a batch at a time. Each batch is inserted in one
+        transaction and its emails join the filter, so a row repeating an
+        earlier batch is found in the database like any other duplicate and
+        memory stays at the filter plus one batch, however long the file.
+        Returns (leads imported, duplicates), where duplicates lists
+        (line number, email, 'database' or 'file') of the rows skipped.
+        Without log_changes the new leads aren't written to the change log,
+        halving the writes of a large import.
+        """
+        if not Path(filename).exists():
+            print(f"File {filename} not found")
+            return 0, []
+
+        known = None
+        if skip_duplicates:
+            db.create_tables()
+            capacity = db.count_leads() + Path(filename).stat().st_size // IMPORT_ROW_BYTES
+            known = BloomFilter(capacity, false_positive_rate)
+            known.update(db.iter_lead_emails())
+            last_id = db.last_lead_id()  # Leads after this one came from the file
+        imported = 0
+        duplicates = []
+
+        def insert(batch):
+            existing = {}
+            if known is not None:
+                flagged = {email for _, email, _ in batch if email and email in known}
+                if flagged:
+                    existing = db.existing_emails(flagged)
+            accepted = []
+            seen = set()  # Normalised emails accepted from this batch
+            for line, email, lead in batch:
+                if known is None or not email:
+                    accepted.append(lead)
+                elif email in existing:
+                    duplicates.append((line, email, 'database' if existing[email] <= last_id else 'file'))
+                elif email in seen:
+                    duplicates.append((line, email, 'file'))
+                else:
+                    seen.add(email)
+                    accepted.append(lead)
+            with db.transaction(), (contextlib.nullcontext() if log_changes else db.changes_paused()):
+                for lead in accepted:
+                    db.add_lead(lead)
+            if known is not None:
+                known.update(seen)
+            return len(accepted)
+
+        batch = []
+        for line, lead in CSVHandler._read_leads(filename):
+            batch.append((line, normalize_email(lead.email), lead))
+            if len(batch) >= batch_size:
+                imported += insert(batch)
+                batch = []
+        if batch:
+            imported += insert(batch)
+
+        metrics.CSV_ROWS.inc('imported', amount=imported)
+        metrics.CSV_ROWS.inc('skipped', amount=len(duplicates))
+        print(f"Imported {imported} leads from {filename}")
+        if duplicates:
+            print(f"Skipped {len(duplicates)} duplicate leads "
+                  f"({sum(reason == 'database' for *_, reason in duplicates)} already in the database)")
+        return imported, duplicates
+
+    @staticmethod
+    def write_duplicates_report(duplicates, filename):
+        """Write the duplicates returned by import_leads_to_database to a CSV file"""
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['line', 'email', 'duplicate_of'])
+            writer.writerows(duplicates)
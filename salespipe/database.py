@@ -1,291 +1,1301 @@
 """
 SQLite database management for Sales Pipeline Manager
 """
+import contextlib
+import json
+import functools
+import os
+import pathlib
+import random
 import sqlite3
-from pathlib import Path
+import threading
+import time
+from datetime import datetime
+from salespipe import metrics, profiling
+from salespipe.models import (Money, LEAD_STATUSES, LEAD_SOURCES, LOCATIONS, INDUSTRIES, COMPANY_SIZES,
+                              OPPORTUNITY_STAGES, QUOTE_STATUSES, ORDER_STATUSES)
+
+# Bumped by every migration; stored in PRAGMA user_version
+SCHEMA_VERSION = 10
+
+# Seconds a connection waits for another one's lock before failing with SQLITE_BUSY
+BUSY_TIMEOUT = 5.0
+# Times a write is retried (with a growing, jittered pause) if it still hits SQLITE_BUSY
+BUSY_RETRIES = 5
+
+# Change records deleted per transaction by compact_changes
+COMPACT_BATCH = 10_000
+
+# Emails looked up per query by existing_emails (below SQLite's oldest 999-parameter limit)
+EMAIL_LOOKUP_BATCH = 500
+
+# Database files this process has already seen at SCHEMA_VERSION
+_current_schemas = set()
+
+# Lookup tables for the enumerated columns and the values they are seeded with.
+# New sources, locations and industries are added on first use (see OPEN_LOOKUPS).
+LOOKUP_TABLES = {
+    'lead_statuses': LEAD_STATUSES,
+    'lead_sources': LEAD_SOURCES,
+    'locations': LOCATIONS,
+    'industries': INDUSTRIES,
+    'company_sizes': COMPANY_SIZES,
+    'opportunity_stages': OPPORTUNITY_STAGES,
+    'quote_statuses': QUOTE_STATUSES,
+    'order_statuses': ORDER_STATUSES,
+}
+
+# Lookups whose labels aren't a fixed set: new labels are registered on first use.
+# Stages and statuses drive the pipeline logic, so an unknown one is an error.
+OPEN_LOOKUPS = {'lead_sources', 'locations', 'industries'}
+
+# Table definitions as created by schema version 1; later migrations alter them
+LEADS_TABLE = '''
+    CREATE TABLE {name}
+    (
+        lead_id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        name            TEXT    NOT NULL,
+        email           TEXT    NOT NULL,
+        phone           TEXT,
+        source_id       INTEGER REFERENCES lead_sources (code),
+        status_id       INTEGER NOT NULL DEFAULT 1 REFERENCES lead_statuses (code),
+        location_id     INTEGER REFERENCES locations (code),
+        industry_id     INTEGER REFERENCES industries (code),
+        company_size_id INTEGER REFERENCES company_sizes (code),
+        created_at      TEXT    NOT NULL
+    )
+'''
+
+OPPORTUNITIES_TABLE = '''
+    CREATE TABLE {name}
+    (
+        opp_id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        lead_id         INTEGER NOT NULL REFERENCES leads (lead_id),
+        title           TEXT    NOT NULL,
+        estimated_value REAL    NOT NULL,
+        stage_id        INTEGER NOT NULL DEFAULT 1 REFERENCES opportunity_stages (code),
+        probability     INTEGER DEFAULT 0,
+        expected_close  TEXT,
+        created_at      TEXT    NOT NULL
+    )
+'''
+
+QUOTES_TABLE = '''
+    CREATE TABLE {name}
+    (
+        quote_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+        opp_id        INTEGER NOT NULL REFERENCES opportunities (opp_id),
+        quote_number  TEXT    NOT NULL UNIQUE,
+        quoted_amount REAL    NOT NULL,
+        valid_until   TEXT,
+        terms         TEXT,
+        status_id     INTEGER NOT NULL DEFAULT 1 REFERENCES quote_statuses (code),
+        created_at    TEXT    NOT NULL
+    )
+'''
+
+ORDERS_TABLE = '''
+    CREATE TABLE {name}
+    (
+        order_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+        quote_id     INTEGER NOT NULL REFERENCES quotes (quote_id),
+        status_id    INTEGER NOT NULL REFERENCES order_statuses (code),
+        final_amount REAL    NOT NULL,
+        close_date   TEXT    NOT NULL,
+        notes        TEXT,
+        created_at   TEXT    NOT NULL
+    )
+'''
+
+# Win rate behind lead scores, per lead attribute column and code (see salespipe.scoring)
+LEAD_SCORE_RATES_TABLE = '''
+    CREATE TABLE lead_score_rates
+    (
+        attribute TEXT    NOT NULL,
+        code      INTEGER NOT NULL,
+        rate      REAL    NOT NULL,
+        PRIMARY KEY (attribute, code)
+    ) WITHOUT ROWID
+'''
+
+# Append-only log of inserts, updates and deletes of records, written by triggers
+CHANGES_TABLE = '''
+    CREATE TABLE changes
+    (
+        seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT    NOT NULL,
+        record_id  INTEGER NOT NULL,
+        operation  TEXT    NOT NULL,
+        changed_at TEXT    NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now'))
+    )
+'''
+
+# Position in the change log of each named consumer
+CHANGE_CONSUMERS_TABLE = '''
+    CREATE TABLE change_consumers
+    (
+        name       TEXT    PRIMARY KEY,
+        seq        INTEGER NOT NULL,
+        updated_at TEXT    NOT NULL
+    )
+'''
+
+# One-row switch read by the change log triggers. Bulk loads set it inside
+# their own transaction (see Database.changes_paused), so other connections
+# never see it set.
+CHANGE_CAPTURE_TABLE = '''
+    CREATE TABLE change_capture
+    (
+        paused INTEGER NOT NULL
+    )
+'''
+
+# Derived columns whose updates aren't logged as changes
+CHANGES_IGNORED_COLUMNS = {'score', 'score_stale'}
+
+# Views exposing the tables with their enumerated columns translated back to
+# text, in the original column order, so rows read like they always have
+VIEWS = {
+    'leads_view': '''
+        SELECT l.lead_id, l.name, l.email, l.phone, src.label AS source, st.label AS status,
+               loc.label AS location, ind.label AS industry, sz.label AS company_size, l.created_at, l.score
+        FROM leads l
+                 LEFT JOIN lead_sources src ON src.code = l.source_id
+                 LEFT JOIN lead_statuses st ON st.code = l.status_id
+                 LEFT JOIN locations loc ON loc.code = l.location_id
+                 LEFT JOIN industries ind ON ind.code = l.industry_id
+                 LEFT JOIN company_sizes sz ON sz.code = l.company_size_id
+    ''',
+    'opportunities_view': '''
+        SELECT o.opp_id, o.lead_id, o.title, o.estimated_value_cents / 100.0 AS estimated_value,
+               st.label AS stage, o.probability, o.expected_close, o.created_at
+        FROM opportunities o
+                 LEFT JOIN opportunity_stages st ON st.code = o.stage_id
+    ''',
+    'quotes_view': '''
+        SELECT q.quote_id, q.opp_id, q.quote_number, q.quoted_amount_cents / 100.0 AS quoted_amount,
+               q.valid_until, q.terms, st.label AS status, q.created_at
+        FROM quotes q
+                 LEFT JOIN quote_statuses st ON st.code = q.status_id
+    ''',
+    'orders_view': '''
+        SELECT o.order_id, o.quote_id, st.label AS status, o.final_amount_cents / 100.0 AS final_amount,
+               o.close_date, o.notes, o.created_at
+        FROM orders o
+                 LEFT JOIN order_statuses st ON st.code = o.status_id
+    ''',
+}
+
+
+# Record types: table -> (key column, view returning its rows with labels)
+RECORDS = {
+    'leads': ('lead_id', 'leads_view'),
+    'opportunities': ('opp_id', 'opportunities_view'),
+    'quotes': ('quote_id', 'quotes_view'),
+    'orders': ('order_id', 'orders_view'),
+}
+
+# Enumerated lead fields and their lookup tables
+LEAD_LOOKUPS = {
+    'source': 'lead_sources',
+    'status': 'lead_statuses',
+    'location': 'locations',
+    'industry': 'industries',
+    'company_size': 'company_sizes',
+}
+
+# Orderings offered by Database.iter_leads: name -> leads column
+LEAD_SORTS = {
+    'id': 'lead_id',
+    'name': 'name',
+    'created': 'created_at',
+    'score': 'score',
+}
+
+
+def to_cents(amount):
+    """Convert a euro amount to the integer cents stored in the database"""
+    if amount is None:
+        return None
+    return Money.from_amount(amount).cents
+
+
+def forget_schema(db_path):
+    """Make the next create_tables() read the schema version of a file again, e.g. after it was replaced"""
+    _current_schemas.discard(db_path)
+
+
+def _is_busy(error):
+    """Whether an sqlite3 error means another connection held the lock"""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+def retry_on_busy(method):
+    """
+    Re-run a write that failed with SQLITE_BUSY after rolling it back
+    busy_timeout covers most lock waits, but SQLite gives up at once when
+    waiting could deadlock, so those writes are retried here. Inside an
+    enclosing transaction() the error is raised instead, because only the
+    whole transaction can be retried.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return method(self, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if self.in_transaction or not _is_busy(e) or attempt == BUSY_RETRIES:
+                    raise
+                self.rollback()
+                self.close()
+                time.sleep(random.uniform(0.5, 1.5) * 0.01 * 2 ** attempt)
+
+    return wrapper
+
+
+class _PerThread:
+    """Database attribute with a separate value in every thread"""
+
+    def __init__(self, default=None):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, db, owner=None):
+        if db is None:
+            return self
+        return getattr(db._local, self.name, self.default)
+
+    def __set__(self, db, value):
+        setattr(db._local, self.name, value)
 
 
 class Database:
-    """Manages SQLite database operations"""
+    """
+    Manages SQLite database operations
+    One instance can be shared between threads: every thread gets its own
+    connection, session and transaction state.
+    With read_only=True connections are opened with a mode=ro URI, and each
+    connect()...close() span reads from one snapshot; under WAL such readers
+    never block writers, nor wait for them.
+    With archive_path set, every connection attaches that file as the
+    `archive` schema (see salespipe.archive), once the file exists: only
+    Archiver creates it.
+    """
+
+    conn = _PerThread()
+    cursor = _PerThread()
+    in_session = _PerThread(False)
+    in_transaction = _PerThread(False)
 
-    def __init__(self, db_path="sales_pipeline.db"):
+    def __init__(self, db_path="sales_pipeline.db", busy_timeout=BUSY_TIMEOUT, read_only=False, archive_path=None):
         """Initialize database connection"""
         self.db_path = db_path
-        self.conn = None
-        self.cursor = None
+        self.busy_timeout = busy_timeout
+        self.read_only = read_only
+        self.archive_path = archive_path
+        self._local = threading.local()
+        self._codes = {}  # lookup table -> {label: code}, shared by all threads
+        metrics.watch_database(db_path)
 
     def connect(self):
-        """Connect to database"""
-        self.conn = sqlite3.connect(self.db_path)
+        """Connect to database (reuses the open connection during a session)"""
+        if self.in_session:
+            if self.read_only and not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            return
+        # Plain sqlite3.Connection unless query instrumentation is enabled
+        factory = profiling.connection_factory()
+        if self.read_only:
+            self.conn = sqlite3.connect(self._read_only_uri(self.db_path), uri=True, timeout=self.busy_timeout,
+                                        factory=factory)
+        else:
+            self.conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, factory=factory)
         self.cursor = self.conn.cursor()
         self.cursor.execute("PRAGMA foreign_keys = ON")
+        if self.archive_path and os.path.exists(self.archive_path):
+            # ATTACH can't run inside a transaction, so do it before the snapshot starts.
+            # A missing file isn't attached: ATTACH would create it as a side effect of a read.
+            archive = self._read_only_uri(self.archive_path) if self.read_only else self.archive_path
+            self.cursor.execute("ATTACH DATABASE ? AS archive", (archive,))
+        if self.read_only:
+            # Every query until close() sees the same snapshot of the data
+            self.cursor.execute("BEGIN")
+
+    def archive_attached(self):
+        """Whether the open connection has the archive file attached"""
+        return self.archive_path is not None and self.cursor.execute(
+            "SELECT 1 FROM pragma_database_list WHERE name = 'archive'").fetchone() is not None
+
+    @staticmethod
+    def _read_only_uri(path):
+        """URI opening a database file read-only"""
+        return pathlib.Path(path).absolute().as_uri() + "?mode=ro"
 
     def close(self):
-        """Close database connection"""
-        if self.conn:
+        """Close database connection (kept open during a session)"""
+        if not self.conn:
+            return
+        if not self.in_session:
             self.conn.close()
+            self.conn = self.cursor = None
+        elif self.read_only and self.conn.in_transaction:
+            # Release the snapshot so the next call sees newer data
+            self.conn.rollback()
+
+    def open_session(self):
+        """Open one connection that every following call reuses, until close_session()"""
+        if not self.in_session:
+            self.connect()
+            self.in_session = True
+            if self.read_only:
+                self.conn.rollback()  # No snapshot until the first call
+
+    def close_session(self):
+        """End the session and close its connection"""
+        self.in_session = False
+        self.close()
+
+    def rollback(self):
+        """Roll back the open transaction, forgetting any lookup codes it created"""
+        if self.conn:
+            self.conn.rollback()
+        self._codes = {}
 
+    def enable_wal(self):
+        """Switch the file to WAL journaling, so readers and a writer don't block each other"""
+        self.connect()
+        self.cursor.execute("PRAGMA journal_mode=WAL").fetchone()
+        self.close()
+
+    @metrics.instrumented
+    def backup_to(self, target_path, pages=-1, progress=None, sleep=0.25):
+        """
+        Copy the database into target_path with SQLite's online backup API
+        Copies `pages` pages per step (-1: all at once), pausing `sleep`
+        seconds between steps; progress(status, remaining, total) is called
+        after each step, as sqlite3 does. The source is read in one
+        transaction, so the copy is a single snapshot and writes made
+        meanwhile don't restart it; under WAL they aren't held up either.
+        """
+        self.connect()
+        target = sqlite3.connect(target_path)
+        began = not self.conn.in_transaction
+        try:
+            if began:
+                self.conn.execute("BEGIN")
+            # A deferred BEGIN takes its snapshot at the first read
+            self.conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            self.conn.backup(target, pages=pages, progress=progress, sleep=sleep)
+        finally:
+            target.close()
+            if began:
+                self.conn.rollback()
+            self.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Run every call inside the block as one transaction on one connection:
+        committed when the block ends, rolled back if it raises. Nested
+        inside another transaction() (e.g. an import in a batch), the block
+        becomes a savepoint of the enclosing one.
+        """
+        if self.in_transaction:
+            self.cursor.execute("SAVEPOINT nested")
+            try:
+                yield self
+            except BaseException:
+                self.cursor.execute("ROLLBACK TO nested")
+                raise
+            finally:
+                self.cursor.execute("RELEASE nested")
+            return
+        opened = not self.in_session
+        self.open_session()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        self.in_transaction = True
+        try:
+            yield self
+        except BaseException:
+            self.in_transaction = False
+            self.rollback()
+            raise
+        else:
+            self.in_transaction = False
+            self.conn.commit()
+        finally:
+            if opened:
+                self.close_session()
+
+    def _commit(self):
+        """Commit, unless the work is part of an enclosing transaction()"""
+        if not self.in_transaction:
+            self.conn.commit()
+
+    def data_state(self):
+        """
+        Token that changes whenever the database is modified, through this
+        connection or any other. Only comparable while a session keeps the
+        same connection open.
+        """
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        return data_version, self.conn.total_changes
+
+    @metrics.instrumented
     def create_tables(self):
-        """Create database tables if they don't exist"""
+        """
+        Create database tables if they don't exist and apply pending migrations
+        Cheap when the schema is current: one PRAGMA user_version read, and
+        nothing at all once this process has seen the file up to date
+        """
+        if self.db_path in _current_schemas and os.path.exists(self.db_path):
+            return
+
         self.connect()
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            self._migrate()
+        self.close()
+        if self.db_path != ':memory:':
+            _current_schemas.add(self.db_path)
+
+    def _migrate(self):
+        """Bring the schema up to SCHEMA_VERSION in one transaction"""
+        # Foreign keys must be off while tables are rebuilt; the pragma is a
+        # no-op inside a transaction, so switch it before BEGIN
+        self.cursor.execute("PRAGMA foreign_keys = OFF")
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Read the version again under the write lock: another connection
+            # may have migrated the file while this one was waiting
+            version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                self.conn.rollback()
+                return
+
+            for name in VIEWS:
+                self.cursor.execute(f"DROP VIEW IF EXISTS {name}")
+
+            migrations = [self._migrate_v1, self._migrate_v2, self._migrate_v3, self._migrate_v4,
+                          self._migrate_v5, self._migrate_v6, self._migrate_v7,
+                          self._migrate_v8, self._migrate_v9, self._migrate_v10]
+            for migration in migrations[version:]:
+                migration()
+
+            for name, select in VIEWS.items():
+                self.cursor.execute(f"CREATE VIEW {name} AS {select}")
+
+            if self.cursor.execute("PRAGMA foreign_key_check").fetchone():
+                raise sqlite3.IntegrityError("Foreign key violation while migrating schema")
+            self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.cursor.execute("PRAGMA foreign_keys = ON")
+        self._codes = {}
+
+    def _table_exists(self, table):
+        """Check whether a table exists in the main schema"""
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,))
+        return self.cursor.fetchone() is not None
+
+    def _rebuild_table(self, table, definition, copy_select):
+        """Recreate a table from a new definition, copying rows with copy_select"""
+        self.cursor.execute(definition.format(name=f"{table}_new"))
+        self.cursor.execute(f"INSERT INTO {table}_new {copy_select}")
+        self.cursor.execute(f"DROP TABLE {table}")
+        self.cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    def _migrate_v1(self):
+        """Move enumerated text columns into integer-coded lookup tables"""
+        for table, values in LOOKUP_TABLES.items():
+            self.cursor.execute(f'''
+                                CREATE TABLE {table}
+                                (
+                                    code  INTEGER PRIMARY KEY,
+                                    label TEXT NOT NULL UNIQUE
+                                )
+                                ''')
+            self.cursor.executemany(f"INSERT INTO {table} (label) VALUES (?)", [(v,) for v in values])
+
+        if not self._table_exists('leads'):
+            for table, definition in (('leads', LEADS_TABLE), ('opportunities', OPPORTUNITIES_TABLE),
+                                      ('quotes', QUOTES_TABLE), ('orders', ORDERS_TABLE)):
+                self.cursor.execute(definition.format(name=table))
+        else:
+            self._convert_legacy_tables()
+
+        self.cursor.execute("CREATE INDEX idx_leads_industry ON leads (industry_id)")
+        self.cursor.execute("CREATE INDEX idx_leads_location ON leads (location_id)")
+        self.cursor.execute("CREATE INDEX idx_opportunities_lead ON opportunities (lead_id)")
+        self.cursor.execute("CREATE INDEX idx_quotes_opp ON quotes (opp_id)")
+        self.cursor.execute("CREATE INDEX idx_orders_quote ON orders (quote_id)")
+        self.cursor.execute("CREATE INDEX idx_orders_status ON orders (status_id)")
+
+    def _convert_legacy_tables(self):
+        """Rebuild the pre-migration tables, swapping text columns for lookup codes"""
+        # Register every label already in use, then swap each text column for the code of its label
+        legacy_columns = [
+            ('lead_sources', 'leads', 'source'),
+            ('lead_statuses', 'leads', 'status'),
+            ('locations', 'leads', 'location'),
+            ('industries', 'leads', 'industry'),
+            ('company_sizes', 'leads', 'company_size'),
+            ('opportunity_stages', 'opportunities', 'stage'),
+            ('quote_statuses', 'quotes', 'status'),
+            ('order_statuses', 'orders', 'status'),
+        ]
+        for lookup, table, column in legacy_columns:
+            self.cursor.execute(f'''
+                                INSERT OR IGNORE INTO {lookup} (label)
+                                SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL
+                                ''')
 
-        # Create leads table
+        def code(lookup, column):
+            return f"(SELECT code FROM {lookup} WHERE label = {column})"
+
+        self._rebuild_table('leads', LEADS_TABLE, f'''
+            SELECT lead_id, name, email, phone, {code('lead_sources', 'source')},
+                   COALESCE({code('lead_statuses', 'status')}, 1), {code('locations', 'location')},
+                   {code('industries', 'industry')}, {code('company_sizes', 'company_size')}, created_at
+            FROM leads
+        ''')
+        self._rebuild_table('opportunities', OPPORTUNITIES_TABLE, f'''
+            SELECT opp_id, lead_id, title, estimated_value,
+                   COALESCE({code('opportunity_stages', 'stage')}, 1), probability, expected_close, created_at
+            FROM opportunities
+        ''')
+        self._rebuild_table('quotes', QUOTES_TABLE, f'''
+            SELECT quote_id, opp_id, quote_number, quoted_amount, valid_until, terms,
+                   COALESCE({code('quote_statuses', 'status')}, 1), created_at
+            FROM quotes
+        ''')
+        self._rebuild_table('orders', ORDERS_TABLE, f'''
+            SELECT order_id, quote_id, {code('order_statuses', 'status')}, final_amount, close_date,
+                   notes, created_at
+            FROM orders
+        ''')
+
+    def _migrate_v2(self):
+        """Store money columns as integer cents instead of REAL euros"""
+        for table, column in (('opportunities', 'estimated_value'), ('quotes', 'quoted_amount'),
+                              ('orders', 'final_amount')):
+            self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column}_cents INTEGER NOT NULL DEFAULT 0")
+            self.cursor.execute(f"UPDATE {table} SET {column}_cents = CAST(ROUND({column} * 100) AS INTEGER)")
+            self.cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+    def _migrate_v3(self):
+        """Add stage and status history tables, seeded with each row's current value"""
         self.cursor.execute('''
-                            CREATE TABLE IF NOT EXISTS leads
+                            CREATE TABLE opportunity_stage_history
                             (
-                                lead_id
-                                INTEGER
-                                PRIMARY
-                                KEY
-                                AUTOINCREMENT,
-                                name
-                                TEXT
-                                NOT
-                                NULL,
-                                email
-                                TEXT
-                                NOT
-                                NULL,
-                                phone
-                                TEXT,
-                                source
-                                TEXT,
-                                status
-                                TEXT
-                                DEFAULT
-                                'new',
-                                location
-                                TEXT,
-                                industry
-                                TEXT,
-                                company_size
-                                TEXT,
-                                created_at
-                                TEXT
-                                NOT
-                                NULL
+                                history_id    INTEGER PRIMARY KEY,
+                                opp_id        INTEGER NOT NULL REFERENCES opportunities (opp_id),
+                                from_stage_id INTEGER REFERENCES opportunity_stages (code),
+                                to_stage_id   INTEGER NOT NULL REFERENCES opportunity_stages (code),
+                                changed_at    TEXT    NOT NULL
                             )
                             ''')
-
-        # Create opportunities table
         self.cursor.execute('''
-                            CREATE TABLE IF NOT EXISTS opportunities
-                            (
-                                opp_id
-                                INTEGER
-                                PRIMARY
-                                KEY
-                                AUTOINCREMENT,
-                                lead_id
-                                INTEGER
-                                NOT
-                                NULL,
-                                title
-                                TEXT
-                                NOT
-                                NULL,
-                                estimated_value
-                                REAL
-                                NOT
-                                NULL,
-                                stage
-                                TEXT
-                                DEFAULT
-                                'initial_inquiry',
-                                probability
-                                INTEGER
-                                DEFAULT
-                                0,
-                                expected_close
-                                TEXT,
-                                created_at
-                                TEXT
-                                NOT
-                                NULL,
-                                FOREIGN
-                                KEY
-                            (
-                                lead_id
-                            ) REFERENCES leads
+                            CREATE TABLE quote_status_history
                             (
-                                lead_id
+                                history_id     INTEGER PRIMARY KEY,
+                                quote_id       INTEGER NOT NULL REFERENCES quotes (quote_id),
+                                from_status_id INTEGER REFERENCES quote_statuses (code),
+                                to_status_id   INTEGER NOT NULL REFERENCES quote_statuses (code),
+                                changed_at     TEXT    NOT NULL
                             )
-                                )
                             ''')
-
-        # Create quotes table
         self.cursor.execute('''
-                            CREATE TABLE IF NOT EXISTS quotes
-                            (
-                                quote_id
-                                INTEGER
-                                PRIMARY
-                                KEY
-                                AUTOINCREMENT,
-                                opp_id
-                                INTEGER
-                                NOT
-                                NULL,
-                                quote_number
-                                TEXT
-                                NOT
-                                NULL
-                                UNIQUE,
-                                quoted_amount
-                                REAL
-                                NOT
-                                NULL,
-                                valid_until
-                                TEXT,
-                                terms
-                                TEXT,
-                                status
-                                TEXT
-                                DEFAULT
-                                'draft',
-                                created_at
-                                TEXT
-                                NOT
-                                NULL,
-                                FOREIGN
-                                KEY
-                            (
-                                opp_id
-                            ) REFERENCES opportunities
-                            (
-                                opp_id
-                            )
-                                )
+                            INSERT INTO opportunity_stage_history (opp_id, from_stage_id, to_stage_id, changed_at)
+                            SELECT opp_id, NULL, stage_id, created_at FROM opportunities
+                            ''')
+        self.cursor.execute('''
+                            INSERT INTO quote_status_history (quote_id, from_status_id, to_status_id, changed_at)
+                            SELECT quote_id, NULL, status_id, created_at FROM quotes
                             ''')
+        self.cursor.execute("CREATE INDEX idx_stage_history_opp ON opportunity_stage_history (opp_id, changed_at)")
+        self.cursor.execute("CREATE INDEX idx_quote_status_history_quote ON quote_status_history (quote_id, changed_at)")
+
+    def _migrate_v4(self):
+        """Index quotes by status and expiry date, covering the quoted amount"""
+        self.cursor.execute("CREATE INDEX idx_quotes_expiry ON quotes (status_id, valid_until, quoted_amount_cents)")
+
+    def _migrate_v5(self):
+        """Index deal values so top-N queries read rows in value order and stop early"""
+        self.cursor.execute("CREATE INDEX idx_opportunities_value ON opportunities (estimated_value_cents)")
+        # Expression index matching the weighted-value ORDER BY in Analytics
+        self.cursor.execute("CREATE INDEX idx_opportunities_weighted ON opportunities "
+                            "(estimated_value_cents * probability)")
+        # Covers status filters and won-value sums; supersedes idx_orders_status
+        self.cursor.execute("CREATE INDEX idx_orders_won ON orders (status_id, final_amount_cents, quote_id)")
+        self.cursor.execute("DROP INDEX idx_orders_status")
 
-        # Create orders table
+    def _migrate_v6(self):
+        """Index the lead filter and sort columns used by paginated listings"""
+        self.cursor.execute("CREATE INDEX idx_leads_status ON leads (status_id)")
+        self.cursor.execute("CREATE INDEX idx_leads_source ON leads (source_id)")
+        self.cursor.execute("CREATE INDEX idx_leads_name ON leads (name)")
+        self.cursor.execute("CREATE INDEX idx_leads_created ON leads (created_at)")
+
+    def _migrate_v7(self):
+        """Index normalised emails, so imports can look up known leads"""
+        self.cursor.execute("CREATE INDEX idx_leads_email ON leads (lower(trim(email)))")
+
+    def _migrate_v8(self):
+        """Add lead scores (see salespipe.scoring), flagged stale until scored and when their inputs change"""
+        self.cursor.execute("ALTER TABLE leads ADD COLUMN score REAL NOT NULL DEFAULT 0")
+        self.cursor.execute("ALTER TABLE leads ADD COLUMN score_stale INTEGER NOT NULL DEFAULT 1")
+        self.cursor.execute("CREATE INDEX idx_leads_score ON leads (score)")
+        self.cursor.execute(LEAD_SCORE_RATES_TABLE)
+        # Small partial index: only the leads waiting to be scored
+        self.cursor.execute("CREATE INDEX idx_leads_score_stale ON leads (lead_id) WHERE score_stale = 1")
         self.cursor.execute('''
-                            CREATE TABLE IF NOT EXISTS orders
-                            (
-                                order_id
-                                INTEGER
-                                PRIMARY
-                                KEY
-                                AUTOINCREMENT,
-                                quote_id
-                                INTEGER
-                                NOT
-                                NULL,
-                                status
-                                TEXT
-                                NOT
-                                NULL,
-                                final_amount
-                                REAL
-                                NOT
-                                NULL,
-                                close_date
-                                TEXT
-                                NOT
-                                NULL,
-                                notes
-                                TEXT,
-                                created_at
-                                TEXT
-                                NOT
-                                NULL,
-                                FOREIGN
-                                KEY
-                            (
-                                quote_id
-                            ) REFERENCES quotes
-                            (
-                                quote_id
-                            )
-                                )
+                            CREATE TRIGGER leads_score_stale
+                                AFTER UPDATE OF source_id, location_id, industry_id, company_size_id ON leads
+                                WHEN NEW.score_stale = 0
+                            BEGIN
+                                UPDATE leads SET score_stale = 1 WHERE lead_id = NEW.lead_id;
+                            END
                             ''')
 
-        self.conn.commit()
-        self.close()
+    def _migrate_v9(self):
+        """Log every insert, update and delete of a record in the changes table"""
+        self.cursor.execute(CHANGES_TABLE)
+        self.cursor.execute(CHANGE_CONSUMERS_TABLE)
+        for table, (key, _) in RECORDS.items():
+            columns = [row[1] for row in self.cursor.execute(f"PRAGMA table_info({table})").fetchall()
+                       if row[1] not in CHANGES_IGNORED_COLUMNS]
+            for operation, event, row in (('insert', 'INSERT', 'NEW'),
+                                          ('update', f"UPDATE OF {', '.join(columns)}", 'NEW'),
+                                          ('delete', 'DELETE', 'OLD')):
+                self.cursor.execute(f'''
+                                    CREATE TRIGGER {table}_log_{operation} AFTER {event} ON {table}
+                                    BEGIN
+                                        INSERT INTO changes (table_name, record_id, operation)
+                                        VALUES ('{table}', {row}.{key}, '{operation}');
+                                    END
+                                    ''')
+
+    def _migrate_v10(self):
+        """Let bulk loads leave their rows out of the change log"""
+        self.cursor.execute(CHANGE_CAPTURE_TABLE)
+        self.cursor.execute("INSERT INTO change_capture (paused) VALUES (0)")
+        for table, (key, _) in RECORDS.items():
+            columns = [row[1] for row in self.cursor.execute(f"PRAGMA table_info({table})").fetchall()
+                       if row[1] not in CHANGES_IGNORED_COLUMNS]
+            for operation, event, row in (('insert', 'INSERT', 'NEW'),
+                                          ('update', f"UPDATE OF {', '.join(columns)}", 'NEW'),
+                                          ('delete', 'DELETE', 'OLD')):
+                self.cursor.execute(f"DROP TRIGGER {table}_log_{operation}")
+                self.cursor.execute(f'''
+                                    CREATE TRIGGER {table}_log_{operation} AFTER {event} ON {table}
+                                    WHEN NOT (SELECT paused FROM change_capture)
+                                    BEGIN
+                                        INSERT INTO changes (table_name, record_id, operation)
+                                        VALUES ('{table}', {row}.{key}, '{operation}');
+                                    END
+                                    ''')
+
+    def lookup_code(self, table, label):
+        """
+        Translate a label into its integer code in a lookup table
+        Unknown labels of OPEN_LOOKUPS are registered on the open connection
+        and get a new code; in any other table they raise ValueError
+        """
+        if label is None:
+            return None
+
+        codes = self._codes.get(table)
+        if codes is None:
+            self.cursor.execute(f"SELECT label, code FROM {table}")
+            codes = self._codes[table] = dict(self.cursor.fetchall())
 
+        code = codes.get(label)
+        if code is None:
+            self.cursor.execute(f"SELECT code FROM {table} WHERE label=?", (label,))
+            row = self.cursor.fetchone()
+            if row:
+                code = codes[label] = row[0]
+            elif table not in OPEN_LOOKUPS:
+                raise ValueError(f"Unknown {table} label {label!r}; "
+                                 f"expected one of: {', '.join(codes)}")
+            else:
+                # Not cached until committed, so a rollback can't leave a stale code behind
+                self.cursor.execute(f"INSERT INTO {table} (label) VALUES (?)", (label,))
+                code = self.cursor.lastrowid
+        return code
+
+    @metrics.instrumented
+    @retry_on_busy
     def add_lead(self, lead):
         """Add a lead to database"""
         self.connect()
         self.cursor.execute('''
-                            INSERT INTO leads (name, email, phone, source, status, location, industry, company_size,
-                                               created_at)
+                            INSERT INTO leads (name, email, phone, source_id, status_id, location_id, industry_id,
+                                               company_size_id, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            ''', (lead.name, lead.email, lead.phone, lead.source,
-                                  lead.status, lead.location, lead.industry, lead.company_size, lead.created_at))
-        self.conn.commit()
+                            ''', (lead.name, lead.email, lead.phone,
+                                  self.lookup_code('lead_sources', lead.source),
+                                  self.lookup_code('lead_statuses', lead.status or 'new'),
+                                  self.lookup_code('locations', lead.location),
+                                  self.lookup_code('industries', lead.industry),
+                                  self.lookup_code('company_sizes', lead.company_size),
+                                  lead.created_at))
+        self._commit()
+        metrics.RECORDS_INSERTED.inc('leads')
         lead_id = self.cursor.lastrowid
         self.close()
         return lead_id
 
+    @metrics.instrumented
     def get_all_leads(self):
         """Get all leads from database"""
         self.connect()
-        self.cursor.execute('SELECT * FROM leads')
+        self.cursor.execute('SELECT * FROM leads_view ORDER BY lead_id')
         rows = self.cursor.fetchall()
         self.close()
         return rows
 
+    def count_leads(self):
+        """Number of leads in the database"""
+        self.connect()
+        count = self.cursor.execute("SELECT count(*) FROM leads").fetchone()[0]
+        self.close()
+        return count
+
+    @metrics.instrumented
+    def iter_lead_emails(self):
+        """Yield the normalised email (lowercase, no surrounding spaces) of every lead that has one"""
+        self.connect()
+        try:
+            # Reads only idx_leads_email, in index order
+            cursor = self.conn.execute("SELECT lower(trim(email)) FROM leads "
+                                       "WHERE lower(trim(email)) > '' ORDER BY 1")
+            for row in cursor:
+                yield row[0]
+        finally:
+            self.close()
+
+    @metrics.instrumented
+    def existing_emails(self, emails):
+        """The normalised emails among `emails` that some lead already has, mapped to the first such lead's id"""
+        emails = list(emails)
+        found = {}
+        self.connect()
+        for start in range(0, len(emails), EMAIL_LOOKUP_BATCH):
+            chunk = emails[start:start + EMAIL_LOOKUP_BATCH]
+            self.cursor.execute("SELECT lower(trim(email)), min(lead_id) FROM leads WHERE lower(trim(email)) IN "
+                                f"({','.join('?' * len(chunk))}) GROUP BY 1", chunk)
+            found.update(self.cursor.fetchall())
+        self.close()
+        return found
+
+    def last_lead_id(self):
+        """Id of the newest lead, 0 if there are none"""
+        self.connect()
+        last = self.cursor.execute("SELECT coalesce(max(lead_id), 0) FROM leads").fetchone()[0]
+        self.close()
+        return last
+
+    @metrics.instrumented
+    def iter_leads(self, status=None, industry=None, location=None, source=None,
+                   sort='id', descending=False, after_id=None, limit=None, after_key=None):
+        """
+        Yield leads (rows shaped like get_all_leads) one at a time, filtered
+        by label and ordered by one of LEAD_SORTS. `after_id` continues a
+        listing after that lead (keyset pagination), so every page costs the
+        same however deep it is. `after_key` is that lead's sort value, if
+        known; the lead then needn't be stored in this file.
+        """
+        column = LEAD_SORTS[sort]
+        where, params = [], []
+        for table, field, label in (('lead_statuses', 'status_id', status),
+                                    ('lead_sources', 'source_id', source),
+                                    ('locations', 'location_id', location),
+                                    ('industries', 'industry_id', industry)):
+            if label is None:
+                continue
+            self.connect()
+            self.cursor.execute(f"SELECT code FROM {table} WHERE label=?", (label,))
+            row = self.cursor.fetchone()
+            self.close()
+            if row is None:
+                return  # Label never used, so nothing can match
+            where.append(f"l.{field} = ?")
+            params.append(row[0])
+
+        direction, beyond = ('DESC', '<') if descending else ('ASC', '>')
+        if after_id is not None:
+            if column == 'lead_id':
+                where.append(f"l.lead_id {beyond} ?")
+            elif after_key is not None:
+                where.append(f"(l.{column}, l.lead_id) {beyond} (?, ?)")
+                params.append(after_key)
+            else:
+                # Compare (sort key, id) pairs so ties on the sort key page correctly
+                where.append(f"(l.{column}, l.lead_id) {beyond} "
+                             f"(SELECT {column}, lead_id FROM leads WHERE lead_id = ?)")
+            params.append(after_id)
+
+        order = [f"l.{column} {direction}"]
+        if column != 'lead_id':
+            order.append(f"l.lead_id {direction}")
+
+        query = "SELECT v.* FROM leads l JOIN leads_view v ON v.lead_id = l.lead_id"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY " + ", ".join(order)
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        self.connect()
+        try:
+            # Own cursor, so other calls made while the caller iterates don't reset it
+            yield from self.conn.execute(query, params)
+        finally:
+            self.close()
+
+    @metrics.instrumented
+    @retry_on_busy
     def add_opportunity(self, opp):
         """Add an opportunity to database"""
         self.connect()
         self.cursor.execute('''
-                            INSERT INTO opportunities (lead_id, title, estimated_value, stage,
+                            INSERT INTO opportunities (lead_id, title, estimated_value_cents, stage_id,
                                                        probability, expected_close, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', (opp.lead_id, opp.title, opp.estimated_value, opp.stage,
+                            ''', (opp.lead_id, opp.title, to_cents(opp.estimated_value),
+                                  self.lookup_code('opportunity_stages', opp.stage or 'initial_inquiry'),
                                   opp.probability, opp.expected_close, opp.created_at))
-        self.conn.commit()
         opp_id = self.cursor.lastrowid
+        self.cursor.execute('''
+                            INSERT INTO opportunity_stage_history (opp_id, from_stage_id, to_stage_id, changed_at)
+                            SELECT opp_id, NULL, stage_id, created_at FROM opportunities WHERE opp_id=?
+                            ''', (opp_id,))
+        self._commit()
+        metrics.RECORDS_INSERTED.inc('opportunities')
         self.close()
         return opp_id
 
+    @metrics.instrumented
     def get_all_opportunities(self):
         """Get all opportunities from database"""
         self.connect()
-        self.cursor.execute('SELECT * FROM opportunities')
+        self.cursor.execute('SELECT * FROM opportunities_view ORDER BY opp_id')
         rows = self.cursor.fetchall()
         self.close()
         return rows
 
+    @metrics.instrumented
+    def update_opportunity_stage(self, opp_id, stage, changed_at=None):
+        """Move an opportunity to a new stage; returns True if it changed"""
+        return self.update_opportunity_stages([opp_id], stage, changed_at) == 1
+
+    @metrics.instrumented
+    @retry_on_busy
+    def update_opportunity_stages(self, opp_ids, stage, changed_at=None):
+        """
+        Move many opportunities to a stage in a single transaction
+        Each change is appended to opportunity_stage_history; opportunities
+        already in that stage are left alone. Returns the number changed.
+        """
+        changed_at = changed_at or datetime.now().isoformat()
+        ids = json.dumps(list(opp_ids))
+
+        self.connect()
+        stage_id = self.lookup_code('opportunity_stages', stage)
+        self.cursor.execute('''
+                            INSERT INTO opportunity_stage_history (opp_id, from_stage_id, to_stage_id, changed_at)
+                            SELECT opp_id, stage_id, ?, ?
+                            FROM opportunities
+                            WHERE opp_id IN (SELECT value FROM json_each(?))
+                              AND stage_id != ?
+                            ''', (stage_id, changed_at, ids, stage_id))
+        self.cursor.execute('''
+                            UPDATE opportunities
+                            SET stage_id = ?
+                            WHERE opp_id IN (SELECT value FROM json_each(?))
+                              AND stage_id != ?
+                            ''', (stage_id, ids, stage_id))
+        changed = self.cursor.rowcount
+        self._commit()
+        self.close()
+        return changed
+
+    @metrics.instrumented
+    @retry_on_busy
     def add_quote(self, quote):
         """Add a quote to database"""
         self.connect()
         self.cursor.execute('''
-                            INSERT INTO quotes (opp_id, quote_number, quoted_amount, valid_until, terms, status,
-                                                created_at)
+                            INSERT INTO quotes (opp_id, quote_number, quoted_amount_cents, valid_until, terms,
+                                                status_id, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', (quote.opp_id, quote.quote_number, quote.quoted_amount,
-                                  quote.valid_until, quote.terms, quote.status, quote.created_at))
-        self.conn.commit()
+                            ''', (quote.opp_id, quote.quote_number, to_cents(quote.quoted_amount),
+                                  quote.valid_until, quote.terms,
+                                  self.lookup_code('quote_statuses', quote.status or 'draft'),
+                                  quote.created_at))
         quote_id = self.cursor.lastrowid
+        self.cursor.execute('''
+                            INSERT INTO quote_status_history (quote_id, from_status_id, to_status_id, changed_at)
+                            SELECT quote_id, NULL, status_id, created_at FROM quotes WHERE quote_id=?
+                            ''', (quote_id,))
+        self._commit()
+        metrics.RECORDS_INSERTED.inc('quotes')
         self.close()
         return quote_id
 
+    @metrics.instrumented
     def get_all_quotes(self):
         """Get all quotes from database"""
         self.connect()
-        self.cursor.execute('SELECT * FROM quotes')
+        self.cursor.execute('SELECT * FROM quotes_view ORDER BY quote_id')
         rows = self.cursor.fetchall()
         self.close()
         return rows
 
+    @metrics.instrumented
+    def update_quote_status(self, quote_id, status, changed_at=None):
+        """Change the status of a quote; returns True if it changed"""
+        return self.update_quote_statuses([quote_id], status, changed_at) == 1
+
+    @metrics.instrumented
+    @retry_on_busy
+    def update_quote_statuses(self, quote_ids, status, changed_at=None):
+        """
+        Change the status of many quotes in a single transaction
+        Each change is appended to quote_status_history. Returns the number changed.
+        """
+        changed_at = changed_at or datetime.now().isoformat()
+        ids = json.dumps(list(quote_ids))
+
+        self.connect()
+        status_id = self.lookup_code('quote_statuses', status)
+        self.cursor.execute('''
+                            INSERT INTO quote_status_history (quote_id, from_status_id, to_status_id, changed_at)
+                            SELECT quote_id, status_id, ?, ?
+                            FROM quotes
+                            WHERE quote_id IN (SELECT value FROM json_each(?))
+                              AND status_id != ?
+                            ''', (status_id, changed_at, ids, status_id))
+        self.cursor.execute('''
+                            UPDATE quotes
+                            SET status_id = ?
+                            WHERE quote_id IN (SELECT value FROM json_each(?))
+                              AND status_id != ?
+                            ''', (status_id, ids, status_id))
+        changed = self.cursor.rowcount
+        self._commit()
+        self.close()
+        return changed
+
+    @metrics.instrumented
+    @retry_on_busy
+    def expire_quotes(self, as_of=None):
+        """
+        Mark every draft or sent quote whose valid_until is before `as_of`
+        (YYYY-MM-DD, default today) as expired, in one transaction
+        Returns the number of quotes expired
+        """
+        as_of = as_of or datetime.now().date().isoformat()
+
+        self.connect()
+        open_ids = (self.lookup_code('quote_statuses', 'draft'), self.lookup_code('quote_statuses', 'sent'))
+        expired_id = self.lookup_code('quote_statuses', 'expired')
+
+        # Both statements range-scan idx_quotes_expiry on (status_id, valid_until)
+        self.cursor.execute('''
+                            INSERT INTO quote_status_history (quote_id, from_status_id, to_status_id, changed_at)
+                            SELECT quote_id, status_id, ?, ?
+                            FROM quotes
+                            WHERE status_id IN (?, ?)
+                              AND valid_until < ?
+                            ''', (expired_id, datetime.now().isoformat(), *open_ids, as_of))
+        self.cursor.execute('''
+                            UPDATE quotes
+                            SET status_id = ?
+                            WHERE status_id IN (?, ?)
+                              AND valid_until < ?
+                            ''', (expired_id, *open_ids, as_of))
+        expired = self.cursor.rowcount
+        self._commit()
+        self.close()
+        return expired
+
+    @metrics.instrumented
+    @retry_on_busy
     def add_order(self, order):
         """Add an order to database"""
         self.connect()
         self.cursor.execute('''
-                            INSERT INTO orders (quote_id, status, final_amount, close_date, notes, created_at)
+                            INSERT INTO orders (quote_id, status_id, final_amount_cents, close_date, notes,
+                                                created_at)
                             VALUES (?, ?, ?, ?, ?, ?)
-                            ''', (order.quote_id, order.status, order.final_amount,
-                                  order.close_date, order.notes, order.created_at))
-        self.conn.commit()
+                            ''', (order.quote_id, self.lookup_code('order_statuses', order.status),
+                                  to_cents(order.final_amount), order.close_date, order.notes, order.created_at))
+        self._commit()
+        metrics.RECORDS_INSERTED.inc('orders')
         order_id = self.cursor.lastrowid
         self.close()
         return order_id
 
+    @metrics.instrumented
     def get_all_orders(self):
         """Get all orders from database"""
         self.connect()
-        self.cursor.execute('SELECT * FROM orders')
+        self.cursor.execute('SELECT * FROM orders_view ORDER BY order_id')
         rows = self.cursor.fetchall()
         self.close()
-        return rows
\ No newline at end of file
+        return rows
+
+    @metrics.instrumented
+    def get_record(self, table, record_id):
+        """Get one lead/opportunity/quote/order (a row of its view) by ID, or None"""
+        key, view = RECORDS[table]
+        self.connect()
+        self.cursor.execute(f"SELECT * FROM {view} WHERE {key}=?", (record_id,))
+        row = self.cursor.fetchone()
+        self.close()
+        return row
+
+    @metrics.instrumented
+    def iter_records(self, table, after_id=None, limit=None):
+        """Yield rows of a record view in ID order, continuing after `after_id`"""
+        key, view = RECORDS[table]
+        query, params = f"SELECT * FROM {view}", []
+        if after_id is not None:
+            query += f" WHERE {key} > ?"
+            params.append(after_id)
+        query += f" ORDER BY {key}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        self.connect()
+        try:
+            yield from self.conn.execute(query, params)
+        finally:
+            self.close()
+
+    def record_columns(self, table):
+        """Column names of the rows returned for a record type"""
+        _, view = RECORDS[table]
+        self.connect()
+        self.cursor.execute(f"SELECT * FROM {view} LIMIT 0")
+        columns = [column[0] for column in self.cursor.description]
+        self.close()
+        return columns
+
+    @metrics.instrumented
+    @retry_on_busy
+    def update_lead(self, lead_id, **fields):
+        """
+        Change some fields of a lead (name, email, phone, source, status,
+        location, industry, company_size); returns True if the lead exists
+        """
+        unknown = set(fields) - {'name', 'email', 'phone'} - set(LEAD_LOOKUPS)
+        if unknown:
+            raise ValueError(f"Unknown lead field: {', '.join(sorted(unknown))}")
+        if not fields:
+            return self.get_record('leads', lead_id) is not None
+
+        self.connect()
+        assignments, params = [], []
+        for field, value in fields.items():
+            if field in LEAD_LOOKUPS:
+                assignments.append(f"{field}_id = ?")
+                params.append(self.lookup_code(LEAD_LOOKUPS[field], value))
+            else:
+                assignments.append(f"{field} = ?")
+                params.append(value)
+        self.cursor.execute(f"UPDATE leads SET {', '.join(assignments)} WHERE lead_id=?", params + [lead_id])
+        changed = self.cursor.rowcount
+        self._commit()
+        self.close()
+        return changed == 1
+
+    @metrics.instrumented
+    @retry_on_busy
+    def merge_leads(self, survivor_id, duplicate_ids):
+        """
+        Fold duplicate leads into one, in a single transaction: their
+        opportunities move to the survivor, which also takes over any phone,
+        location, industry or company size it lacks; the duplicates are then
+        deleted. Archived deals (with archive_path set) move too.
+        Returns the number of opportunities moved.
+        """
+        ids = json.dumps([lead_id for lead_id in duplicate_ids if lead_id != survivor_id])
+        self.connect()
+        try:
+            if not self.cursor.execute("SELECT 1 FROM leads WHERE lead_id=?", (survivor_id,)).fetchone():
+                raise ValueError(f"No lead with ID {survivor_id}")
+
+            duplicates = "SELECT value FROM json_each(?)"
+            # Missing fields are taken from the oldest duplicate that has them
+            fields = {'phone': "NULLIF(phone, '')", 'location_id': 'location_id', 'industry_id': 'industry_id',
+                      'company_size_id': 'company_size_id'}
+            assignments = ", ".join(f"{field} = COALESCE({value}, (SELECT {field} FROM leads "
+                                    f"WHERE lead_id IN ({duplicates}) AND {value} IS NOT NULL "
+                                    f"ORDER BY lead_id LIMIT 1), {field})" for field, value in fields.items())
+            self.cursor.execute(f"UPDATE leads SET {assignments} WHERE lead_id = ?",
+                                (ids,) * len(fields) + (survivor_id,))
+            # Walks idx_opportunities_lead once per duplicate
+            self.cursor.execute(f"UPDATE opportunities SET lead_id = ? WHERE lead_id IN ({duplicates})",
+                                (survivor_id, ids))
+            moved = self.cursor.rowcount
+            if self.archive_attached() and self.cursor.execute(
+                    "SELECT 1 FROM archive.sqlite_master WHERE name = 'archived_accounts'").fetchone():
+                self.cursor.execute(f"UPDATE archive.opportunities SET lead_id = ? WHERE lead_id IN ({duplicates})",
+                                    (survivor_id, ids))
+                self.cursor.execute(f'''
+                                    INSERT INTO archive.archived_accounts (lead_id, won_orders, won_cents)
+                                    SELECT ?, SUM(won_orders), SUM(won_cents)
+                                    FROM archive.archived_accounts
+                                    WHERE lead_id IN ({duplicates})
+                                    GROUP BY 1
+                                    ON CONFLICT (lead_id) DO UPDATE SET won_orders = won_orders + excluded.won_orders,
+                                                                        won_cents = won_cents + excluded.won_cents
+                                    ''', (survivor_id, ids))
+                self.cursor.execute(f"DELETE FROM archive.archived_accounts WHERE lead_id IN ({duplicates})", (ids,))
+            self.cursor.execute(f"DELETE FROM leads WHERE lead_id IN ({duplicates})", (ids,))
+            self._commit()
+        except BaseException:
+            if not self.in_transaction:
+                self.rollback()
+            raise
+        finally:
+            self.close()
+        return moved
+
+    @metrics.instrumented
+    def iter_changes(self, after_seq=0, tables=None, limit=None):
+        """
+        Yield change records (seq, table_name, record_id, operation,
+        changed_at) logged after `after_seq`, oldest first, optionally only
+        those of some tables
+        """
+        query = "SELECT seq, table_name, record_id, operation, changed_at FROM changes WHERE seq > ?"
+        params = [after_seq]
+        if tables:
+            query += f" AND table_name IN ({','.join('?' * len(tables))})"
+            params.extend(tables)
+        query += " ORDER BY seq"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        self.connect()
+        try:
+            yield from self.conn.execute(query, params)
+        finally:
+            self.close()
+
+    def last_change_seq(self):
+        """Sequence number of the latest change ever logged (0 if none), compacted or not"""
+        self.connect()
+        row = self.cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        self.close()
+        return row[0] if row else 0
+
+    @contextlib.contextmanager
+    def changes_paused(self):
+        """
+        Leave the writes inside the block out of the change log. Only within
+        a transaction(): the switch is reset before the transaction commits,
+        so other connections keep logging their writes meanwhile.
+        """
+        if not self.in_transaction:
+            raise RuntimeError("changes_paused() needs an enclosing transaction()")
+        self.cursor.execute("UPDATE change_capture SET paused = 1")
+        try:
+            yield self
+        finally:
+            self.cursor.execute("UPDATE change_capture SET paused = 0")
+
+    def consumer_position(self, name):
+        """Sequence number of the last change a named consumer has processed (0 if new)"""
+        self.connect()
+        row = self.cursor.execute("SELECT seq FROM change_consumers WHERE name = ?", (name,)).fetchone()
+        self.close()
+        return row[0] if row else 0
+
+    def change_consumers(self):
+        """{consumer name: seq of the last change it processed}"""
+        self.connect()
+        consumers = dict(self.cursor.execute("SELECT name, seq FROM change_consumers ORDER BY name").fetchall())
+        self.close()
+        return consumers
+
+    @retry_on_busy
+    def set_consumer_position(self, name, seq):
+        """Record that a named consumer has processed every change up to `seq`"""
+        self.connect()
+        self.cursor.execute('''
+                            INSERT INTO change_consumers (name, seq, updated_at)
+                            VALUES (?, ?, strftime('%Y-%m-%dT%H:%M:%S', 'now'))
+                            ON CONFLICT (name) DO UPDATE SET seq = excluded.seq, updated_at = excluded.updated_at
+                            ''', (name, seq))
+        self._commit()
+        self.close()
+
+    @metrics.instrumented
+    def compact_changes(self, up_to=None, batch_size=COMPACT_BATCH):
+        """
+        Delete change records every registered consumer has processed, and
+        none after `up_to` if given; without consumers, only `up_to` bounds
+        it. Deletes batch_size records per transaction; returns how many.
+        """
+        self.connect()
+        oldest, consumers = self.cursor.execute("SELECT min(seq), count(*) FROM change_consumers").fetchone()
+        self.close()
+        limit = oldest if consumers else None
+        if up_to is not None:
+            limit = up_to if limit is None else min(limit, up_to)
+        if limit is None:
+            return 0
+
+        deleted = 0
+        while True:
+            with self.transaction():
+                self.cursor.execute("DELETE FROM changes WHERE seq IN "
+                                    "(SELECT seq FROM changes WHERE seq <= ? ORDER BY seq LIMIT ?)",
+                                    (limit, batch_size))
+                count = self.cursor.rowcount
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+    @metrics.instrumented
+    @retry_on_busy
+    def delete_record(self, table, record_id):
+        """
+        Delete one lead/opportunity/quote/order, with its stage or status
+        history; returns True if it existed. Records that others still
+        refer to (e.g. a lead with opportunities) raise sqlite3.IntegrityError.
+        """
+        key, _ = RECORDS[table]
+        self.connect()
+        try:
+            if table == 'opportunities':
+                self.cursor.execute("DELETE FROM opportunity_stage_history WHERE opp_id=?", (record_id,))
+            elif table == 'quotes':
+                self.cursor.execute("DELETE FROM quote_status_history WHERE quote_id=?", (record_id,))
+            self.cursor.execute(f"DELETE FROM {table} WHERE {key}=?", (record_id,))
+            deleted = self.cursor.rowcount
+            self._commit()
+        except sqlite3.IntegrityError:
+            if not self.in_transaction:
+                self.rollback()
+            raise
+        finally:
+            self.close()
+        return deleted == 1
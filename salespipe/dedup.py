@@ -0,0 +1,162 @@
+"""
+Duplicate lead detection for Sales Pipeline Manager
+The same company often arrives several times, from a trade show, LinkedIn
+and the website form, with slightly different names and emails. Comparing
+every lead with every other one is quadratic, so leads are first grouped by
+blocking keys (email domain, normalized name tokens, last phone digits) and
+only leads sharing a key are scored. Keys shared by more than
+MAX_BLOCK_SIZE leads (a common word, a free mail domain) say little and
+are skipped, which keeps the work close to linear in the number of leads.
+
+    groups = find_duplicates(Database("sales_pipeline.db"))
+    for group in groups:
+        db.merge_leads(group.lead_ids[0], group.lead_ids[1:])
+"""
+import difflib
+import re
+import unicodedata
+
+# Pairs scoring at least this are reported as duplicates
+THRESHOLD = 0.6
+
+# Blocks larger than this are skipped; their key is too common to tell leads apart
+MAX_BLOCK_SIZE = 100
+
+# Weights of the score: name similarity, same company email domain, same phone number.
+# The same email address always scores 1.
+NAME_WEIGHT = 0.6
+DOMAIN_WEIGHT = 0.25
+PHONE_WEIGHT = 0.15
+
+# Legal forms and filler words left out of names before comparing them
+NAME_STOPWORDS = {
+    'gmbh', 'ag', 'kg', 'ohg', 'ug', 'co', 'srl', 'spa', 'snc', 'sa', 'sas', 'sarl', 'bv', 'nv', 'vof',
+    'ltd', 'limited', 'inc', 'llc', 'plc', 'corp', 'company', 'group', 'the', 'and', 'und', 'et',
+}
+
+# Mail providers shared by unrelated people; not evidence of the same company
+FREE_MAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'yahoo.com', 'yahoo.de', 'yahoo.it', 'yahoo.fr', 'hotmail.com', 'hotmail.it',
+    'hotmail.fr', 'outlook.com', 'live.com', 'msn.com', 'icloud.com', 'me.com', 'aol.com', 'gmx.de', 'gmx.net',
+    'web.de', 't-online.de', 'libero.it', 'virgilio.it', 'orange.fr', 'free.fr', 'laposte.net', 'wanadoo.fr',
+    'telenet.be', 'skynet.be', 'ziggo.nl', 'kpnmail.nl', 'proton.me', 'protonmail.com',
+}
+
+# Trailing phone digits compared, so +49 30 1234567 matches 030 1234567
+PHONE_DIGITS = 8
+
+
+class Lead:
+    """A lead's fields as compared for deduplication"""
+
+    __slots__ = ('lead_id', 'name', 'email', 'domain', 'phone')
+
+    def __init__(self, lead_id, name, email, phone):
+        self.lead_id = lead_id
+        self.name = normalize_name(name)
+        self.email = (email or '').strip().lower()
+        domain = self.email.rpartition('@')[2]
+        self.domain = domain if domain and domain not in FREE_MAIL_DOMAINS else None
+        digits = re.sub(r'\D', '', phone or '')
+        self.phone = digits[-PHONE_DIGITS:] if len(digits) >= PHONE_DIGITS else None
+
+    def blocking_keys(self):
+        keys = {('name', self.name)} if self.name else set()
+        keys.update(('token', token) for token in self.name.split() if len(token) >= 3)
+        if self.domain:
+            keys.add(('domain', self.domain))
+        if self.phone:
+            keys.add(('phone', self.phone))
+        return keys
+
+
+class DuplicateGroup:
+    """Leads that are probably the same company; lead_ids are sorted, oldest first"""
+
+    __slots__ = ('lead_ids', 'score')
+
+    def __init__(self, lead_ids, score):
+        self.lead_ids = sorted(lead_ids)
+        self.score = score  # Best pair score within the group
+
+    def __repr__(self):
+        return f"DuplicateGroup({self.lead_ids}, score={self.score:.2f})"
+
+
+def normalize_name(name):
+    """'Auto-Mech GmbH & Co. KG' -> 'auto mech': lowercase ASCII words without legal forms"""
+    text = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode().lower()
+    text = text.replace('.', '')  # S.A. -> sa
+    return " ".join(word for word in re.findall(r'[a-z0-9]+', text) if word not in NAME_STOPWORDS)
+
+
+def score(a, b):
+    """Similarity of two leads between 0 and 1"""
+    if a.email and a.email == b.email:
+        return 1.0
+    names = 0.0
+    if a.name and b.name:
+        if a.name == b.name or a.name.replace(" ", "") == b.name.replace(" ", ""):
+            names = 1.0
+        else:
+            matcher = difflib.SequenceMatcher(None, a.name, b.name)
+            if matcher.real_quick_ratio() >= 0.5 and matcher.quick_ratio() >= 0.5:
+                names = matcher.ratio()
+    return (NAME_WEIGHT * names
+            + DOMAIN_WEIGHT * (a.domain is not None and a.domain == b.domain)
+            + PHONE_WEIGHT * (a.phone is not None and a.phone == b.phone))
+
+
+def _leads(db):
+    """Every lead of the database, as dedup Leads"""
+    db.connect()
+    try:
+        for row in db.conn.execute("SELECT lead_id, name, email, phone FROM leads"):
+            yield Lead(*row)
+    finally:
+        db.close()
+
+
+def find_duplicates(db, threshold=THRESHOLD, max_block_size=MAX_BLOCK_SIZE):
+    """
+    Groups of leads that probably are the same company, most certain first
+    Pairs sharing a blocking key and scoring at least `threshold` are
+    joined; groups follow chains of such pairs.
+    """
+    leads = {}
+    blocks = {}
+    for lead in _leads(db):
+        leads[lead.lead_id] = lead
+        for key in lead.blocking_keys():
+            block = blocks.setdefault(key, [])
+            if len(block) <= max_block_size:
+                block.append(lead.lead_id)
+
+    parent = {}
+
+    def root(lead_id):
+        while parent.get(lead_id, lead_id) != lead_id:
+            parent[lead_id] = parent.get(parent[lead_id], parent[lead_id])  # Path halving
+            lead_id = parent[lead_id]
+        return lead_id
+
+    # Pairs sharing several keys are scored once per key; cheaper than remembering every pair
+    best = {}
+    for block in blocks.values():
+        if len(block) < 2 or len(block) > max_block_size:
+            continue
+        for i, first in enumerate(block):
+            for second in block[i + 1:]:
+                similarity = score(leads[first], leads[second])
+                if similarity >= threshold:
+                    a, b = root(first), root(second)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+                    best[first] = max(best.get(first, 0), similarity)
+                    best[second] = max(best.get(second, 0), similarity)
+
+    groups = {}
+    for lead_id in best:
+        groups.setdefault(root(lead_id), []).append(lead_id)
+    return sorted((DuplicateGroup(ids, max(best[lead_id] for lead_id in ids)) for ids in groups.values()),
+                  key=lambda group: (-group.score, group.lead_ids[0]))
@@ -0,0 +1,330 @@
+"""
+Synthetic data generator for Sales Pipeline Manager
+Produces any number of leads with their opportunities, quotes, orders and
+stage/status history, for load tests and benchmarks:
+
+    python main.py generate --leads 1000000 --seed 7
+    python main.py generate --leads 10000000 --sharded --workers 4
+
+Rows are written with executemany, one transaction per chunk of leads.
+Every block of SEED_BLOCK leads draws from its own RNG seeded with (seed,
+market, block), so the data only depends on the seed and the distributions,
+never on the chunk size or how many processes produced it. With sharded=True each market's file (see
+salespipe.sharding) is generated by a separate process.
+"""
+import bisect
+import concurrent.futures
+import itertools
+import json
+import random
+from datetime import datetime, timedelta
+
+from salespipe.database import Database, RECORDS
+from salespipe.models import (LEAD_STATUSES, LEAD_SOURCES, LOCATIONS, INDUSTRIES, COMPANY_SIZES,
+                              OPPORTUNITY_STAGES, QUOTE_STATUSES, ORDER_STATUSES)
+
+# Leads written per transaction
+CHUNK_SIZE = 50_000
+
+# Leads drawn from one RNG; fixed, so the data doesn't depend on CHUNK_SIZE
+SEED_BLOCK = 1000
+
+# Default shape of the data; every key can be overridden (see generate())
+DEFAULT_DISTRIBUTIONS = {
+    # Relative weights
+    'industries': {'automotive': 35, 'industrial_components': 25, 'food_beverage': 20, 'logistics': 20},
+    'locations': {'Germany': 40, 'Italy': 25, 'France': 20, 'Benelux': 15},
+    'sources': {'website': 30, 'referral': 20, 'linkedin': 20, 'trade_show': 15, 'cold_call': 10, 'manual': 5},
+    'company_sizes': {'small': 50, 'medium': 35, 'large': 15},
+    # Status of leads that never became an opportunity
+    'lead_statuses': {'new': 40, 'contacted': 35, 'disqualified': 15, 'lost': 10},
+    # Stage an opportunity has reached, among those its funnel allows
+    'stages': {'initial_inquiry': 30, 'qualification': 25, 'proposal_development': 20, 'negotiation': 15,
+               'order_confirmation': 6, 'delivery': 4},
+    # Status of quotes whose deal is still open
+    'open_quote_statuses': {'draft': 20, 'sent': 60, 'expired': 20},
+    # Funnel: share of leads with an opportunity, of opportunities with a
+    # quote, of quotes closed with an order, and of orders won
+    'opportunity_rate': 0.4,
+    'quote_rate': 0.6,
+    'acceptance_rate': 0.5,
+    'win_rate': 0.4,
+    # Leads are created on days spread over [start_date, start_date + days)
+    'start_date': '2023-01-01',
+    'days': 730,
+    # Opportunity value in euros, and quote / order amounts as a share of it
+    'min_value': 5_000,
+    'max_value': 500_000,
+    'discount': [0.8, 1.0],
+}
+
+# Win probability recorded for an opportunity at each stage
+STAGE_PROBABILITY = {'initial_inquiry': 10, 'qualification': 25, 'proposal_development': 50,
+                     'negotiation': 70, 'order_confirmation': 90, 'delivery': 100}
+
+# Stages an opportunity can be at, by how far its funnel went
+STAGES_BY_FUNNEL = {
+    'unquoted': ('initial_inquiry', 'qualification', 'proposal_development'),
+    'quoted': ('proposal_development', 'negotiation'),
+    'won': ('order_confirmation', 'delivery'),
+}
+
+# Lookup tables and their known labels
+LOOKUPS = (('industries', INDUSTRIES), ('locations', LOCATIONS), ('lead_sources', LEAD_SOURCES),
+           ('company_sizes', COMPANY_SIZES), ('lead_statuses', LEAD_STATUSES),
+           ('opportunity_stages', OPPORTUNITY_STAGES), ('quote_statuses', QUOTE_STATUSES),
+           ('order_statuses', ORDER_STATUSES))
+
+# Labels checked against the known values, so a typo fails before any row is written
+KNOWN_LABELS = {'industries': INDUSTRIES, 'locations': LOCATIONS, 'sources': LEAD_SOURCES,
+                'company_sizes': COMPANY_SIZES, 'lead_statuses': LEAD_STATUSES, 'stages': OPPORTUNITY_STAGES,
+                'open_quote_statuses': QUOTE_STATUSES}
+
+
+def parse_weights(text):
+    """'automotive=3,logistics=1' -> {'automotive': 3.0, 'logistics': 1.0}"""
+    weights = {}
+    for item in text.split(','):
+        label, sep, weight = item.partition('=')
+        if not sep:
+            raise ValueError(f"Expected label=weight, got {item!r}")
+        weights[label.strip()] = float(weight)
+    return weights
+
+
+def distributions(overrides=None):
+    """DEFAULT_DISTRIBUTIONS with `overrides` applied and checked"""
+    result = json.loads(json.dumps(DEFAULT_DISTRIBUTIONS))
+    for key, value in (overrides or {}).items():
+        if key not in result:
+            raise ValueError(f"Unknown distribution {key!r}; expected one of: {', '.join(result)}")
+        result[key] = value
+    for key, known in KNOWN_LABELS.items():
+        unknown = set(result[key]) - set(known)
+        if unknown:
+            raise ValueError(f"Unknown {key}: {', '.join(sorted(unknown))}")
+        if not any(weight > 0 for weight in result[key].values()):
+            raise ValueError(f"No positive weight in {key}")
+    for key in ('opportunity_rate', 'quote_rate', 'acceptance_rate', 'win_rate'):
+        if not 0 <= result[key] <= 1:
+            raise ValueError(f"{key} must be between 0 and 1")
+    return result
+
+
+class _Picker:
+    """Weighted random choice from a {label: weight} dict, by bisecting cumulative weights"""
+
+    def __init__(self, weights, allowed=None):
+        items = [(label, weight) for label, weight in weights.items()
+                 if weight > 0 and (allowed is None or label in allowed)]
+        if not items:
+            # Funnel states the weights leave out still need a value
+            items = [(label, 1) for label in allowed]
+        self.labels = [label for label, _ in items]
+        self.cumulative = list(itertools.accumulate(weight for _, weight in items))
+
+    def __call__(self, rng):
+        return self.labels[bisect.bisect(self.cumulative, rng.random() * self.cumulative[-1])]
+
+
+def split(total, weights):
+    """Share `total` out by weight in whole numbers (largest remainders), keeping the order of `weights`"""
+    weight_sum = sum(weights.values())
+    exact = {label: total * weight / weight_sum for label, weight in weights.items()}
+    shares = {label: int(value) for label, value in exact.items()}
+    for label in sorted(exact, key=lambda label: shares[label] - exact[label])[:total - sum(shares.values())]:
+        shares[label] += 1
+    return shares
+
+
+class _Chunk:
+    """Rows of one chunk of leads and their funnels"""
+
+    def __init__(self, dist, codes, rngs, first_ids, leads, location):
+        self.dist, self.codes = dist, codes
+        self.lead_id, self.opp_id, self.quote_id = first_ids
+        self.leads, self.opportunities, self.quotes, self.orders = [], [], [], []
+        self.stage_history, self.status_history = [], []
+        self.start = datetime.fromisoformat(dist['start_date'])
+        self.pick = {key: _Picker(dist[key]) for key in ('industries', 'locations', 'sources', 'company_sizes',
+                                                          'lead_statuses', 'open_quote_statuses')}
+        self.pick_stage = {funnel: _Picker(dist['stages'], stages) for funnel, stages in STAGES_BY_FUNNEL.items()}
+        for self.rng in itertools.islice(rngs, leads):
+            self._lead(location)
+
+    def _time(self, moment, min_days, max_days):
+        return moment + timedelta(days=self.rng.randint(min_days, max_days), minutes=self.rng.randrange(600))
+
+    def _lead(self, location):
+        dist, codes, rng = self.dist, self.codes, self.rng
+        self.lead_id += 1
+        created = self.start + timedelta(days=rng.randrange(dist['days']), minutes=rng.randrange(8 * 60, 18 * 60))
+        status = None if rng.random() < dist['opportunity_rate'] else self.pick['lead_statuses'](rng)
+        self.leads.append([self.lead_id, f"Company {self.lead_id}", f"contact@company{self.lead_id}.example",
+                           f"+{rng.randint(30, 49)} {rng.randrange(10 ** 9):09d}",
+                           codes['lead_sources'][self.pick['sources'](rng)],
+                           codes['lead_statuses'][status] if status else None,
+                           codes['locations'][location or self.pick['locations'](rng)],
+                           codes['industries'][self.pick['industries'](rng)],
+                           codes['company_sizes'][self.pick['company_sizes'](rng)],
+                           created.isoformat(timespec='seconds')])
+        if status is None:
+            self.leads[-1][5] = codes['lead_statuses'][self._opportunity(created)]
+
+    def _opportunity(self, lead_created):
+        """Add an opportunity with its funnel; returns the status its lead ends up with"""
+        dist, codes, rng = self.dist, self.codes, self.rng
+        self.opp_id += 1
+        created = self._time(lead_created, 0, 30)
+        quoted = rng.random() < dist['quote_rate']
+        closed = quoted and rng.random() < dist['acceptance_rate']
+        won = closed and rng.random() < dist['win_rate']
+        stage = self.pick_stage['won' if won else 'quoted' if quoted else 'unquoted'](rng)
+        value = rng.randrange(dist['min_value'], dist['max_value'] + 1) * 100
+        self.opportunities.append((self.opp_id, self.leads[-1][0], f"Deal {self.opp_id}", value,
+                                   codes['opportunity_stages'][stage], 0 if closed and not won else
+                                   STAGE_PROBABILITY[stage], (created + timedelta(days=90)).date().isoformat(),
+                                   created.isoformat(timespec='seconds')))
+
+        # One history row per stage passed through
+        moment, previous = created, None
+        quote_time = None
+        for current in OPPORTUNITY_STAGES[:OPPORTUNITY_STAGES.index(stage) + 1]:
+            if previous is not None:
+                moment = self._time(moment, 3, 30)
+            self.stage_history.append((self.opp_id, codes['opportunity_stages'][previous] if previous else None,
+                                       codes['opportunity_stages'][current], moment.isoformat(timespec='seconds')))
+            if current == 'proposal_development':
+                quote_time = moment
+            previous = current
+
+        if quoted:
+            self._quote(value, quote_time or moment, closed, won)
+        return 'converted' if won else 'lost' if closed else 'qualified'
+
+    def _quote(self, value, created, closed, won):
+        dist, codes, rng = self.dist, self.codes, self.rng
+        self.quote_id += 1
+        low, high = dist['discount']
+        amount = int(value * rng.uniform(low, high))
+        status = ('accepted' if won else 'rejected') if closed else self.pick['open_quote_statuses'](rng)
+        self.quotes.append((self.quote_id, self.opportunities[-1][0], f"Q-{self.quote_id:010d}", amount,
+                            (created + timedelta(days=30)).date().isoformat(), "Net 30",
+                            codes['quote_statuses'][status], created.isoformat(timespec='seconds')))
+        self.status_history.append((self.quote_id, None, codes['quote_statuses']['draft'],
+                                    created.isoformat(timespec='seconds')))
+        if status != 'draft':
+            sent = self._time(created, 1, 5)
+            self.status_history.append((self.quote_id, codes['quote_statuses']['draft'],
+                                        codes['quote_statuses']['sent'], sent.isoformat(timespec='seconds')))
+            if status != 'sent':
+                decided = self._time(sent, 5, 40)
+                self.status_history.append((self.quote_id, codes['quote_statuses']['sent'],
+                                            codes['quote_statuses'][status], decided.isoformat(timespec='seconds')))
+        if closed:
+            close = self._time(created, 7, 60)
+            self.orders.append((self.quote_id, codes['order_statuses']['won' if won else 'lost'],
+                                int(amount * rng.uniform(low, 1.0)) if won else 0, close.date().isoformat(),
+                                close.isoformat(timespec='seconds')))
+
+
+def _lead_rngs(seed, location, leads):
+    """The RNG of each of `leads` leads in turn, a new one every SEED_BLOCK leads"""
+    for block, first in enumerate(range(0, leads, SEED_BLOCK)):
+        rng = random.Random(f"{seed}/{location or ''}/{block}")
+        yield from itertools.repeat(rng, min(SEED_BLOCK, leads - first))
+
+
+def _write(db, chunk):
+    """Insert the rows of a chunk through the open transaction"""
+    cursor = db.cursor
+    cursor.executemany('''
+                       INSERT INTO leads (lead_id, name, email, phone, source_id, status_id, location_id,
+                                          industry_id, company_size_id, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ''', chunk.leads)
+    cursor.executemany('''
+                       INSERT INTO opportunities (opp_id, lead_id, title, estimated_value_cents, stage_id,
+                                                  probability, expected_close, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                       ''', chunk.opportunities)
+    cursor.executemany('''
+                       INSERT INTO opportunity_stage_history (opp_id, from_stage_id, to_stage_id, changed_at)
+                       VALUES (?, ?, ?, ?)
+                       ''', chunk.stage_history)
+    cursor.executemany('''
+                       INSERT INTO quotes (quote_id, opp_id, quote_number, quoted_amount_cents, valid_until, terms,
+                                           status_id, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                       ''', chunk.quotes)
+    cursor.executemany('''
+                       INSERT INTO quote_status_history (quote_id, from_status_id, to_status_id, changed_at)
+                       VALUES (?, ?, ?, ?)
+                       ''', chunk.status_history)
+    cursor.executemany('''
+                       INSERT INTO orders (quote_id, status_id, final_amount_cents, close_date, created_at)
+                       VALUES (?, ?, ?, ?, ?)
+                       ''', chunk.orders)
+
+
+def generate(db_path, leads, seed=0, overrides=None, location=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Append `leads` generated leads with their funnels to a database
+    `overrides` replaces entries of DEFAULT_DISTRIBUTIONS; `location` puts
+    every lead in one market. progress(done, total) is called after each
+    chunk. Returns the number of records written per table.
+    """
+    dist = distributions(overrides)
+    db = Database(db_path)
+    db.create_tables()
+    counts = dict.fromkeys(RECORDS, 0)
+
+    db.open_session()
+    try:
+        # Bigger page cache: index inserts at millions of rows stay in memory
+        db.cursor.execute("PRAGMA cache_size = -262144")
+        with db.transaction():
+            codes = {table: {label: db.lookup_code(table, label) for label in labels} for table, labels in LOOKUPS}
+
+        rngs = _lead_rngs(seed, location, leads)
+        for first in range(0, leads, chunk_size):
+            # Synthetic rows stay out of the change log, which would double the writes
+            with db.transaction(), db.changes_paused():
+                # IDs continue after the highest ever handed out (AUTOINCREMENT's sqlite_sequence)
+                first_ids = [db.cursor.execute("SELECT IFNULL(MAX(seq), 0) FROM sqlite_sequence WHERE name = ?",
+                                               (table,)).fetchone()[0] for table in ('leads', 'opportunities',
+                                                                                     'quotes')]
+                chunk = _Chunk(dist, codes, rngs, first_ids, min(chunk_size, leads - first), location)
+                _write(db, chunk)
+            for table, rows in zip(RECORDS, (chunk.leads, chunk.opportunities, chunk.quotes, chunk.orders)):
+                counts[table] += len(rows)
+            if progress:
+                progress(first + len(chunk.leads), leads)
+        db.cursor.execute("ANALYZE")
+    finally:
+        db.close_session()
+    return counts
+
+
+def generate_sharded(db_path, leads, seed=0, overrides=None, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Generate leads into the per-market files of a ShardedDatabase, one
+    process per market (at most `workers` at a time). Leads are shared out
+    by the location weights. Returns the records written per table.
+    """
+    from salespipe.sharding import ShardedDatabase, shard_path
+
+    dist = distributions(overrides)
+    sharded = ShardedDatabase(db_path)
+    sharded.create_tables()
+    sharded.close()
+
+    shares = split(leads, {market: dist['locations'].get(market, 0) for market in LOCATIONS})
+    counts = dict.fromkeys(RECORDS, 0)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(generate, shard_path(db_path, market), share, seed, overrides, market, chunk_size)
+                for market, share in shares.items() if share]
+        for job in jobs:
+            for table, count in job.result().items():
+                counts[table] += count
+    return counts
@@ -0,0 +1,281 @@
+"""
+Operational metrics for Sales Pipeline Manager
+A small registry of counters, histograms and gauges in the Prometheus text
+exposition format. Database, Analytics and CSVHandler record into the
+process-wide `registry`: latency of every public operation, records
+inserted, analytics cache hits and misses, CSV rows, and the size of each
+database file and its WAL.
+
+The API server serves it at GET /metrics; a command run with
+`python main.py --metrics-file PATH ...` writes it for node_exporter's
+textfile collector. Tracing hooks get a Span around each operation:
+
+    metrics.add_span_hooks(start=lambda span: ..., end=lambda span: ...)
+"""
+import functools
+import math
+import os
+import threading
+import time
+import types
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Content type of render() output, for HTTP responses
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic count per combination of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Distribution of observed values (e.g. seconds) in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values = {}  # labels -> [count per bucket..., sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+    def count(self, *labels):
+        counts = self._values.get(labels)
+        return sum(counts[:-1]) if counts else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, list(counts)) for labels, counts in self._values.items())
+        for labels, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                yield f"{self.name}_bucket", _labels(self.labelnames, labels, [('le', _number(bound))]), total
+            yield f"{self.name}_sum", _labels(self.labelnames, labels), counts[-1]
+            yield f"{self.name}_count", _labels(self.labelnames, labels), total
+
+
+class Gauge:
+    """Values read when the registry is rendered: collect() returns {label values: value}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), collect=dict):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in sorted(self.collect().items()):
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Registry:
+    """Named metrics, rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Write the metrics to a file atomically, as the textfile collector expects"""
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temporary, path)
+
+
+# Database files whose size is reported
+_database_files = set()
+
+
+def watch_database(path):
+    """Report the size of a database file (and its WAL) from now on"""
+    if path and path != ':memory:' and not str(path).startswith('file:'):
+        _database_files.add(os.path.abspath(path))
+
+
+def _file_sizes():
+    sizes = {}
+    for path in list(_database_files):
+        for file, name in (('main', path), ('wal', path + '-wal')):
+            try:
+                sizes[(path, file)] = os.path.getsize(name)
+            except OSError:
+                pass
+    return sizes
+
+
+def _cache_hit_ratios():
+    totals = {}
+    for (report, result), count in list(ANALYTICS_CACHE._values.items()):
+        hits, requests = totals.get(report, (0, 0))
+        totals[report] = (hits + (count if result == 'hit' else 0), requests + count)
+    return {(report,): hits / requests for report, (hits, requests) in totals.items() if requests}
+
+
+registry = Registry()
+
+OPERATION_SECONDS = registry.register(Histogram(
+    'salespipe_operation_seconds', "Duration of Database, Analytics and CSVHandler operations", ['operation']))
+OPERATION_ERRORS = registry.register(Counter(
+    'salespipe_operation_errors_total', "Operations that raised an exception", ['operation']))
+RECORDS_INSERTED = registry.register(Counter(
+    'salespipe_records_inserted_total', "Records added to the database", ['entity']))
+CSV_ROWS = registry.register(Counter(
+    'salespipe_csv_rows_total', "Lead rows read from or written to CSV files", ['direction']))
+ANALYTICS_CACHE = registry.register(Counter(
+    'salespipe_analytics_cache_requests_total', "Report requests answered from the cache (hit) or not (miss)",
+    ['report', 'result']))
+registry.register(Gauge(
+    'salespipe_analytics_cache_hit_ratio', "Share of report requests answered from the cache", ['report'],
+    _cache_hit_ratios))
+registry.register(Gauge(
+    'salespipe_database_file_bytes', "Size of each database file and of its write-ahead log", ['path', 'file'],
+    _file_sizes))
+
+
+class Span:
+    """
+    One run of an operation, as seen by tracing hooks: start hooks get it
+    before the operation runs, end hooks after, with `seconds` and `error`
+    (the exception raised, or None) filled in. Hooks may keep their own
+    state in `context`.
+    """
+
+    __slots__ = ('name', 'started', 'seconds', 'error', 'context')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.error = None
+        self.context = None
+
+
+_start_hooks = []
+_end_hooks = []
+
+
+def add_span_hooks(start=None, end=None):
+    """Call start(span) before and end(span) after every instrumented operation"""
+    if start:
+        _start_hooks.append(start)
+    if end:
+        _end_hooks.append(end)
+
+
+def remove_span_hooks(start=None, end=None):
+    if start in _start_hooks:
+        _start_hooks.remove(start)
+    if end in _end_hooks:
+        _end_hooks.remove(end)
+
+
+def _finish(span, error=None):
+    span.seconds = time.perf_counter() - span.started
+    span.error = error
+    OPERATION_SECONDS.observe(span.seconds, span.name)
+    if error is not None:
+        OPERATION_ERRORS.inc(span.name)
+    for hook in _end_hooks:
+        hook(span)
+
+
+def _iterate(span, rows):
+    """Pass through a generator's items, finishing the span when it is exhausted or closed"""
+    try:
+        yield from rows
+    except BaseException as e:
+        _finish(span, e if isinstance(e, Exception) else None)
+        raise
+    _finish(span)
+
+
+def instrumented(method):
+    """
+    Time a public operation into salespipe_operation_seconds and run the span
+    hooks around it. Generators are timed until they are used up.
+    """
+    name = method.__qualname__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        span = Span(name)
+        for hook in _start_hooks:
+            hook(span)
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            _finish(span, e)
+            raise
+        if isinstance(result, types.GeneratorType):
+            return _iterate(span, result)
+        _finish(span)
+        return result
+
+    return wrapper
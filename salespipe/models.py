@@ -3,6 +3,75 @@ Data models for Sales Pipeline Manager - P.I.P.E. Industrial Systems
 Complete sales funnel: Lead → Opportunity → Quote → Order
 """
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from functools import total_ordering
+
+# Known values of the enumerated columns. The database stores them as integer
+# codes in small lookup tables, seeded in this order (first value = code 1).
+LEAD_STATUSES = ('new', 'contacted', 'qualified', 'disqualified', 'converted', 'lost')
+LEAD_SOURCES = ('manual', 'web', 'website', 'referral', 'linkedin', 'trade_show', 'cold_call', 'import')
+LOCATIONS = ('Germany', 'Italy', 'France', 'Benelux')
+INDUSTRIES = ('automotive', 'industrial_components', 'food_beverage', 'logistics')
+COMPANY_SIZES = ('small', 'medium', 'large')
+OPPORTUNITY_STAGES = ('initial_inquiry', 'qualification', 'proposal_development',
+                      'negotiation', 'order_confirmation', 'delivery')
+QUOTE_STATUSES = ('draft', 'sent', 'accepted', 'rejected', 'expired')
+ORDER_STATUSES = ('won', 'lost')
+
+
+@total_ordering
+class Money:
+    """Exact EUR amount held as an integer number of cents"""
+
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        self.cents = int(cents)
+
+    @classmethod
+    def from_amount(cls, amount):
+        """Build from a euro amount (int, float, str, Decimal or Money), rounding half-up to the cent"""
+        if isinstance(amount, Money):
+            return amount
+        cents = (Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+        return cls(cents)
+
+    def to_decimal(self):
+        """Return the amount in euros as an exact Decimal"""
+        return Decimal(self.cents).scaleb(-2)
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __add__(self, other):
+        return Money(self.cents + Money.from_amount(other).cents)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Money(self.cents - Money.from_amount(other).cents)
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec)
+
+    def __str__(self):
+        return f"€{self.to_decimal():,.2f}"
+
+    def __repr__(self):
+        return f"Money({self.cents})"
 
 
 class Lead:
@@ -0,0 +1,266 @@
+"""
+Query instrumentation for Sales Pipeline Manager
+When enabled, connections opened by Database time every statement they run
+and count the rows it returned or changed, per operation (the salespipe
+function that ran it, e.g. Database.add_lead) and per statement. Statements
+slower than a threshold are logged with their EXPLAIN QUERY PLAN.
+
+Off by default, and then free: Database opens plain sqlite3 connections.
+Turn it on with the environment, which also prints a summary at exit:
+
+    SALESPIPE_PROFILE=1 SALESPIPE_SLOW_QUERY_MS=50 python main.py analytics --type industry
+
+or for one command with `python main.py --profile ...`, or from code with
+enable() / profiler.report().
+"""
+import atexit
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Statements at least this slow are logged with their query plan
+SLOW_QUERY_MS = 100.0
+
+# Functions whose statements are charged to whoever called them
+CHARGED_TO_CALLER = {
+    'connect', 'close', 'open_session', 'close_session', 'rollback', 'transaction', '_commit',
+    'lookup_code', 'data_state', '_find', '_archived', '_archive_totals', '_stage_histories',
+}
+
+# Statements EXPLAIN QUERY PLAN can describe
+PLANNABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# The active Profiler, or None while instrumentation is off
+profiler = None
+
+
+class Profiler:
+    """Counters of the statements run through instrumented connections"""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self.operations = {}  # operation -> [queries, rows, seconds]
+        self.statements = {}  # statement text -> [queries, rows, seconds, slowest]
+        self.slow_queries = []  # (operation, statement, milliseconds, plan), oldest first
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, operation, sql, queries, rows, seconds):
+        """Count (part of) one run of a statement"""
+        with self._lock:
+            counters = self.operations.setdefault(operation, [0, 0, 0.0])
+            counters[0] += queries
+            counters[1] += rows
+            counters[2] += seconds
+            counters = self.statements.setdefault(sql, [0, 0, 0.0, 0.0])
+            counters[0] += queries
+            counters[1] += rows
+            counters[2] += seconds
+
+    def check(self, run, connection):
+        """Note a statement run's time so far; log it with its plan once it turns out slow"""
+        operation, sql, parameters, seconds, logged = run
+        with self._lock:
+            counters = self.statements[sql]
+            counters[3] = max(counters[3], seconds)
+        milliseconds = seconds * 1000
+        if logged or milliseconds < self.slow_ms:
+            return
+
+        run[4] = True
+        plan = explain(connection, sql, parameters)
+        with self._lock:
+            self.slow_queries.append((operation, sql, milliseconds, plan))
+            del self.slow_queries[:-100]
+
+        import logging
+        logging.getLogger(__name__).warning("Slow query (%.1f ms) in %s: %s\n%s",
+                                            milliseconds, operation, sql, plan)
+
+    def report(self, limit=15):
+        """Summary tables: busiest operations and statements, and the slow query count"""
+        with self._lock:
+            operations = sorted(self.operations.items(), key=lambda item: item[1][2], reverse=True)
+            statements = sorted(self.statements.items(), key=lambda item: item[1][2], reverse=True)
+            slow = len(self.slow_queries)
+        queries = sum(counters[0] for _, counters in operations)
+        seconds = sum(counters[2] for _, counters in operations)
+
+        lines = ["=== QUERY PROFILE ===",
+                 f"{queries} queries, {seconds * 1000:.1f} ms in SQLite over "
+                 f"{time.perf_counter() - self.started:.2f} s",
+                 "",
+                 f"{'Operation':<44} {'Queries':>8} {'Rows':>9} {'Total ms':>10} {'Avg ms':>8}"]
+        for name, (count, rows, spent) in operations[:limit]:
+            lines.append(f"{name[:44]:<44} {count:>8} {rows:>9} {spent * 1000:>10.2f} "
+                         f"{spent * 1000 / max(count, 1):>8.3f}")
+        lines += ["", f"{'Statement':<60} {'Runs':>6} {'Total ms':>10} {'Max ms':>8}"]
+        for sql, (count, _, spent, slowest) in statements[:limit]:
+            text = sql if len(sql) <= 60 else sql[:57] + "..."
+            lines.append(f"{text:<60} {count:>6} {spent * 1000:>10.2f} {slowest * 1000:>8.2f}")
+        lines += ["", f"Slow queries (>= {self.slow_ms:g} ms): {slow}"]
+        return "\n".join(lines)
+
+
+def explain(connection, sql, parameters=()):
+    """EXPLAIN QUERY PLAN of a statement, one indented line per step"""
+    if not sql.lstrip().upper().startswith(PLANNABLE):
+        return "  (no plan)"
+    try:
+        rows = sqlite3.Cursor(connection).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error as e:
+        return f"  (no plan: {e})"
+
+    depth = {0: 0}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, 0) + 1
+        lines.append("  " * depth[node] + detail)
+    return "\n".join(lines)
+
+
+def _normalize(sql):
+    """Statement text with its whitespace collapsed, so each statement is counted under one key"""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _operation():
+    """Name of the salespipe function that ran the current statement"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        code = frame.f_code
+        if module.startswith('salespipe.') and module != __name__ and code.co_name not in CHARGED_TO_CALLER:
+            name = getattr(code, 'co_qualname', code.co_name)
+            return name if '.' in name else f"{module.rsplit('.', 1)[1]}.{name}"
+        frame = frame.f_back
+    return "(outside salespipe)"
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's time and rows, fetching included"""
+
+    _run = None  # [operation, statement, parameters, seconds so far, logged] of the last statement
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._started(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._started(sql, seq_of_parameters[0] if seq_of_parameters else (), time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._started(sql_script, (), time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(row is not None, start)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), start)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), start)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(0, start)
+            raise
+        self._fetched(1, start)
+        return row
+
+    def _started(self, sql, parameters, seconds):
+        active = profiler
+        if active is None:
+            return
+        sql = _normalize(sql)
+        operation = _operation()
+        # Rows changed by a write count now; rows read count as they are fetched
+        rows = self.rowcount if self.description is None and self.rowcount > 0 else 0
+        active.add(operation, sql, 1, rows, seconds)
+        self._run = [operation, sql, parameters, seconds, False]
+        active.check(self._run, self.connection)
+
+    def _fetched(self, rows, start):
+        run, active = self._run, profiler
+        if run is None or active is None:
+            return
+        seconds = time.perf_counter() - start
+        run[3] += seconds
+        active.add(run[0], run[1], 0, rows, seconds)
+        active.check(run, self.connection)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute(), are ProfiledCursors"""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connection_factory():
+    """Connection class for sqlite3.connect(factory=...): instrumented only while enabled"""
+    return sqlite3.Connection if profiler is None else ProfiledConnection
+
+
+def enable(slow_ms=None, summary_at_exit=False):
+    """Start instrumenting connections opened from now on; returns the Profiler"""
+    global profiler
+    if profiler is None:
+        profiler = Profiler(SLOW_QUERY_MS if slow_ms is None else slow_ms)
+        if summary_at_exit:
+            atexit.register(_print_summary)
+    elif slow_ms is not None:
+        profiler.slow_ms = slow_ms
+    return profiler
+
+
+def disable():
+    """Stop instrumenting; returns the Profiler that was active, with its counters"""
+    global profiler
+    active, profiler = profiler, None
+    return active
+
+
+def _print_summary():
+    if profiler is not None:
+        print(profiler.report(), file=sys.stderr)
+
+
+if os.environ.get('SALESPIPE_PROFILE', '').lower() not in ('', '0', 'false', 'no'):
+    enable(float(os.environ.get('SALESPIPE_SLOW_QUERY_MS', SLOW_QUERY_MS)), summary_at_exit=True)
@@ -0,0 +1,56 @@
+"""
+Read replica for Sales Pipeline Manager
+A copy of the live database, made with SQLite's online backup API and
+swapped in atomically, so heavy reports can read a file that ingestion
+never touches.
+"""
+import os
+import time
+
+from salespipe.database import Database
+
+
+class Replica:
+    """
+    Keeps `replica_path` as a copy of `source_path`, at most `max_age` seconds old
+
+    The copy is written to a temporary file and renamed over the replica,
+    so readers never see a half-written file; connections already open keep
+    reading the previous copy until they reconnect.
+    """
+
+    def __init__(self, source_path, replica_path, max_age=60.0):
+        # Under WAL the copy never holds up writers to the source
+        Database(source_path).enable_wal()
+        self.source = Database(source_path, read_only=True)
+        self.replica_path = replica_path
+        self.max_age = max_age
+
+    def age(self):
+        """Seconds since the replica was last refreshed (None if it doesn't exist)"""
+        if not os.path.exists(self.replica_path):
+            return None
+        return time.time() - os.path.getmtime(self.replica_path)
+
+    def refresh(self):
+        """Copy the source now; returns the seconds the copy took"""
+        start = time.perf_counter()
+        partial = f"{self.replica_path}.partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+        self.source.backup_to(partial)
+        # The copy inherits WAL mode; a plain journal lets mode=ro readers open it without a -shm file
+        copy = Database(partial)
+        copy.connect()
+        copy.cursor.execute("PRAGMA journal_mode=DELETE").fetchone()
+        copy.close()
+        os.replace(partial, self.replica_path)
+        return time.perf_counter() - start
+
+    def refresh_if_stale(self):
+        """Refresh if the replica is missing or older than max_age; returns True if it did"""
+        age = self.age()
+        if age is None or age > self.max_age:
+            self.refresh()
+            return True
+        return False
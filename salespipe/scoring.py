@@ -0,0 +1,125 @@
+"""
+Lead scoring for Sales Pipeline Manager
+A lead's score is how often deals with leads like it are won: for each of
+its industry, company size, source and location, the share of orders won
+by leads with the same value, averaged and shown as a percentage (0-100).
+Rates of values with few orders are pulled towards the overall win rate,
+so one lucky deal doesn't put a whole trade show on top.
+
+Scores live in leads.score, indexed for `list-leads --sort score`, and
+the win rates in lead_score_rates. New leads, and leads whose scored
+fields change, are flagged stale by the database; score_leads() scores
+only those with the stored rates, unless asked to recompute the rates and
+rescore every lead, which is worth doing as orders close (nightly, say).
+
+    python main.py score-leads          # New and changed leads
+    python main.py score-leads --all    # Every lead, with fresh win rates
+"""
+from salespipe import metrics
+
+# Lead columns the score is built from
+ATTRIBUTES = ('industry_id', 'company_size_id', 'source_id', 'location_id')
+
+# Orders the overall win rate counts as, when smoothing the win rate of one value
+PRIOR_ORDERS = 20
+
+# Leads scored per transaction, so other writers never wait long
+BATCH_SIZE = 50_000
+
+# lead_score_rates row holding the overall win rate
+OVERALL = ('*', 0)
+
+# Average of the lead's four win rates; values without orders get the overall rate
+SCORE = "round(100.0 * ({}) / {}, 2)".format(
+    " + ".join(f"coalesce((SELECT rate FROM lead_score_rates WHERE attribute = '{attribute}' "
+               f"AND code = leads.{attribute}), :overall)" for attribute in ATTRIBUTES),
+    len(ATTRIBUTES))
+
+# Order outcomes of a schema: lead and order status of every order
+ORDERS_SELECT = '''
+    SELECT o.lead_id, r.status_id
+    FROM {schema}.orders r
+             JOIN {schema}.quotes q ON q.quote_id = r.quote_id
+             JOIN {schema}.opportunities o ON o.opp_id = q.opp_id
+'''
+
+
+def _has_archived_orders(db):
+    """Whether the open connection has an archive attached that holds orders"""
+    if not db.archive_attached():
+        return False
+    return db.cursor.execute("SELECT 1 FROM archive.sqlite_master WHERE name = 'orders'").fetchone() is not None
+
+
+def _refresh_rates(db):
+    """Recompute lead_score_rates from every order, archived ones included; returns the overall win rate"""
+    outcomes = ORDERS_SELECT.format(schema='main')
+    if _has_archived_orders(db):
+        outcomes += " UNION ALL " + ORDERS_SELECT.format(schema='archive')
+    won = db.lookup_code('order_statuses', 'won')
+
+    db.cursor.execute(f'''
+                      CREATE TEMP TABLE lead_outcomes AS
+                      SELECT lead_id, count(*) AS orders, total(status_id = ?) AS won
+                      FROM ({outcomes})
+                      GROUP BY lead_id
+                      ''', (won,))
+    won_orders, orders = db.cursor.execute("SELECT total(won), total(orders) FROM temp.lead_outcomes").fetchone()
+    overall = won_orders / orders if orders else 0.0
+
+    db.cursor.execute("DELETE FROM lead_score_rates")
+    db.cursor.execute("INSERT INTO lead_score_rates (attribute, code, rate) VALUES (?, ?, ?)", (*OVERALL, overall))
+    for attribute in ATTRIBUTES:
+        db.cursor.execute(f'''
+                          INSERT INTO lead_score_rates (attribute, code, rate)
+                          SELECT :attribute, l.{attribute},
+                                 (total(o.won) + :prior * :overall) / (total(o.orders) + :prior)
+                          FROM temp.lead_outcomes o
+                                   JOIN leads l ON l.lead_id = o.lead_id
+                          WHERE l.{attribute} IS NOT NULL
+                          GROUP BY l.{attribute}
+                          ''', {'attribute': attribute, 'prior': PRIOR_ORDERS, 'overall': overall})
+    db.cursor.execute("DROP TABLE temp.lead_outcomes")
+    return overall
+
+
+@metrics.instrumented
+def score_leads(db, rescore_all=False, batch_size=BATCH_SIZE):
+    """
+    Score the stale leads with the stored win rates, or recompute the rates
+    and score every lead with rescore_all. Leads are scored by one set-based
+    UPDATE per batch of batch_size; returns the number scored.
+    """
+    db.create_tables()
+    opened = not db.in_session
+    db.open_session()
+    try:
+        with db.transaction():
+            row = db.cursor.execute("SELECT rate FROM lead_score_rates WHERE attribute = ? AND code = ?",
+                                    OVERALL).fetchone()
+            overall = _refresh_rates(db) if rescore_all or row is None else row[0]
+
+        scored = 0
+        if rescore_all:
+            first_id, last_id = db.cursor.execute("SELECT min(lead_id), max(lead_id) FROM leads").fetchone()
+            for start in range((first_id or 1) - 1, last_id or 0, batch_size):
+                with db.transaction():
+                    db.cursor.execute(f"UPDATE leads SET score = {SCORE}, score_stale = 0 "
+                                      "WHERE lead_id > :start AND lead_id <= :end",
+                                      {'overall': overall, 'start': start, 'end': start + batch_size})
+                    scored += db.cursor.rowcount
+        else:
+            while True:
+                with db.transaction():
+                    # Walks idx_leads_score_stale, which holds only the stale leads
+                    db.cursor.execute(f"UPDATE leads SET score = {SCORE}, score_stale = 0 WHERE lead_id IN "
+                                      "(SELECT lead_id FROM leads WHERE score_stale = 1 LIMIT :batch)",
+                                      {'overall': overall, 'batch': batch_size})
+                    updated = db.cursor.rowcount
+                scored += updated
+                if updated < batch_size:
+                    break
+        return scored
+    finally:
+        if opened:
+            db.close_session()
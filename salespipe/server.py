@@ -0,0 +1,351 @@
+"""
+HTTP/JSON API for Sales Pipeline Manager
+An asyncio server exposing the records and every analytics report. SQLite
+work runs on a pool of threads so the event loop never blocks: reads are
+spread over several connections, writes go through a single writer.
+"""
+import asyncio
+import decimal
+import json
+import sqlite3
+import time
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from salespipe import metrics
+from salespipe.async_database import ConnectionPool
+from salespipe.changes import CHANGE_COLUMNS
+from salespipe.database import RECORDS, LEAD_SORTS
+from salespipe.models import (Lead, Opportunity, Quote, Order, LEAD_STATUSES, LOCATIONS, INDUSTRIES,
+                              COMPANY_SIZES, OPPORTUNITY_STAGES, QUOTE_STATUSES, ORDER_STATUSES)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_BODY_BYTES = 1024 * 1024
+
+# Allowed values of the enumerated request fields
+CHOICES = {
+    'status': LEAD_STATUSES,
+    'location': LOCATIONS,
+    'industry': INDUSTRIES,
+    'company_size': COMPANY_SIZES,
+    'stage': OPPORTUNITY_STAGES,
+}
+
+
+class APIError(Exception):
+    """A request that can't be served; carries the HTTP status to answer with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_ready(value):
+    """Make report results JSON-serialisable (tuple keys become 'a->b' strings)"""
+    if isinstance(value, dict):
+        return {('->'.join(key) if isinstance(key, tuple) else key): _json_ready(item)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [_json_ready(item) for item in value]
+    return value
+
+
+def _flag(query, name):
+    return query.get(name, 'false').lower() in ('1', 'true', 'yes')
+
+
+def _int(query, name, default=None, maximum=None):
+    value = query.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise APIError(HTTPStatus.BAD_REQUEST, f"'{name}' must be an integer")
+    if number < 0:
+        raise APIError(HTTPStatus.BAD_REQUEST, f"'{name}' must not be negative")
+    return min(number, maximum) if maximum else number
+
+
+def _choice(data, name, choices):
+    value = data.get(name)
+    if value is not None and value not in choices:
+        raise APIError(HTTPStatus.BAD_REQUEST, f"'{name}' must be one of: {', '.join(choices)}")
+    return value
+
+
+def _field(data, name):
+    try:
+        return data[name]
+    except KeyError:
+        raise APIError(HTTPStatus.BAD_REQUEST, f"Missing field '{name}'")
+
+
+# Report name -> function(analytics, query)
+REPORTS = {
+    'conversion': lambda a, q: a.get_conversion_rates(),
+    'win-rate': lambda a, q: a.get_win_rate(),
+    'pipeline': lambda a, q: a.get_pipeline_value(exclude_expired=_flag(q, 'exclude_expired')),
+    'industry': lambda a, q: a.get_performance_by_industry(),
+    'location': lambda a, q: a.get_performance_by_location(),
+    'stages': lambda a, q: a.get_time_in_stage(),
+    'velocity': lambda a, q: a.get_stage_velocity(),
+    'top-opportunities': lambda a, q: a.get_top_opportunities(
+        limit=_int(q, 'limit', 20, MAX_PAGE_SIZE), by=_choice(q, 'by', ('weighted', 'value')) or 'weighted',
+        include_closed=_flag(q, 'include_closed')),
+    'top-accounts': lambda a, q: a.get_top_accounts(limit=_int(q, 'limit', 20, MAX_PAGE_SIZE)),
+}
+
+
+class APIServer:
+    """HTTP/1.1 JSON server over a ConnectionPool"""
+
+    def __init__(self, db_path="sales_pipeline.db", host="127.0.0.1", port=8080, readers=4, log=None):
+        self.host = host
+        self.port = port
+        self.pool = ConnectionPool(db_path, readers)
+        self.log = log  # Called with one access-log line per request
+        self._server = None
+        self._columns = {}
+
+    async def start(self):
+        """Start the pool and listen; self.port holds the bound port afterwards"""
+        self.pool.start()
+        for table in RECORDS:
+            self._columns[table] = await self.pool.read(lambda db, _, t=table: db.record_columns(t))
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """Stop listening, then drain and close the connection pool"""
+        self._server.close()
+        await self._server.wait_closed()
+        await asyncio.get_running_loop().run_in_executor(None, self.pool.close)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                keep_alive = await self._handle_request(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request_line, reader, writer):
+        """Read one request, answer it, and say whether the connection stays open"""
+        start = time.perf_counter()
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            method, target, version = '-', '-', 'HTTP/1.0'
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = (headers.get('connection', '').lower() != 'close'
+                      if version == 'HTTP/1.1' else headers.get('connection', '').lower() == 'keep-alive')
+        try:
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                raise APIError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+            body = await reader.readexactly(length) if length else b''
+            if method == '-':
+                raise APIError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+            status, payload = await self._route(method, target, body)
+        except APIError as e:
+            status, payload = e.status, {'error': str(e)}
+        except sqlite3.IntegrityError as e:
+            status, payload = HTTPStatus.CONFLICT, {'error': str(e)}
+        except ValueError as e:
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except decimal.InvalidOperation:
+            # Raised by Money for amounts that aren't numbers, e.g. "estimated_value": "lots"
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': "Amounts must be numbers"}
+        except Exception as e:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(e).__name__}: {e}"}
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if isinstance(payload, str):
+            data, content_type = payload.encode('utf-8'), metrics.CONTENT_TYPE
+        else:
+            data, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        writer.write((f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                      f"Content-Type: {content_type}\r\n"
+                      f"Content-Length: {len(data)}\r\n"
+                      f"X-Response-Time: {elapsed_ms:.2f}ms\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1') + data)
+        if self.log:
+            self.log(f"{method} {target} {status.value} {elapsed_ms:.2f}ms")
+        return keep_alive
+
+    async def _route(self, method, target, body):
+        """Dispatch to a handler; returns (HTTPStatus, JSON payload, or plain text as a str)"""
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['health'] and method == 'GET':
+            return HTTPStatus.OK, {'status': 'ok'}
+
+        if parts == ['metrics'] and method == 'GET':
+            return HTTPStatus.OK, metrics.registry.render()
+
+        if parts == ['changes'] and method == 'GET':
+            return HTTPStatus.OK, await self._changes(query)
+
+        if len(parts) == 2 and parts[0] == 'analytics':
+            report = REPORTS.get(parts[1])
+            if report is None:
+                raise APIError(HTTPStatus.NOT_FOUND, f"Unknown report '{parts[1]}'")
+            if method != 'GET':
+                raise APIError(HTTPStatus.METHOD_NOT_ALLOWED, "Reports are read-only")
+            result = await self.pool.read(lambda db, analytics: report(analytics, query))
+            return HTTPStatus.OK, _json_ready(result)
+
+        if not parts or parts[0] not in RECORDS or len(parts) > 2:
+            raise APIError(HTTPStatus.NOT_FOUND, f"No such resource: {url.path}")
+        table = parts[0]
+
+        if len(parts) == 1:
+            if method == 'GET':
+                return HTTPStatus.OK, await self._list(table, query)
+            if method == 'POST':
+                record_id = await self.pool.write(self._creator(table, self._body(body)))
+                return HTTPStatus.CREATED, {'id': record_id}
+            raise APIError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed on /{table}")
+
+        try:
+            record_id = int(parts[1])
+        except ValueError:
+            raise APIError(HTTPStatus.NOT_FOUND, f"No such resource: {url.path}")
+
+        if method == 'GET':
+            row = await self.pool.read(lambda db, _: db.get_record(table, record_id))
+            found = row is not None
+        elif method == 'PATCH':
+            found = await self.pool.write(self._updater(table, record_id, self._body(body)))
+        elif method == 'DELETE':
+            found = await self.pool.write(lambda db, _: db.delete_record(table, record_id))
+        else:
+            raise APIError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed on /{table}/{{id}}")
+
+        if not found:
+            raise APIError(HTTPStatus.NOT_FOUND, f"No {table} record with ID {record_id}")
+        if method == 'GET':
+            return HTTPStatus.OK, dict(zip(self._columns[table], row))
+        return HTTPStatus.OK, {'id': record_id}
+
+    @staticmethod
+    def _body(body):
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            raise APIError(HTTPStatus.BAD_REQUEST, "Body is not valid JSON")
+        if not isinstance(data, dict):
+            raise APIError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+        return data
+
+    async def _list(self, table, query):
+        """One page of records; 'next_after_id' continues the listing"""
+        limit = _int(query, 'limit', DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        after_id = _int(query, 'after_id')
+        if table == 'leads':
+            filters = {name: _choice(query, name, CHOICES[name]) for name in ('status', 'industry', 'location')}
+            filters['source'] = query.get('source')
+            sort = _choice(query, 'sort', tuple(LEAD_SORTS)) or 'id'
+            descending = _flag(query, 'desc')
+
+            def job(db, _):
+                return list(db.iter_leads(sort=sort, descending=descending, after_id=after_id,
+                                          limit=limit, **filters))
+        else:
+            def job(db, _):
+                return list(db.iter_records(table, after_id=after_id, limit=limit))
+
+        rows = await self.pool.read(job)
+        columns = self._columns[table]
+        return {
+            'items': [dict(zip(columns, row)) for row in rows],
+            'next_after_id': rows[-1][0] if len(rows) == limit and rows else None,
+        }
+
+    async def _changes(self, query):
+        """Change log records after 'since'; poll again with 'next_since'"""
+        since = _int(query, 'since', 0)
+        limit = _int(query, 'limit', DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        tables = [table for table in query.get('table', '').split(',') if table]
+        for table in tables:
+            _choice({'table': table}, 'table', tuple(RECORDS))
+        rows = await self.pool.read(lambda db, _: list(db.iter_changes(since, tables, limit)))
+        return {
+            'items': [dict(zip(CHANGE_COLUMNS, row)) for row in rows],
+            'next_since': rows[-1][0] if rows else since,
+        }
+
+    @staticmethod
+    def _creator(table, data):
+        """Build the write job that inserts a record from a request body"""
+        if table == 'leads':
+            record = Lead(None, _field(data, 'name'), _field(data, 'email'), data.get('phone', ''),
+                          data.get('source', 'manual'), _choice(data, 'status', LEAD_STATUSES) or 'new',
+                          _choice(data, 'location', LOCATIONS), _choice(data, 'industry', INDUSTRIES),
+                          _choice(data, 'company_size', COMPANY_SIZES))
+            return lambda db, _: db.add_lead(record)
+        if table == 'opportunities':
+            record = Opportunity(None, _field(data, 'lead_id'), _field(data, 'title'),
+                                 _field(data, 'estimated_value'),
+                                 _choice(data, 'stage', OPPORTUNITY_STAGES) or 'initial_inquiry',
+                                 data.get('probability', 0), data.get('expected_close'))
+            return lambda db, _: db.add_opportunity(record)
+        if table == 'quotes':
+            record = Quote(None, _field(data, 'opp_id'), _field(data, 'quote_number'),
+                           _field(data, 'quoted_amount'), _field(data, 'valid_until'), data.get('terms', ''),
+                           _choice(data, 'status', QUOTE_STATUSES) or 'draft')
+            return lambda db, _: db.add_quote(record)
+        record = Order(None, _field(data, 'quote_id'), _choice(data, 'status', ORDER_STATUSES) or 'won',
+                       _field(data, 'final_amount'), _field(data, 'close_date'), data.get('notes', ''))
+        return lambda db, _: db.add_order(record)
+
+    @staticmethod
+    def _updater(table, record_id, data):
+        """Build the write job for a PATCH; the job returns False if the record doesn't exist"""
+        if table == 'leads':
+            for name in ('status', 'location', 'industry', 'company_size'):
+                _choice(data, name, CHOICES[name])
+            return lambda db, _: db.update_lead(record_id, **data)
+        if table == 'opportunities':
+            stage = _field(data, 'stage')
+            _choice(data, 'stage', OPPORTUNITY_STAGES)
+            return lambda db, _: (db.update_opportunity_stage(record_id, stage)
+                                  or db.get_record(table, record_id) is not None)
+        if table == 'quotes':
+            status = _field(data, 'status')
+            _choice(data, 'status', QUOTE_STATUSES)
+            return lambda db, _: (db.update_quote_status(record_id, status)
+                                  or db.get_record(table, record_id) is not None)
+        raise APIError(HTTPStatus.METHOD_NOT_ALLOWED, "Orders can't be changed, only created or deleted")
+
+
+async def serve(db_path="sales_pipeline.db", host="127.0.0.1", port=8080, readers=4, log=print):
+    """Run the API server until cancelled (Ctrl+C)"""
+    server = APIServer(db_path, host, port, readers, log)
+    await server.start()
+    print(f"Serving {db_path} on http://{server.host}:{server.port} ({readers} readers, 1 writer)")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
@@ -0,0 +1,244 @@
+"""
+Sharded storage by market for Sales Pipeline Manager
+Each market (Germany, Italy, France, Benelux) lives in its own SQLite file,
+so writes for different markets take different locks and run in parallel.
+ShardedDatabase offers the record API of Database on top of the shards;
+ShardedAnalytics runs every report on all shards at once and merges them.
+"""
+import concurrent.futures
+import heapq
+import itertools
+import os
+
+from salespipe.analytics import Analytics
+from salespipe.database import Database, BUSY_TIMEOUT, LEAD_SORTS, RECORDS
+from salespipe.models import LOCATIONS
+
+# Every shard hands out IDs from its own range: shard n (1 = the first of
+# LOCATIONS) uses n * SHARD_ID_SPAN + 1 up to (n + 1) * SHARD_ID_SPAN, so an
+# ID is unique across shards and tells which shard holds the record
+SHARD_ID_SPAN = 10 ** 9
+
+
+def shard_path(db_path, market):
+    """File holding one market's data: sales_pipeline.db -> sales_pipeline.germany.db"""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.{market.lower()}{ext or '.db'}"
+
+
+class ShardedDatabase:
+    """
+    Database API over one file per market
+
+    Leads are stored in the shard of their location; opportunities, quotes
+    and orders follow the lead they belong to. Reads over all records merge
+    the shards in ID order. One instance can be shared between threads, like
+    Database; calls for different markets don't wait for each other.
+    Transactions can't span markets, so there is no transaction() here: use
+    shard(market).transaction() for a group of writes within one market.
+    """
+
+    def __init__(self, db_path="sales_pipeline.db", busy_timeout=BUSY_TIMEOUT, read_only=False):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.shards = {market: Database(shard_path(db_path, market), busy_timeout, read_only)
+                       for market in LOCATIONS}
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.shards),
+                                                           thread_name_prefix="salespipe-shard")
+
+    def close(self):
+        """Stop the fan-out threads"""
+        self._pool.shutdown()
+
+    def shard(self, market):
+        """Database of one market"""
+        try:
+            return self.shards[market]
+        except KeyError:
+            raise ValueError(f"No shard for location {market!r}; "
+                             f"leads need one of: {', '.join(self.shards)}") from None
+
+    def shard_of(self, record_id):
+        """Database holding the record with this ID, or None if no shard hands out such IDs"""
+        number = (record_id - 1) // SHARD_ID_SPAN
+        if 1 <= number <= len(LOCATIONS):
+            return self.shards[LOCATIONS[number - 1]]
+        return None
+
+    def map(self, func, *args):
+        """Call func(shard_db, *args) on every shard in parallel; returns the results in shard order"""
+        return list(self._pool.map(lambda db: func(db, *args), self.shards.values()))
+
+    def _map_ids(self, func, record_ids):
+        """Call func(shard_db, ids) in parallel for every shard holding some of the IDs"""
+        groups = {}
+        for record_id in record_ids:
+            db = self.shard_of(record_id)
+            if db is not None:
+                groups.setdefault(db, []).append(record_id)
+        return list(self._pool.map(lambda group: func(*group), groups.items()))
+
+    def create_tables(self):
+        """Create or migrate every shard, and start each one's IDs at its own range"""
+        self.map(Database.create_tables)
+        if self.read_only:
+            return
+        for number, db in enumerate(self.shards.values(), start=1):
+            first = number * SHARD_ID_SPAN
+            db.connect()
+            for table in RECORDS:
+                db.cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (first, table))
+                if db.cursor.rowcount == 0:
+                    db.cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, first))
+            db.conn.commit()
+            db.close()
+
+    def enable_wal(self):
+        """Switch every shard to WAL journaling"""
+        self.map(Database.enable_wal)
+
+    @property
+    def in_session(self):
+        """Whether this thread has a session open on every shard"""
+        return all(db.in_session for db in self.shards.values())
+
+    def open_session(self):
+        """Open a session on every shard, for this thread"""
+        for db in self.shards.values():
+            db.open_session()
+
+    def close_session(self):
+        """End this thread's sessions"""
+        for db in self.shards.values():
+            db.close_session()
+
+    def data_state(self):
+        """Token that changes whenever any shard is modified (see Database.data_state)"""
+        return tuple(db.data_state() for db in self.shards.values())
+
+    def add_lead(self, lead):
+        """Add a lead to the shard of its location"""
+        return self.shard(lead.location).add_lead(lead)
+
+    def add_opportunity(self, opp):
+        """Add an opportunity to the shard of its lead"""
+        return self._owner(opp.lead_id).add_opportunity(opp)
+
+    def add_quote(self, quote):
+        """Add a quote to the shard of its opportunity"""
+        return self._owner(quote.opp_id).add_quote(quote)
+
+    def add_order(self, order):
+        """Add an order to the shard of its quote"""
+        return self._owner(order.quote_id).add_order(order)
+
+    def _owner(self, parent_id):
+        """Shard of the record a new one refers to"""
+        db = self.shard_of(parent_id)
+        if db is None:
+            raise ValueError(f"ID {parent_id} belongs to no shard")
+        return db
+
+    def get_all_leads(self):
+        """Get all leads, in ID order"""
+        return list(itertools.chain.from_iterable(self.map(Database.get_all_leads)))
+
+    def get_all_opportunities(self):
+        """Get all opportunities, in ID order"""
+        return list(itertools.chain.from_iterable(self.map(Database.get_all_opportunities)))
+
+    def get_all_quotes(self):
+        """Get all quotes, in ID order"""
+        return list(itertools.chain.from_iterable(self.map(Database.get_all_quotes)))
+
+    def get_all_orders(self):
+        """Get all orders, in ID order"""
+        return list(itertools.chain.from_iterable(self.map(Database.get_all_orders)))
+
+    def iter_leads(self, status=None, industry=None, location=None, source=None,
+                   sort='id', descending=False, after_id=None, limit=None):
+        """Leads of every shard merged into one listing; same arguments as Database.iter_leads"""
+        shards = list(self.shards.values())
+        if location is not None:
+            shards = [self.shards[location]] if location in self.shards else []
+
+        index = self.record_columns('leads').index(LEAD_SORTS[sort])
+        after_key = None
+        if after_id is not None and index:
+            anchor = self.get_record('leads', after_id)
+            if anchor is None:
+                return
+            after_key = anchor[index]
+
+        listings = [db.iter_leads(status, industry, location, source, sort, descending,
+                                  after_id, limit, after_key=after_key) for db in shards]
+        merged = heapq.merge(*listings, key=lambda row: (row[index], row[0]), reverse=descending)
+        yield from itertools.islice(merged, limit)
+
+    def get_record(self, table, record_id):
+        """Get one record by ID, or None"""
+        db = self.shard_of(record_id)
+        return db.get_record(table, record_id) if db is not None else None
+
+    def iter_records(self, table, after_id=None, limit=None):
+        """Yield records of every shard in ID order, continuing after `after_id`"""
+        listings = (db.iter_records(table, after_id, limit) for db in self.shards.values())
+        yield from itertools.islice(itertools.chain.from_iterable(listings), limit)
+
+    def record_columns(self, table):
+        """Column names of the rows returned for a record type"""
+        return next(iter(self.shards.values())).record_columns(table)
+
+    def update_lead(self, lead_id, **fields):
+        """Change some fields of a lead; its location can't move it to another shard"""
+        db = self.shard_of(lead_id)
+        if db is None:
+            return False
+        if 'location' in fields and db is not self.shards.get(fields['location']):
+            raise ValueError("Leads can't be moved to another market's shard")
+        return db.update_lead(lead_id, **fields)
+
+    def delete_record(self, table, record_id):
+        """Delete one record (see Database.delete_record); returns True if it existed"""
+        db = self.shard_of(record_id)
+        return db.delete_record(table, record_id) if db is not None else False
+
+    def update_opportunity_stage(self, opp_id, stage, changed_at=None):
+        """Move an opportunity to a new stage; returns True if it changed"""
+        return self.update_opportunity_stages([opp_id], stage, changed_at) == 1
+
+    def update_opportunity_stages(self, opp_ids, stage, changed_at=None):
+        """Move many opportunities to a stage, one transaction per shard; returns the number changed"""
+        return sum(self._map_ids(lambda db, ids: db.update_opportunity_stages(ids, stage, changed_at), opp_ids))
+
+    def update_quote_status(self, quote_id, status, changed_at=None):
+        """Change the status of a quote; returns True if it changed"""
+        return self.update_quote_statuses([quote_id], status, changed_at) == 1
+
+    def update_quote_statuses(self, quote_ids, status, changed_at=None):
+        """Change the status of many quotes, one transaction per shard; returns the number changed"""
+        return sum(self._map_ids(lambda db, ids: db.update_quote_statuses(ids, status, changed_at), quote_ids))
+
+    def expire_quotes(self, as_of=None):
+        """Expire out-of-date quotes in every shard; returns the number expired"""
+        return sum(self.map(Database.expire_quotes, as_of))
+
+
+class ShardedAnalytics(Analytics):
+    """Analytics over a ShardedDatabase: each report queries all shards in parallel and merges the parts"""
+
+    def __init__(self, db_path="sales_pipeline.db", db=None, read_only=False):
+        """Pass `db` to share an existing ShardedDatabase"""
+        self.replica = None
+        self._owns_db = db is None
+        if db is not None:
+            self.db = db
+        else:
+            if read_only:
+                for market in LOCATIONS:
+                    Database(shard_path(db_path, market)).enable_wal()
+            self.db = ShardedDatabase(db_path, read_only=read_only)
+        self._cache = {}
+
+    def _gather(self, collect, *args):
+        return self.db.map(collect, *args)
@@ -0,0 +1,117 @@
+"""
+Interactive shell for Sales Pipeline Manager
+Runs the regular CLI commands inside one session, so the database
+connection, lookup codes and analytics results stay warm between commands
+"""
+import cmd
+import os
+import shlex
+import sqlite3
+
+try:
+    import readline
+except ImportError:  # Not available on every platform (e.g. plain Windows)
+    readline = None
+
+HISTORY_FILE = os.path.join(os.path.expanduser("~"), ".salespipe_history")
+HISTORY_LENGTH = 1000
+
+
+class Shell(cmd.Cmd):
+    """Read-eval loop over the CLI subcommands"""
+
+    intro = ("SalesPipe interactive shell - P.I.P.E. Industrial Systems\n"
+             "Type any command (e.g. list-leads), 'help' for the list, 'exit' to quit.")
+    prompt = "salespipe> "
+
+    def __init__(self, cli, parser, stdin=None, stdout=None, history_file=HISTORY_FILE):
+        super().__init__(stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+            self.prompt = ""
+            self.intro = None
+        self.cli = cli
+        self.parser = parser
+        self.history_file = history_file if readline and stdin is None else None
+        self.command_names = sorted(cli.commands)
+
+    def run(self):
+        """Run the loop until exit/EOF; Ctrl+C cancels the current line only"""
+        self.start_session()
+        try:
+            while True:
+                try:
+                    self.cmdloop()
+                    break
+                except KeyboardInterrupt:
+                    print("^C", file=self.stdout)
+                    self.intro = None
+        finally:
+            self.end_session()
+
+    def start_session(self):
+        """Open the shared connection and load command history"""
+        self.cli.db.open_session()
+        if self.history_file:
+            # Command names contain dashes, so only split words on whitespace
+            readline.set_completer_delims(" \t\n")
+            if os.path.exists(self.history_file):
+                readline.read_history_file(self.history_file)
+
+    def end_session(self):
+        """Save command history and close the shared connection"""
+        if self.history_file:
+            readline.set_history_length(HISTORY_LENGTH)
+            readline.write_history_file(self.history_file)
+        self.cli.db.close_session()
+
+    def emptyline(self):
+        """Do nothing on an empty line (instead of repeating the last command)"""
+
+    def default(self, line):
+        """Parse a line as CLI arguments and run the command"""
+        try:
+            argv = shlex.split(line)
+        except ValueError as e:
+            print(f"Error: {e}", file=self.stdout)
+            return
+
+        try:
+            args = self.parser.parse_args(argv)
+        except SystemExit:
+            # argparse already printed the usage error (or --help)
+            return
+
+        if args.command == 'shell':
+            print("Already in the shell.", file=self.stdout)
+            return
+
+        try:
+            self.cli.dispatch(args)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            # A failed command (bad file path, bad amount, ...) ends that command, not the session
+            self.cli.db.rollback()
+            print(f"Error: {e}", file=self.stdout)
+
+    def do_help(self, arg):
+        """List commands, or show the options of one command: help add-lead"""
+        if arg:
+            self.default(f"{arg} --help")
+        else:
+            self.parser.print_help(self.stdout)
+            print("\nShell commands: help [command], exit", file=self.stdout)
+
+    def do_exit(self, arg):
+        """Leave the shell"""
+        return True
+
+    do_quit = do_exit
+
+    def do_EOF(self, arg):
+        """Leave the shell on Ctrl+D"""
+        print(file=self.stdout)
+        return True
+
+    def completenames(self, text, *ignored):
+        """Complete command names at the start of the line"""
+        return [name for name in self.command_names + ['help', 'exit'] if name.startswith(text)]
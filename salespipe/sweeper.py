@@ -0,0 +1,45 @@
+"""
+Periodic quote expiry sweeper
+"""
+import threading
+from datetime import datetime
+from salespipe.database import Database
+
+
+class QuoteExpirySweeper:
+    """Marks quotes past their valid_until date as expired, once or on a schedule"""
+
+    def __init__(self, db_path="sales_pipeline.db"):
+        self.db = Database(db_path)
+        self.runs = 0
+        self.total_expired = 0
+        self._stop = threading.Event()
+
+    def run_once(self, as_of=None):
+        """Run a single sweep; returns a report dict"""
+        expired = self.db.expire_quotes(as_of)
+        self.runs += 1
+        self.total_expired += expired
+        return {
+            'swept_at': datetime.now().isoformat(timespec='seconds'),
+            'expired': expired,
+            'total_expired': self.total_expired,
+            'runs': self.runs
+        }
+
+    def run_forever(self, interval, on_sweep=None, max_runs=None):
+        """
+        Sweep every `interval` seconds until stop() is called (or max_runs is reached)
+        on_sweep is called with each report
+        """
+        while not self._stop.is_set():
+            report = self.run_once()
+            if on_sweep:
+                on_sweep(report)
+            if max_runs is not None and self.runs >= max_runs:
+                break
+            self._stop.wait(interval)
+
+    def stop(self):
+        """Stop a running run_forever loop (safe to call from another thread)"""
+        self._stop.set()
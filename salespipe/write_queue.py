@@ -0,0 +1,132 @@
+"""
+Write queue with group commit for Sales Pipeline Manager
+Producers hand over model objects and get futures back. One writer thread
+stores them in groups, one transaction (and one fsync) per group, so many
+concurrent producers never fight over SQLite's write lock.
+"""
+import concurrent.futures
+import queue
+import threading
+import time
+
+from salespipe.database import Database
+from salespipe.models import Lead, Opportunity, Quote, Order
+
+# Model class -> Database method that inserts it
+INSERTS = {
+    Lead: Database.add_lead,
+    Opportunity: Database.add_opportunity,
+    Quote: Database.add_quote,
+    Order: Database.add_order,
+}
+
+
+class WriteQueue:
+    """
+    Single writer that commits queued inserts in groups
+
+        with WriteQueue("sales_pipeline.db") as writes:
+            future = writes.submit(lead)
+            lead_id = future.result()
+
+    A group is committed once it holds `max_batch` records, or `max_delay`
+    seconds after its first record arrived, whichever comes first. A record
+    that fails (e.g. a missing lead_id or an unknown stage) fails only its own future.
+    """
+
+    def __init__(self, db_path="sales_pipeline.db", max_batch=500, max_delay=0.001):
+        self.db = Database(db_path)
+        self.db.create_tables()
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = {'records': 0, 'groups': 0}
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="salespipe-write-queue", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, record):
+        """Queue a Lead, Opportunity, Quote or Order; the future resolves to its new ID"""
+        if self._closed:
+            raise RuntimeError("WriteQueue is closed")
+        insert = INSERTS.get(type(record))
+        if insert is None:
+            raise TypeError(f"Cannot store {type(record).__name__} objects")
+        future = concurrent.futures.Future()
+        self._queue.put((future, insert, record))
+        return future
+
+    def submit_many(self, records):
+        """Queue several records; returns their futures in the same order"""
+        return [self.submit(record) for record in records]
+
+    def close(self):
+        """Commit everything still queued, then stop the writer thread"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _next_group(self):
+        """Wait for a first item, then collect more until the group is full or its window ends"""
+        first = self._queue.get()
+        if first is None:
+            return None, True
+        group = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(group) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return group, True
+            group.append(item)
+        return group, False
+
+    def _run(self):
+        self.db.open_session()
+        try:
+            stop = False
+            while not stop:
+                group, stop = self._next_group()
+                if group:
+                    self._commit_group(group)
+        finally:
+            self.db.close_session()
+
+    def _commit_group(self, group):
+        """Insert a group in one transaction; each record in its own savepoint"""
+        group = [item for item in group if item[0].set_running_or_notify_cancel()]
+        results = []
+        try:
+            with self.db.transaction():
+                for future, insert, record in group:
+                    self.db.cursor.execute("SAVEPOINT record")
+                    try:
+                        results.append((future, insert(self.db, record), None))
+                    except Exception as e:
+                        # Constraint violations, unknown labels, amounts that aren't numbers...
+                        self.db.cursor.execute("ROLLBACK TO record")
+                        results.append((future, None, e))
+                    self.db.cursor.execute("RELEASE record")
+        except Exception as e:
+            for future, _, _ in group:
+                future.set_exception(e)
+            return
+
+        # IDs only count once the group is committed
+        for future, record_id, error in results:
+            if error is None:
+                future.set_result(record_id)
+            else:
+                future.set_exception(error)
+        self.stats['records'] += len(group)
+        self.stats['groups'] += 1
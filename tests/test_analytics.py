@@ -123,6 +123,29 @@ class TestAnalytics(unittest.TestCase):
         # Total Pipeline: 350k + 223k = 573k
         self.assertEqual(data['total_pipeline'], 573000.0)
 
+    def test_pipeline_value_exact(self):
+        """Test that summing many fractional amounts doesn't drift"""
+        lead_id = self.db.add_lead(Lead(None, "Small Parts", "s@p.com", "555-006", "web"))
+        for _ in range(100):
+            self.db.add_opportunity(Opportunity(None, lead_id, "Spare", 0.1, "qualification", 10))
+
+        data = self.analytics.get_pipeline_value()
+
+        # 350k + 100 * 0.10 = 350,010.00 exactly
+        self.assertEqual(data['opportunities_value'], 350010.0)
+        self.assertEqual(data['total_pipeline'], 573010.0)
+
+    def test_pipeline_value_excluding_expired(self):
+        """Test that swept quotes can be left out of the quotes value"""
+        # Both sample quotes are only valid until early 2025
+        self.assertEqual(self.db.expire_quotes(as_of="2025-02-01"), 1)
+
+        data = self.analytics.get_pipeline_value(exclude_expired=True)
+
+        # Q-2024-001 (145k) expired, Q-2024-002 (78k) still valid
+        self.assertEqual(data['quotes_value'], 78000.0)
+        self.assertEqual(self.analytics.get_pipeline_value()['quotes_value'], 223000.0)
+
     def test_performance_by_industry(self):
         """Test performance by industry"""
         data = self.analytics.get_performance_by_industry()
@@ -155,6 +178,54 @@ class TestAnalytics(unittest.TestCase):
         self.assertEqual(data['Germany']['win_rate'], 100.0)
         self.assertEqual(data['Germany']['pipeline_value'], 150000.0)
 
+    def test_time_in_stage_and_velocity(self):
+        """Test stage durations computed from the stage history"""
+        lead_id = self.db.add_lead(Lead(None, "Velocity", "v@v.com", "555-007", "web"))
+        opp = Opportunity(None, lead_id, "Fast Deal", 10000, "qualification",
+                          created_at="2025-01-01T00:00:00")
+        opp_id = self.db.add_opportunity(opp)
+        self.db.update_opportunity_stage(opp_id, "negotiation", changed_at="2025-01-11T00:00:00")
+        self.db.update_opportunity_stage(opp_id, "order_confirmation", changed_at="2025-01-16T00:00:00")
+
+        stages = self.analytics.get_time_in_stage()
+
+        # Only the completed 10-day stay counts; sample opportunities are still in qualification
+        self.assertEqual(stages['qualification']['exits'], 1)
+        self.assertEqual(stages['qualification']['avg_days'], 10.0)
+        self.assertEqual(stages['qualification']['current'], 1)
+        self.assertEqual(stages['order_confirmation']['current'], 1)
+
+        velocity = self.analytics.get_stage_velocity()
+
+        self.assertEqual(velocity[('qualification', 'negotiation')]['transitions'], 1)
+        self.assertEqual(velocity[('qualification', 'negotiation')]['avg_days'], 10.0)
+        self.assertEqual(velocity[('negotiation', 'order_confirmation')]['avg_days'], 5.0)
+
+    def test_top_opportunities(self):
+        """Test ranking of open opportunities"""
+        top = self.analytics.get_top_opportunities(limit=5)
+
+        # Robot Cell and CNC Machine have orders, only Packaging Line is open
+        self.assertEqual([opp['title'] for opp in top], ["Packaging Line"])
+        self.assertEqual(top[0]['weighted_value'], 48000.0)
+
+        top = self.analytics.get_top_opportunities(limit=1, include_closed=True)
+        self.assertEqual([opp['title'] for opp in top], ["Robot Cell"])
+        self.assertEqual(top[0]['weighted_value'], 120000.0)
+
+        top = self.analytics.get_top_opportunities(limit=2, by='value', include_closed=True)
+        self.assertEqual([opp['title'] for opp in top], ["Robot Cell", "Packaging Line"])
+        self.assertEqual(top[0]['company'], "AutoCorp")
+
+    def test_top_accounts(self):
+        """Test ranking of accounts by won value"""
+        top = self.analytics.get_top_accounts()
+
+        self.assertEqual(len(top), 1)
+        self.assertEqual(top[0]['company'], "AutoCorp")
+        self.assertEqual(top[0]['won_orders'], 1)
+        self.assertEqual(top[0]['won_value'], 142000.0)
+
     def test_empty_database(self):
         """Test analytics with empty database"""
         # Create new empty database
@@ -0,0 +1,137 @@
+"""
+Tests for archival of closed deals
+"""
+import contextlib
+import io
+import os
+import unittest
+from salespipe.analytics import Analytics
+from salespipe.archive import Archiver, default_archive_path
+from salespipe.cli import CLI, create_parser
+from salespipe.database import Database
+from salespipe.models import Lead, Opportunity, Quote, Order
+
+REPORTS = ('get_conversion_rates', 'get_win_rate', 'get_pipeline_value', 'get_performance_by_industry',
+           'get_performance_by_location', 'get_time_in_stage', 'get_stage_velocity', 'get_top_accounts')
+
+
+class TestArchive(unittest.TestCase):
+    """Test Archiver and analytics over archived data"""
+
+    def setUp(self):
+        """Set up a database with old closed, recent closed and open deals"""
+        self.test_db = "test_archive.db"
+        self.archive_db = default_archive_path(self.test_db)
+        self._remove()
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+
+        for i in range(12):
+            lead_id = self.db.add_lead(Lead(None, f"Account {i % 5}", f"a{i}@x.com", "", "web",
+                                            location=("Germany", "Italy", None)[i % 3],
+                                            industry=("automotive", "logistics")[i % 2]))
+            opp_id = self.db.add_opportunity(Opportunity(None, lead_id, f"Deal {i}", 1000 * (i + 1), "qualification",
+                                                         50, created_at="2023-01-01T00:00:00"))
+            self.db.update_opportunity_stage(opp_id, "negotiation", changed_at=f"2023-01-{i + 2:02d}T00:00:00")
+            if i % 4 == 3:
+                continue  # Still open
+            quote_id = self.db.add_quote(Quote(None, opp_id, f"Q-{i}", 900 * (i + 1), "2023-02-01", "Net 30",
+                                               ("sent", "expired")[i % 2]))
+            self.db.add_quote(Quote(None, opp_id, f"Q-{i}-B", 100, "2023-02-01", "Net 30", "rejected"))
+            # Deals 0-5 closed in 2023, the rest in 2025
+            self.db.add_order(Order(None, quote_id, ("won", "lost")[i % 3 == 2], 850 * (i + 1),
+                                    "2023-06-01" if i < 6 else "2025-06-01"))
+
+    def tearDown(self):
+        """Clean up test databases"""
+        self._remove()
+
+    def _remove(self):
+        for base in (self.test_db, self.archive_db):
+            for path in (base, base + "-wal", base + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _reports(self, analytics):
+        results = {report: getattr(analytics, report)() for report in REPORTS}
+        results['pipeline_excluding_expired'] = analytics.get_pipeline_value(exclude_expired=True)
+        results['top_closed'] = [(opp['title'], opp['weighted_value'])
+                                 for opp in analytics.get_top_opportunities(limit=20, include_closed=True)]
+        return results
+
+    def test_archive_moves_old_closed_deals(self):
+        """Test that only funnels closed before the cutoff leave the main file"""
+        moved = Archiver(self.test_db).archive(before="2024-01-01", batch_size=2)
+
+        # Deals 0, 1, 2, 4 and 5 closed in 2023; deal 3 is still open
+        self.assertEqual(moved, {'opportunities': 5, 'quotes': 10, 'orders': 5})
+        self.assertEqual([opp[2] for opp in self.db.get_all_opportunities()],
+                         ["Deal 3", "Deal 6", "Deal 7", "Deal 8", "Deal 9", "Deal 10", "Deal 11"])
+        self.assertEqual(len(self.db.get_all_leads()), 12)
+
+        archive = Database(self.archive_db)
+        archive.connect()
+        counts = [archive.cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ('opportunities', 'opportunity_stage_history', 'quotes', 'quote_status_history',
+                                'orders')]
+        archive.close()
+        self.assertEqual(counts, [5, 10, 10, 10, 5])
+
+        # Nothing left to move
+        self.assertEqual(Archiver(self.test_db).archive(before="2024-01-01"),
+                         {'opportunities': 0, 'quotes': 0, 'orders': 0})
+
+    def test_reports_include_or_exclude_archive(self):
+        """Test that reports over main file plus archive match the reports before archiving"""
+        before = self._reports(Analytics(self.test_db))
+        # Reading with an archive that doesn't exist yet neither fails nor creates it
+        self.assertEqual(self._reports(Analytics(self.test_db, archive=self.archive_db)), before)
+        self.assertFalse(os.path.exists(self.archive_db))
+        Archiver(self.test_db).archive(before="2024-01-01")
+
+        self.assertEqual(self._reports(Analytics(self.test_db, archive=self.archive_db)), before)
+
+        hot = Analytics(self.test_db)
+        self.assertEqual(hot.get_conversion_rates()['total_opportunities'], 7)
+        self.assertEqual(hot.get_win_rate()['total_orders'], 4)
+
+        read_only = Analytics(self.test_db, read_only=True, archive=self.archive_db)
+        self.assertEqual(read_only.get_conversion_rates(), before['get_conversion_rates'])
+
+    def test_include_archived_applies_to_one_command(self):
+        """Test that --include-archived in a session doesn't leak archived deals into later reports"""
+        Archiver(self.test_db).archive(before="2024-01-01")
+        cli, parser = CLI(self.test_db), create_parser()
+
+        def total_orders(*flags):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                cli.dispatch(parser.parse_args(['analytics', '--type', 'winrate', *flags]))
+            return int(out.getvalue().split("Total Orders:")[1].split()[0])
+
+        cli.db.open_session()
+        try:
+            self.assertEqual([total_orders(), total_orders('--include-archived'), total_orders()], [4, 9, 4])
+        finally:
+            cli.db.close_session()
+
+    def test_archive_totals_survive_interrupted_run(self):
+        """Test that funnels copied by an interrupted run are deleted without counting them twice"""
+        archiver = Archiver(self.test_db)
+        archiver.create_tables()
+        before = Analytics(self.test_db).get_pipeline_value()
+
+        # As if a previous run committed the archive file but not the main one
+        archiver.db.connect()
+        archiver.db.cursor.execute("INSERT INTO archive.opportunities SELECT * FROM main.opportunities WHERE opp_id = 1")
+        archiver.db.conn.commit()
+        archiver.db.close()
+
+        moved = archiver.archive(before="2024-01-01")
+        self.assertEqual(moved['opportunities'], 5)
+        archived = Analytics(self.test_db, archive=self.archive_db).get_pipeline_value()
+        self.assertEqual(archived['won_value'], before['won_value'] - 1000 * 0.85)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Tests for the asyncio database facade
+"""
+import asyncio
+import os
+import time
+import unittest
+from salespipe.async_database import AsyncDatabase
+from salespipe.models import Lead, Opportunity
+
+
+class TestAsyncDatabase(unittest.TestCase):
+    """Test AsyncDatabase class"""
+
+    def setUp(self):
+        """Set up a fresh test database"""
+        self.test_db = "test_async.db"
+        self._remove()
+
+    def tearDown(self):
+        """Clean up test database"""
+        self._remove()
+
+    def _remove(self):
+        for path in (self.test_db, self.test_db + "-wal", self.test_db + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_add_get_and_iterate(self):
+        """Test awaitable writes, reads and paged iteration"""
+        async def scenario():
+            async with AsyncDatabase(self.test_db, readers=2) as db:
+                lead_ids = await asyncio.gather(*(db.add_lead(Lead(None, f"Async {i}", f"a{i}@x.com", "", "web",
+                                                                   industry="logistics"))
+                                                  for i in range(7)))
+                await db.add_opportunity(Opportunity(None, lead_ids[0], "Async Deal", 2500))
+
+                record = await db.get_record('leads', lead_ids[0])
+                names = [lead[1] async for lead in db.iter_leads(page_size=3, industry="logistics")]
+                limited = [lead async for lead in db.iter_leads(page_size=2, limit=3)]
+                pipeline = await db.get_pipeline_value()
+                return lead_ids, record, names, limited, pipeline
+
+        lead_ids, record, names, limited, pipeline = asyncio.run(scenario())
+        self.assertEqual(sorted(lead_ids), list(range(1, 8)))
+        self.assertEqual(record[0], lead_ids[0])
+        self.assertEqual(len(names), 7)
+        self.assertEqual(len(limited), 3)
+        self.assertEqual(pipeline['opportunities_value'], 2500.0)
+
+    def test_cancel_running_query(self):
+        """Test that cancelling interrupts a long query and frees the thread"""
+        slow = ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+                "SELECT COUNT(*) FROM n")
+
+        async def scenario():
+            async with AsyncDatabase(self.test_db, readers=1) as db:
+                task = asyncio.ensure_future(db.pool.read(lambda conn_db, _: conn_db.conn.execute(slow).fetchone()))
+                await asyncio.sleep(0.2)
+                start = time.perf_counter()
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                # The only reader must be free again right away
+                leads = await asyncio.wait_for(db.get_all_leads(), timeout=5)
+                return leads, time.perf_counter() - start
+
+        leads, elapsed = asyncio.run(scenario())
+        self.assertEqual(leads, [])
+        self.assertLess(elapsed, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
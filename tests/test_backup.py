@@ -0,0 +1,118 @@
+"""
+Tests for online backups and restore
+"""
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import unittest
+from salespipe.backup import create_backup, list_backups, restore_backup
+from salespipe.cli import CLI, create_parser
+from salespipe.database import Database, SCHEMA_VERSION
+from salespipe.models import Lead
+
+
+class TestBackup(unittest.TestCase):
+    """Test create_backup, retention and restore_backup"""
+
+    def setUp(self):
+        """Set up a database with some leads"""
+        self.test_db = "test_backup.db"
+        self.backup_dir = "test_backups"
+        self._remove()
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+        with self.db.transaction():
+            for i in range(500):
+                self.db.add_lead(Lead(None, f"Company {i}", f"c{i}@example.com", "", "web"))
+
+    def tearDown(self):
+        """Clean up test files"""
+        self._remove()
+
+    def _remove(self):
+        shutil.rmtree("test_backups", ignore_errors=True)
+        for path in ("test_backup.db", "test_backup.db-wal", "test_backup.db-shm", "test_backup.db.pre-restore"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _leads(self, path):
+        connection = sqlite3.connect(path)
+        count = connection.execute("SELECT count(*) FROM leads").fetchone()[0]
+        connection.close()
+        return count
+
+    def test_backup_is_one_snapshot(self):
+        """Test that writes between backup steps neither restart the copy nor end up in it"""
+        writer = Database(self.test_db)
+        steps = []
+
+        def progress(remaining, total):
+            steps.append(remaining)
+            writer.add_lead(Lead(None, "Meanwhile", f"m{len(steps)}@example.com", "", "web"))
+
+        path = create_backup(self.test_db, self.backup_dir, pages=2, sleep=0, progress=progress)
+        self.assertGreater(len(steps), 2)
+        self.assertEqual(steps, sorted(steps, reverse=True))  # Never started over
+        self.assertEqual(self._leads(path), 500)
+        self.assertEqual(self._leads(self.test_db), 500 + len(steps))
+
+    def test_retention_and_restore(self):
+        """Test that only the newest backups are kept and a compressed one restores"""
+        paths = [create_backup(self.test_db, self.backup_dir, compress=True, keep=2) for _ in range(3)]
+        self.assertTrue(all(path.endswith('.db.gz') for path in paths))
+        self.assertEqual(list_backups(self.test_db, self.backup_dir), paths[:0:-1])
+
+        self.db.add_lead(Lead(None, "After backup", "after@example.com", "", "web"))
+        previous = restore_backup(paths[-1], self.test_db)
+        self.assertEqual(self._leads(self.test_db), 500)
+        self.assertEqual(self._leads(previous), 501)
+
+    def test_restore_migrates_older_backup(self):
+        """Test that a backup from schema version 8 is migrated, though this process saw the file current"""
+        path = create_backup(self.test_db, self.backup_dir)
+        # Take the backup back to version 8, from before the change log
+        old = sqlite3.connect(path)
+        for (trigger,) in old.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_log_%'"
+                                      ).fetchall():
+            old.execute(f"DROP TRIGGER {trigger}")
+        old.executescript("DROP TABLE change_capture; DROP TABLE changes; DROP TABLE change_consumers; "
+                          "PRAGMA user_version = 8;")
+        old.close()
+
+        restore_backup(path, self.test_db)
+        connection = sqlite3.connect(self.test_db)
+        self.assertEqual(connection.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+        connection.close()
+
+        restored = Database(self.test_db)
+        since = restored.last_change_seq()
+        restored.add_lead(Lead(None, "Logged again", "logged@example.com", "", "web"))
+        self.assertEqual([change[1:4] for change in restored.iter_changes(since)], [('leads', 501, 'insert')])
+
+    def test_restore_refused_in_shell(self):
+        """Test that the CLI won't restore while a session keeps the database open"""
+        path = create_backup(self.test_db, self.backup_dir)
+        cli = CLI(self.test_db)
+        cli.db.open_session()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                cli.dispatch(create_parser().parse_args(['restore', '--file', path, '--dir', self.backup_dir]))
+        finally:
+            cli.db.close_session()
+        self.assertIn("Error: Can't restore from the shell", out.getvalue())
+        self.assertFalse(os.path.exists(self.test_db + ".pre-restore"))
+
+    def test_restore_refuses_damaged_backup(self):
+        """Test that a damaged backup leaves the database alone"""
+        path = create_backup(self.test_db, self.backup_dir)
+        with open(path, 'r+b') as f:
+            f.write(b"not a database")
+        with self.assertRaises(ValueError):
+            restore_backup(path, self.test_db)
+        self.assertEqual(self._leads(self.test_db), 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Tests for batch mode
+"""
+import os
+import unittest
+from salespipe.batch import BatchRunner, BatchError, json_to_argv
+from salespipe.cli import CLI, create_parser
+
+
+class TestBatch(unittest.TestCase):
+    """Test BatchRunner class"""
+
+    def setUp(self):
+        """Set up a CLI over a test database"""
+        self.test_db = "test_batch.db"
+        self.test_csv = "test_batch.csv"
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.cli = CLI(self.test_db)
+        self.runner = BatchRunner(self.cli, create_parser())
+
+    def tearDown(self):
+        """Clean up test files"""
+        for path in (self.test_db, self.test_csv):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _count(self, table):
+        self.cli.db.connect()
+        self.cli.db.cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        count = self.cli.db.cursor.fetchone()[0]
+        self.cli.db.close()
+        return count
+
+    def test_full_funnel(self):
+        """Test that a batch can build on records created earlier in the same batch"""
+        summary = self.runner.run([
+            '# one deal, start to finish',
+            'add-lead --name "Batch GmbH" --email b@batch.de --location Germany',
+            '',
+            'python main.py add-opportunity --lead-name Batch --title "Press Line" --value 50000',
+            'add-quote --opportunity-title "Press Line" --quote-number Q-B-1 --amount 48000 --valid-until 2030-01-01',
+            'set-stage --opportunity-title "Press Line" --stage negotiation',
+            'add-order --quote-number Q-B-1 --status won --final-amount 47500 --close-date 2026-01-01',
+        ])
+
+        self.assertEqual(summary['total'], 5)
+        self.assertEqual(summary['commands']['add-lead'], 1)
+        self.assertEqual(self._count('orders'), 1)
+        self.assertIsNone(self.cli.name_cache)
+
+    def test_failure_rolls_back(self):
+        """Test that one bad line leaves the database untouched"""
+        with self.assertRaises(BatchError) as ctx:
+            self.runner.run([
+                'add-lead --name "Kept GmbH" --email k@kept.de',
+                'add-opportunity --lead-name Missing --title "Ghost" --value 1000',
+            ])
+
+        self.assertEqual(ctx.exception.line_no, 2)
+        self.assertEqual(self._count('leads'), 0)
+
+    def test_lines_parsed_before_running(self):
+        """Test that an invalid line is reported before anything is applied"""
+        with self.assertRaises(BatchError) as ctx:
+            self.runner.run([
+                'add-lead --name "Early GmbH" --email e@early.de',
+                'list-leads',
+            ])
+
+        self.assertEqual(ctx.exception.line_no, 2)
+        self.assertEqual(self._count('leads'), 0)
+
+    def test_import_in_batch(self):
+        """Test that an import joins the batch transaction and rolls back with it"""
+        with open(self.test_csv, 'w', encoding='utf-8') as f:
+            f.write("name,email\nImported GmbH,i@imported.de\nKnown GmbH,k@known.de\n")
+        lines = [
+            'add-lead --name "Known GmbH" --email k@known.de',
+            f'import --input {self.test_csv}',
+        ]
+
+        summary = self.runner.run(lines)
+        self.assertEqual(summary['commands']['import'], 1)
+        self.assertEqual(self._count('leads'), 2)  # The known email was skipped
+
+        with self.assertRaises(BatchError):
+            self.runner.run(lines[1:] + ['add-opportunity --lead-name Missing --title "Ghost" --value 1000'])
+        self.assertEqual(self._count('leads'), 2)
+
+    def test_json_lines(self):
+        """Test JSON Lines input"""
+        self.assertEqual(json_to_argv({'command': 'set-stage', 'ids': [1, 2], 'stage': 'qualification'}),
+                         ['set-stage', '--ids', '1', '2', '--stage', 'qualification'])
+
+        summary = self.runner.run([
+            '{"command": "add-lead", "name": "Json BV", "email": "j@json.nl", "company_size": "large"}',
+            '{"command": "add-opportunity", "lead_name": "Json", "title": "Conveyor", "value": 12000}',
+        ])
+
+        self.assertEqual(summary['total'], 2)
+        lead = self.cli.db.get_all_leads()[0]
+        self.assertEqual(lead[8], 'large')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests for the change log
+"""
+import os
+import unittest
+from salespipe import generator
+from salespipe.changes import Consumer, tail
+from salespipe.csv_handler import CSVHandler
+from salespipe.database import Database
+from salespipe.models import Lead, Opportunity, Quote, Order
+from salespipe.scoring import score_leads
+
+
+class TestChanges(unittest.TestCase):
+    """Test the change log triggers, consumers and compaction"""
+
+    def setUp(self):
+        """Set up a database with one funnel"""
+        self.test_db = "test_changes.db"
+        self._remove()
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+        self.lead_id = self.db.add_lead(Lead(None, "Feed GmbH", "f@feed.de", "", "website", industry="logistics"))
+        self.opp_id = self.db.add_opportunity(Opportunity(None, self.lead_id, "Conveyors", 50000))
+        self.quote_id = self.db.add_quote(Quote(None, self.opp_id, "Q-1", 48000, "2030-01-01", "Net 30", "sent"))
+        self.order_id = self.db.add_order(Order(None, self.quote_id, "won", 47000, "2024-06-01"))
+
+    def tearDown(self):
+        """Clean up test database"""
+        self._remove()
+
+    def _remove(self):
+        for path in (self.test_db, self.test_db + "-wal", self.test_db + "-shm", "test_changes.csv"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _log(self, since=0):
+        return [change[1:4] for change in self.db.iter_changes(since)]
+
+    def test_every_write_is_logged(self):
+        """Test that inserts, updates and deletes of all four tables are logged in order, scores aside"""
+        since = self.db.last_change_seq()
+        self.db.update_lead(self.lead_id, status='qualified')
+        self.db.update_opportunity_stage(self.opp_id, 'negotiation')
+        self.db.update_quote_status(self.quote_id, 'accepted')
+        score_leads(self.db)
+        self.db.delete_record('orders', self.order_id)
+
+        self.assertEqual(self._log()[:4], [('leads', self.lead_id, 'insert'),
+                                           ('opportunities', self.opp_id, 'insert'),
+                                           ('quotes', self.quote_id, 'insert'),
+                                           ('orders', self.order_id, 'insert')])
+        self.assertEqual(self._log(since), [('leads', self.lead_id, 'update'),
+                                            ('opportunities', self.opp_id, 'update'),
+                                            ('quotes', self.quote_id, 'update'),
+                                            ('orders', self.order_id, 'delete')])
+        self.assertEqual([change[1] for change in self.db.iter_changes(tables=['quotes'])], ['quotes', 'quotes'])
+
+    def test_consumers_and_compaction(self):
+        """Test that consumers resume where they committed and compaction keeps what any of them still needs"""
+        erp, bi = Consumer(self.db, "erp"), Consumer(self.db, "bi")
+        changes = list(tail(self.db, follow=False, batch_size=3))
+        self.assertEqual([change[0] for change in changes], [1, 2, 3, 4])
+
+        erp.commit(erp.read(limit=3)[-1][0])
+        bi.commit(1)
+        self.assertEqual([change[0] for change in erp.tail(follow=False)], [4])
+        self.assertEqual(self.db.change_consumers(), {'bi': 1, 'erp': 3})
+
+        self.assertEqual(self.db.compact_changes(), 1)
+        self.assertEqual(self.db.compact_changes(up_to=2), 0)
+        bi.commit(4)
+        self.assertEqual(self.db.compact_changes(batch_size=1), 2)
+        self.assertEqual([change[0] for change in self.db.iter_changes()], [4])
+
+        self.db.update_lead(self.lead_id, phone="+49 30 1234567")
+        self.assertEqual(self.db.last_change_seq(), 5)  # Numbers are never reused after compaction
+
+    def test_bulk_loads_not_logged(self):
+        """Test that generated leads, and imports without log_changes, stay out of the change log"""
+        since = self.db.last_change_seq()
+        generator.generate(self.test_db, 200, seed=1)
+        self.assertEqual(self._log(since), [])
+
+        with open("test_changes.csv", 'w', encoding='utf-8') as f:
+            f.write("name,email\nBulk GmbH,b@bulk.de\n")
+        CSVHandler.import_leads_to_database(self.db, "test_changes.csv", log_changes=False)
+        self.assertEqual(self._log(since), [])
+        with self.assertRaises(RuntimeError):
+            with self.db.changes_paused():
+                pass
+
+        # Capture is back on for everything else, imports included
+        CSVHandler.import_leads_to_database(self.db, "test_changes.csv", skip_duplicates=False)
+        self.db.update_lead(self.lead_id, status='contacted')
+        self.assertEqual([(change[0], change[2]) for change in self._log(since)], [('leads', 'insert'), ('leads', 'update')])
+
+
+if __name__ == '__main__':
+    unittest.main()
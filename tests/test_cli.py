@@ -0,0 +1,123 @@
+"""
+Tests for command line interface
+"""
+import contextlib
+import io
+import subprocess
+import sys
+import unittest
+from salespipe.cli import create_parser
+
+
+class TestParser(unittest.TestCase):
+    """Test argument parsing"""
+
+    def setUp(self):
+        """Create the parser under test"""
+        self.parser = create_parser()
+
+    def _rejects(self, argv):
+        """Check that argparse refuses the arguments"""
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                self.parser.parse_args(argv)
+
+    def test_add_lead_known_values(self):
+        """Test that known industries and locations are accepted"""
+        args = self.parser.parse_args(['add-lead', '--name', 'A', '--email', 'a@a.com',
+                                       '--industry', 'automotive', '--location', 'Benelux'])
+        self.assertEqual(args.industry, 'automotive')
+        self.assertEqual(args.location, 'Benelux')
+
+    def test_add_lead_rejects_unknown_values(self):
+        """Test that misspelled enumerated values are refused"""
+        self._rejects(['add-lead', '--name', 'A', '--email', 'a@a.com', '--industry', 'automobile'])
+        self._rejects(['add-lead', '--name', 'A', '--email', 'a@a.com', '--location', 'Spain'])
+
+    def test_add_opportunity_rejects_unknown_stage(self):
+        """Test that only pipeline stages are accepted"""
+        self._rejects(['add-opportunity', '--lead-name', 'A', '--title', 'T', '--value', '1',
+                       '--stage', 'closing'])
+
+    def test_list_leads_options(self):
+        """Test list-leads paging and format options"""
+        args = self.parser.parse_args(['list-leads', '--status', 'new', '--sort', 'name', '--limit', '50',
+                                       '--after-id', '120', '--format', 'jsonl'])
+        self.assertEqual((args.status, args.sort, args.limit, args.after_id, args.format),
+                         ('new', 'name', 50, 120, 'jsonl'))
+        self._rejects(['list-leads', '--format', 'xml'])
+        self._rejects(['list-leads', '--sort', 'email'])
+        self.assertTrue(self.parser.parse_args(['list-leads', '--sharded']).sharded)
+
+    def test_archive_options(self):
+        """Test the archive command and archived analytics options"""
+        args = self.parser.parse_args(['archive', '--before', '2024-01-01', '--batch-size', '200', '--vacuum'])
+        self.assertEqual((args.before, args.batch_size, args.vacuum, args.archive_file),
+                         ('2024-01-01', 200, True, None))
+        args = self.parser.parse_args(['analytics', '--type', 'pipeline', '--include-archived'])
+        self.assertTrue(args.include_archived)
+        self.assertTrue(self.parser.parse_args(['analytics', '--type', 'location', '--sharded']).sharded)
+        self._rejects(['archive'])
+
+    def test_generate_options(self):
+        """Test the generate command options"""
+        args = self.parser.parse_args(['generate', '--leads', '1000', '--seed', '7', '--win-rate', '0.3',
+                                       '--industries', 'automotive=3,logistics=1', '--sharded', '--workers', '4'])
+        self.assertEqual((args.leads, args.seed, args.win_rate, args.industries, args.sharded, args.workers),
+                         (1000, 7, 0.3, 'automotive=3,logistics=1', True, 4))
+        self._rejects(['generate'])
+
+    def test_dedup_options(self):
+        """Test the dedup and merge-leads commands"""
+        args = self.parser.parse_args(['dedup', '--threshold', '0.8', '--merge'])
+        self.assertEqual((args.threshold, args.max_block_size, args.merge), (0.8, 100, True))
+        args = self.parser.parse_args(['merge-leads', '--into', '3', '--ids', '7', '9'])
+        self.assertEqual((args.into, args.ids), (3, [7, 9]))
+        self._rejects(['merge-leads', '--ids', '7'])
+
+    def test_import_options(self):
+        """Test that import skips duplicates unless told otherwise"""
+        args = self.parser.parse_args(['import', '--input', 'leads.csv'])
+        self.assertEqual((args.allow_duplicates, args.duplicates_report, args.batch_size), (False, None, 5000))
+        args = self.parser.parse_args(['import', '--input', 'leads.csv', '--allow-duplicates',
+                                       '--duplicates-report', 'dupes.csv'])
+        self.assertEqual((args.allow_duplicates, args.duplicates_report), (True, 'dupes.csv'))
+        self.assertTrue(self.parser.parse_args(['import', '--input', 'leads.csv', '--no-change-log']).no_change_log)
+
+    def test_score_options(self):
+        """Test the score-leads command and sorting leads by score"""
+        args = self.parser.parse_args(['score-leads', '--all'])
+        self.assertEqual((args.all, args.include_archived, args.batch_size), (True, False, 50000))
+        args = self.parser.parse_args(['list-leads', '--sort', 'score', '--desc'])
+        self.assertEqual((args.sort, args.desc), ('score', True))
+
+    def test_changes_options(self):
+        """Test the changes and compact-changes commands"""
+        args = self.parser.parse_args(['changes', '--since', '120', '--table', 'leads', '--table', 'orders',
+                                       '--follow'])
+        self.assertEqual((args.since, args.table, args.follow, args.consumer), (120, ['leads', 'orders'], True, None))
+        self._rejects(['changes', '--table', 'invoices'])
+        self.assertIsNone(self.parser.parse_args(['compact-changes']).up_to)
+
+    def test_backup_options(self):
+        """Test the backup and restore commands"""
+        args = self.parser.parse_args(['backup', '--compress', '--keep', '7'])
+        self.assertEqual((args.dir, args.compress, args.keep, args.pages), ('backups', True, 7, 1024))
+        self.assertTrue(self.parser.parse_args(['restore', '--latest']).latest)
+        self._rejects(['restore'])
+        self._rejects(['restore', '--latest', '--file', 'x.db'])
+
+
+class TestStartup(unittest.TestCase):
+    """Test that the CLI stays cheap to start"""
+
+    def test_heavy_modules_loaded_lazily(self):
+        """Test that analytics and CSV support aren't imported until a command needs them"""
+        code = ("import sys, salespipe.cli; "
+                "print(sorted(m for m in ('salespipe.analytics', 'salespipe.csv_handler', 'csv') "
+                "if m in sys.modules))")
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+if __name__ == '__main__':
+    unittest.main()
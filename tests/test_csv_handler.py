@@ -0,0 +1,88 @@
+"""
+Tests for CSV import and export
+"""
+import os
+import unittest
+from salespipe.bloom import BloomFilter
+from salespipe.csv_handler import CSVHandler, normalize_email
+from salespipe.database import Database
+from salespipe.models import Lead
+
+HEADER = "name,email,phone,source,status,location,industry,company_size\n"
+
+
+class TestBloomFilter(unittest.TestCase):
+    """Test the membership filter used by imports"""
+
+    def test_no_false_negatives(self):
+        """Test that every added item is found and few others are"""
+        bloom = BloomFilter(10000, 0.01)
+        bloom.update(f"lead{i}@example.com" for i in range(10000))
+        self.assertTrue(all(f"lead{i}@example.com" in bloom for i in range(10000)))
+        false_positives = sum(f"other{i}@example.com" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertLess(bloom.nbytes, 10000 * 1.3)
+
+
+class TestImportLeads(unittest.TestCase):
+    """Test importing lead CSV files into the database"""
+
+    def setUp(self):
+        """Set up a database with two leads"""
+        self.test_db = "test_csv_handler.db"
+        self.csv_file = "test_csv_handler.csv"
+        self._remove()
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+        self.db.add_lead(Lead(None, "AutoMech GmbH", "contact@automech.de", "", "website"))
+        self.db.add_lead(Lead(None, "LogiFlow BV", " Sales@LogiFlow.nl", "", "referral"))
+
+    def tearDown(self):
+        """Clean up test files"""
+        self._remove()
+
+    def _remove(self):
+        for path in ("test_csv_handler.db", "test_csv_handler.db-wal", "test_csv_handler.db-shm",
+                     "test_csv_handler.csv"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _write(self, *rows):
+        with open(self.csv_file, 'w', encoding='utf-8') as f:
+            f.write(HEADER + "".join(row + "\n" for row in rows))
+
+    def test_normalize_email(self):
+        """Test that emails are normalised the way the email index is"""
+        self.assertEqual(normalize_email("  Sales@LogiFlow.NL "), "sales@logiflow.nl")
+        self.assertEqual(normalize_email(None), "")
+        self.db.connect()
+        expected = self.db.conn.execute("SELECT lower(trim(?))", ("Ünal@Example.COM ",)).fetchone()[0]
+        self.db.close()
+        self.assertEqual(normalize_email("Ünal@Example.COM "), expected)
+
+    def test_skips_known_emails(self):
+        """Test that leads already in the database or earlier in the file are skipped"""
+        self._write("AutoMech,CONTACT@automech.de,,website,new,Germany,automotive,large",
+                    "FoodTech,sales@foodtech.it,,import,new,Italy,food_processing,medium",
+                    "LogiFlow,sales@logiflow.nl,,import,new,Netherlands,logistics,small",
+                    "FoodTech Italia,Sales@FoodTech.it,,import,new,Italy,food_processing,medium",
+                    "No Email Ltd,,,import,new,,,")
+        imported, duplicates = CSVHandler.import_leads_to_database(self.db, self.csv_file, batch_size=2)
+
+        self.assertEqual(imported, 2)
+        self.assertEqual(duplicates, [(2, "contact@automech.de", 'database'),
+                                      (4, "sales@logiflow.nl", 'database'),
+                                      (5, "sales@foodtech.it", 'file')])
+        self.assertEqual(sorted(row[1] for row in self.db.get_all_leads()),
+                         ["AutoMech GmbH", "FoodTech", "LogiFlow BV", "No Email Ltd"])
+
+    def test_allow_duplicates(self):
+        """Test that every row is imported when duplicates are allowed"""
+        self._write("AutoMech,contact@automech.de,,website,new,Germany,automotive,large")
+        imported, duplicates = CSVHandler.import_leads_to_database(self.db, self.csv_file, skip_duplicates=False)
+        self.assertEqual((imported, duplicates), (1, []))
+        self.assertEqual(len(self.db.get_all_leads()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Tests for duplicate lead detection and merging
+"""
+import os
+import unittest
+from salespipe.analytics import Analytics
+from salespipe.archive import Archiver, default_archive_path
+from salespipe.database import Database
+from salespipe.dedup import find_duplicates, normalize_name
+from salespipe.models import Lead, Opportunity, Quote, Order
+
+
+class TestDedup(unittest.TestCase):
+    """Test find_duplicates and Database.merge_leads"""
+
+    def setUp(self):
+        """Set up a database with a few duplicated companies"""
+        self.test_db = "test_dedup.db"
+        self.archive_db = default_archive_path(self.test_db)
+        self._remove()
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+
+        self.ids = [self.db.add_lead(Lead(None, *fields)) for fields in (
+            ("AutoMech GmbH", "contact@automech.de", "+49 30 12345678", "trade_show", "new", "Germany"),
+            ("Auto-Mech", "sales@automech.de", "", "linkedin", "new", None, "automotive"),
+            ("Automech GmbH & Co. KG", "hans.m@gmail.com", "030/12345678", "website"),
+            ("LogiFlow BV", "contact@logiflow.nl", "", "website"),
+            ("Logistics Flow Partners", "info@gmail.com", "", "referral"),
+            ("FoodTech Italia", "sales@foodtech.it", "", "referral"),
+            ("FoodTech Italia", "sales@foodtech.it", "", "import"),
+        )]
+
+    def tearDown(self):
+        """Clean up test databases"""
+        self._remove()
+
+    def _remove(self):
+        for base in (self.test_db, self.archive_db):
+            for path in (base, base + "-wal", base + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def test_normalize_name(self):
+        """Test that case, punctuation, accents and legal forms are ignored"""
+        self.assertEqual(normalize_name("Auto-Mech GmbH & Co. KG"), "auto mech")
+        self.assertEqual(normalize_name("Société Générale S.A."), "societe generale")
+
+    def test_find_duplicates(self):
+        """Test that duplicates are grouped and unrelated leads sharing a free mail domain are not"""
+        groups = find_duplicates(self.db)
+        self.assertEqual([group.lead_ids for group in groups], [self.ids[5:7], self.ids[0:3]])
+        self.assertEqual(groups[0].score, 1.0)
+
+        # A block bigger than the limit is skipped; the remaining keys still find the pairs
+        self.assertEqual(len(find_duplicates(self.db, max_block_size=1)), 0)
+        self.assertEqual(len(find_duplicates(self.db, threshold=1.0)), 1)
+
+    def test_merge_leads(self):
+        """Test that opportunities move to the survivor, which keeps the duplicates' missing fields"""
+        opp_ids = [self.db.add_opportunity(Opportunity(None, lead_id, f"Deal {lead_id}", 1000))
+                   for lead_id in self.ids[:3]]
+
+        moved = self.db.merge_leads(self.ids[0], self.ids[1:3])
+
+        self.assertEqual(moved, 2)
+        self.assertEqual({opp[1] for opp in self.db.get_all_opportunities()}, {self.ids[0]})
+        self.assertEqual(len(opp_ids), len(self.db.get_all_opportunities()))
+        survivor = self.db.get_record('leads', self.ids[0])
+        self.assertEqual((survivor[3], survivor[6], survivor[7]), ("+49 30 12345678", "Germany", "automotive"))
+        self.assertIsNone(self.db.get_record('leads', self.ids[1]))
+        self.assertEqual(len(self.db.get_all_leads()), 5)
+
+        with self.assertRaises(ValueError):
+            self.db.merge_leads(self.ids[1], [self.ids[3]])
+
+    def test_merge_moves_archived_deals(self):
+        """Test that deals already archived follow the merged lead"""
+        for lead_id in self.ids[5:7]:
+            opp_id = self.db.add_opportunity(Opportunity(None, lead_id, f"Deal {lead_id}", 1000))
+            quote_id = self.db.add_quote(Quote(None, opp_id, f"Q-{lead_id}", 900, "2023-02-01", "Net 30", "sent"))
+            self.db.add_order(Order(None, quote_id, "won", 800, "2023-06-01"))
+        Archiver(self.test_db).archive(before="2024-01-01")
+
+        Database(self.test_db, archive_path=self.archive_db).merge_leads(self.ids[5], [self.ids[6]])
+
+        top = Analytics(self.test_db, archive=self.archive_db).get_top_accounts()
+        self.assertEqual([(account['lead_id'], account['won_orders']) for account in top], [(self.ids[5], 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Tests for the synthetic data generator
+"""
+import os
+import unittest
+from salespipe import generator
+from salespipe.analytics import Analytics
+from salespipe.database import Database
+from salespipe.models import LOCATIONS
+from salespipe.sharding import ShardedDatabase, shard_path
+
+
+class TestGenerator(unittest.TestCase):
+    """Test generated data: determinism, distributions and sharded generation"""
+
+    def setUp(self):
+        """Name the test databases"""
+        self.paths = ["test_generator_a.db", "test_generator_b.db", "test_generator_sharded.db"]
+        self._remove()
+
+    def tearDown(self):
+        """Clean up test databases"""
+        self._remove()
+
+    def _remove(self):
+        for base in self.paths:
+            for path in [base] + [shard_path(base, market) for market in LOCATIONS]:
+                for name in (path, path + "-wal", path + "-shm"):
+                    if os.path.exists(name):
+                        os.remove(name)
+
+    def _dump(self, path):
+        db = Database(path)
+        return db.get_all_leads(), db.get_all_opportunities(), db.get_all_quotes(), db.get_all_orders()
+
+    def test_same_seed_same_data(self):
+        """Test that the data depends on the seed, not on the chunk size"""
+        counts = generator.generate(self.paths[0], 2500, seed=5, chunk_size=300)
+        generator.generate(self.paths[1], 2500, seed=5, chunk_size=2500)
+        self.assertEqual(self._dump(self.paths[0]), self._dump(self.paths[1]))
+        self.assertEqual(counts['leads'], 2500)
+        self.assertEqual(counts['opportunities'], len(self._dump(self.paths[0])[1]))
+
+        generator.generate(self.paths[2], 300, seed=6, chunk_size=100)
+        self.assertNotEqual(self._dump(self.paths[0])[0], self._dump(self.paths[2])[0])
+
+    def test_distributions(self):
+        """Test funnel rates and weights, and that a second run appends"""
+        generator.generate(self.paths[0], 4000, seed=1, overrides={
+            'locations': {'Germany': 1, 'Italy': 0, 'France': 0, 'Benelux': 0},
+            'opportunity_rate': 0.5, 'win_rate': 1.0})
+        rates = Analytics(self.paths[0]).get_conversion_rates()
+        self.assertAlmostEqual(rates['lead_to_opportunity'], 50, delta=3)
+        self.assertAlmostEqual(rates['opportunity_to_quote'], 60, delta=3)
+        self.assertEqual(rates['order_win_rate'], 100)
+        self.assertEqual(set(Analytics(self.paths[0]).get_performance_by_location()), {'Germany'})
+
+        generator.generate(self.paths[0], 10, seed=2)
+        leads = Database(self.paths[0]).get_all_leads()
+        self.assertEqual([lead[0] for lead in leads], list(range(1, 4011)))
+
+        with self.assertRaises(ValueError):
+            generator.generate(self.paths[1], 10, overrides={'industries': {'automobile': 1}})
+
+    def test_sharded_generation(self):
+        """Test that each market's file gets its share of leads, generated in parallel processes"""
+        counts = generator.generate_sharded(self.paths[2], 1000, seed=3, workers=2)
+        self.assertEqual(counts['leads'], 1000)
+        self.assertEqual(generator.split(1000, generator.DEFAULT_DISTRIBUTIONS['locations']),
+                         {'Germany': 400, 'Italy': 250, 'France': 200, 'Benelux': 150})
+
+        db = ShardedDatabase(self.paths[2])
+        try:
+            germany = db.shard('Germany').get_all_leads()
+            self.assertEqual(len(germany), 400)
+            self.assertEqual({lead[6] for lead in germany}, {'Germany'})
+            # Records are numbered in their shard's ID range
+            self.assertEqual(db.shard_of(germany[0][0]), db.shard('Germany'))
+            self.assertEqual(len(db.get_all_opportunities()), counts['opportunities'])
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Tests for operational metrics and tracing hooks
+"""
+import os
+import unittest
+from salespipe import metrics
+from salespipe.analytics import Analytics
+from salespipe.csv_handler import CSVHandler
+from salespipe.database import Database
+from salespipe.models import Lead
+
+
+class TestRegistry(unittest.TestCase):
+    """Test the Prometheus text rendering"""
+
+    def test_render(self):
+        """Test counters, histogram buckets and gauges in the exposition format"""
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter('test_total', "A counter", ['kind']))
+        histogram = registry.register(metrics.Histogram('test_seconds', "A histogram", buckets=(0.1, 1.0)))
+        registry.register(metrics.Gauge('test_bytes', "A gauge", ['file'], lambda: {('a"b',): 42}))
+        counter.inc('x', amount=3)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP test_total A counter',
+            '# TYPE test_total counter',
+            'test_total{kind="x"} 3',
+            '# HELP test_seconds A histogram',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1.0"} 2',
+            'test_seconds_bucket{le="+Inf"} 3',
+            'test_seconds_sum 5.55',
+            'test_seconds_count 3',
+            '# HELP test_bytes A gauge',
+            '# TYPE test_bytes gauge',
+            'test_bytes{file="a\\"b"} 42',
+        ])
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Test the metrics recorded by Database, Analytics and CSVHandler"""
+
+    def setUp(self):
+        """Set up a test database"""
+        self.test_db = "test_metrics.db"
+        self.csv_file = "test_metrics.csv"
+        self.textfile = "test_metrics.prom"
+        self._remove()
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+
+    def tearDown(self):
+        """Clean up test files"""
+        self._remove()
+
+    def _remove(self):
+        for path in (self.test_db, self.test_db + "-wal", self.test_db + "-shm", self.csv_file, self.textfile):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_operations_and_inserts(self):
+        """Test latency and insert counters, file sizes and the textfile output"""
+        inserted = metrics.RECORDS_INSERTED.value('leads')
+        timed = metrics.OPERATION_SECONDS.count('Database.add_lead')
+        listed = metrics.OPERATION_SECONDS.count('Database.iter_leads')
+
+        for i in range(3):
+            self.db.add_lead(Lead(None, f"Lead {i}", f"l{i}@x.com", "", "web"))
+        CSVHandler.export_leads_to_csv(self.db.get_all_leads(), self.csv_file)
+        self.assertEqual(len(list(self.db.iter_leads())), 3)
+
+        self.assertEqual(metrics.RECORDS_INSERTED.value('leads'), inserted + 3)
+        self.assertEqual(metrics.OPERATION_SECONDS.count('Database.add_lead'), timed + 3)
+        self.assertEqual(metrics.OPERATION_SECONDS.count('Database.iter_leads'), listed + 1)
+        self.assertGreater(metrics.CSV_ROWS.value('exported'), 0)
+
+        metrics.registry.write_textfile(self.textfile)
+        with open(self.textfile, encoding='utf-8') as f:
+            text = f.read()
+        self.assertIn(f'salespipe_database_file_bytes{{path="{os.path.abspath(self.test_db)}",file="main"}} '
+                      f'{os.path.getsize(self.test_db)}', text)
+
+    def test_analytics_cache_hits(self):
+        """Test that repeated reports in a session count as cache hits"""
+        analytics = Analytics(self.test_db)
+        hits = metrics.ANALYTICS_CACHE.value('get_win_rate', 'hit')
+        misses = metrics.ANALYTICS_CACHE.value('get_win_rate', 'miss')
+
+        self.db.open_session()
+        analytics.db = self.db
+        try:
+            analytics.get_win_rate()
+            analytics.get_win_rate()
+        finally:
+            self.db.close_session()
+
+        self.assertEqual(metrics.ANALYTICS_CACHE.value('get_win_rate', 'hit'), hits + 1)
+        self.assertEqual(metrics.ANALYTICS_CACHE.value('get_win_rate', 'miss'), misses + 1)
+        self.assertIn('salespipe_analytics_cache_hit_ratio{report="get_win_rate"}', metrics.registry.render())
+
+    def test_span_hooks(self):
+        """Test that hooks see each operation start and end, with errors and generators"""
+        events = []
+
+        def start(span):
+            span.context = len(events)
+            events.append(('start', span.name))
+
+        def end(span):
+            events.append(('end', span.name, span.context, type(span.error).__name__))
+
+        metrics.add_span_hooks(start, end)
+        try:
+            self.db.add_lead(Lead(None, "Span", "s@x.com", "", "web"))
+            rows = self.db.iter_leads()
+            events.append('created')
+            list(rows)
+            with self.assertRaises(KeyError):
+                self.db.get_record('accounts', 1)
+        finally:
+            metrics.remove_span_hooks(start, end)
+
+        self.assertEqual(events, [
+            ('start', 'Database.add_lead'), ('end', 'Database.add_lead', 0, 'NoneType'),
+            ('start', 'Database.iter_leads'), 'created', ('end', 'Database.iter_leads', 2, 'NoneType'),
+            ('start', 'Database.get_record'), ('end', 'Database.get_record', 5, 'KeyError'),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
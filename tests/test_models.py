@@ -3,8 +3,10 @@ Tests for database operations
 """
 import unittest
 import os
-from salespipe.database import Database
-from salespipe.models import Lead, Opportunity, Quote, Order
+import sqlite3
+from salespipe.database import Database, SCHEMA_VERSION
+from decimal import Decimal
+from salespipe.models import Lead, Opportunity, Quote, Order, Money
 
 
 class TestDatabase(unittest.TestCase):
@@ -47,6 +49,89 @@ class TestDatabase(unittest.TestCase):
 
         self.db.close()
 
+    def test_create_tables_is_idempotent(self):
+        """Test that schema checks are cheap and safe to repeat"""
+        self.db.create_tables()
+        self.db.add_lead(Lead(None, "Kept", "k@k.com", "555", "web"))
+        Database(self.test_db).create_tables()
+
+        self.db.connect()
+        self.db.cursor.execute("PRAGMA user_version")
+        self.assertEqual(self.db.cursor.fetchone()[0], SCHEMA_VERSION)
+        self.db.close()
+        self.assertEqual(len(self.db.get_all_leads()), 1)
+
+        # A deleted file is noticed and recreated
+        os.remove(self.test_db)
+        self.db.create_tables()
+        self.assertEqual(self.db.get_all_leads(), [])
+
+    def test_legacy_tables_converted(self):
+        """Test that a database from before lookup codes and cents is migrated without losing anything"""
+        legacy_db = "test_legacy.db"
+        if os.path.exists(legacy_db):
+            os.remove(legacy_db)
+        connection = sqlite3.connect(legacy_db)
+        connection.executescript('''
+            CREATE TABLE leads (lead_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                                email TEXT NOT NULL, phone TEXT, source TEXT, status TEXT DEFAULT 'new',
+                                location TEXT, industry TEXT, company_size TEXT, created_at TEXT NOT NULL);
+            CREATE TABLE opportunities (opp_id INTEGER PRIMARY KEY AUTOINCREMENT, lead_id INTEGER NOT NULL,
+                                        title TEXT NOT NULL, estimated_value REAL NOT NULL,
+                                        stage TEXT DEFAULT 'initial_inquiry', probability INTEGER DEFAULT 0,
+                                        expected_close TEXT, created_at TEXT NOT NULL,
+                                        FOREIGN KEY (lead_id) REFERENCES leads (lead_id));
+            CREATE TABLE quotes (quote_id INTEGER PRIMARY KEY AUTOINCREMENT, opp_id INTEGER NOT NULL,
+                                 quote_number TEXT NOT NULL UNIQUE, quoted_amount REAL NOT NULL,
+                                 valid_until TEXT, terms TEXT, status TEXT DEFAULT 'draft',
+                                 created_at TEXT NOT NULL, FOREIGN KEY (opp_id) REFERENCES opportunities (opp_id));
+            CREATE TABLE orders (order_id INTEGER PRIMARY KEY AUTOINCREMENT, quote_id INTEGER NOT NULL,
+                                 status TEXT NOT NULL, final_amount REAL NOT NULL, close_date TEXT NOT NULL,
+                                 notes TEXT, created_at TEXT NOT NULL,
+                                 FOREIGN KEY (quote_id) REFERENCES quotes (quote_id));
+            INSERT INTO leads VALUES (1, 'Old GmbH', 'o@old.de', '555', 'trade_show', 'qualified', 'Germany',
+                                      'automotive', 'large', '2023-05-01T10:00:00');
+            INSERT INTO leads VALUES (2, 'Expo SA', 'e@expo.es', '556', 'expo', 'new', 'Spain', NULL, NULL,
+                                      '2023-06-01T10:00:00');
+            INSERT INTO opportunities VALUES (1, 1, 'Press', 12345.67, 'negotiation', 70, '2023-09-01',
+                                              '2023-05-02T10:00:00');
+            INSERT INTO quotes VALUES (1, 1, 'Q-OLD-1', 11999.99, '2023-07-01', 'Net 30', 'accepted',
+                                       '2023-05-10T10:00:00');
+            INSERT INTO orders VALUES (1, 1, 'won', 11500.1, '2023-06-15', 'rush', '2023-06-15T10:00:00');
+        ''')
+        connection.close()
+
+        try:
+            db = Database(legacy_db)
+            db.create_tables()
+            self.assertEqual([lead[:10] for lead in db.get_all_leads()], [
+                (1, 'Old GmbH', 'o@old.de', '555', 'trade_show', 'qualified', 'Germany', 'automotive', 'large',
+                 '2023-05-01T10:00:00'),
+                (2, 'Expo SA', 'e@expo.es', '556', 'expo', 'new', 'Spain', None, None, '2023-06-01T10:00:00'),
+            ])
+            self.assertEqual(db.get_all_opportunities(), [
+                (1, 1, 'Press', 12345.67, 'negotiation', 70, '2023-09-01', '2023-05-02T10:00:00')])
+            self.assertEqual(db.get_all_quotes(), [
+                (1, 1, 'Q-OLD-1', 11999.99, '2023-07-01', 'Net 30', 'accepted', '2023-05-10T10:00:00')])
+            self.assertEqual(db.get_all_orders(), [
+                (1, 1, 'won', 11500.1, '2023-06-15', 'rush', '2023-06-15T10:00:00')])
+
+            connection = sqlite3.connect(legacy_db)
+            self.assertEqual(connection.execute('''
+                SELECT o.estimated_value_cents, s.label, q.quoted_amount_cents, r.final_amount_cents
+                FROM opportunities o
+                JOIN opportunity_stages s ON s.code = o.stage_id
+                JOIN quotes q ON q.opp_id = o.opp_id
+                JOIN orders r ON r.quote_id = q.quote_id
+            ''').fetchall(), [(1234567, 'negotiation', 1199999, 1150010)])
+            self.assertEqual(connection.execute('''
+                SELECT l.label FROM leads JOIN locations l ON l.code = leads.location_id ORDER BY lead_id
+            ''').fetchall(), [('Germany',), ('Spain',)])
+            self.assertEqual(connection.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+            connection.close()
+        finally:
+            os.remove(legacy_db)
+
     def test_add_and_get_lead(self):
         """Test adding and retrieving a lead"""
         lead = Lead(
@@ -206,6 +291,165 @@ class TestDatabase(unittest.TestCase):
         leads = self.db.get_all_leads()
         self.assertEqual(len(leads), 5)
 
+    def test_iter_leads_filters_and_pages(self):
+        """Test filtered, sorted listing continued with after_id"""
+        for name, industry in [("Delta", "logistics"), ("Alpha", "automotive"), ("Charlie", "logistics"),
+                               ("Bravo", "logistics"), ("Echo", "logistics")]:
+            self.db.add_lead(Lead(None, name, f"{name}@test.com", "555", "web", industry=industry))
+
+        first = list(self.db.iter_leads(industry="logistics", sort="name", limit=2))
+        self.assertEqual([lead[1] for lead in first], ["Bravo", "Charlie"])
+        rest = list(self.db.iter_leads(industry="logistics", sort="name", after_id=first[-1][0]))
+        self.assertEqual([lead[1] for lead in rest], ["Delta", "Echo"])
+
+        newest = list(self.db.iter_leads(descending=True, after_id=4))
+        self.assertEqual([lead[0] for lead in newest], [3, 2, 1])
+        self.assertEqual(list(self.db.iter_leads(source="never_used")), [])
+        self.assertEqual(len(list(self.db.iter_leads())), 5)
+
+    def test_enumerated_columns_stored_as_codes(self):
+        """Test that stage and status columns hold lookup codes, read back as labels"""
+        lead = Lead(None, "Coded Co", "c@co.com", "555", "trade_show",
+                    location="Italy", industry="logistics", company_size="small")
+        lead_id = self.db.add_lead(lead)
+        self.db.add_opportunity(Opportunity(None, lead_id, "Deal", 1000, "negotiation"))
+
+        self.db.connect()
+        self.db.cursor.execute("SELECT industry_id, location_id FROM leads WHERE lead_id=?", (lead_id,))
+        industry_id, location_id = self.db.cursor.fetchone()
+        self.db.cursor.execute("SELECT label FROM industries WHERE code=?", (industry_id,))
+        industry = self.db.cursor.fetchone()[0]
+        self.db.close()
+
+        self.assertIsInstance(location_id, int)
+        self.assertEqual(industry, "logistics")
+        self.assertEqual(self.db.get_all_leads()[0][5:9], ("new", "Italy", "logistics", "small"))
+        self.assertEqual(self.db.get_all_opportunities()[0][4], "negotiation")
+
+    def test_unknown_label_registered(self):
+        """Test that new sources and locations get a new lookup code"""
+        self.db.add_lead(Lead(None, "Expo Co", "e@co.com", "555", "expo", location="Spain"))
+        self.db.add_lead(Lead(None, "Expo Two", "e2@co.com", "555", "expo", location="Spain"))
+
+        leads = self.db.get_all_leads()
+        self.assertEqual(leads[1][4], "expo")
+        self.assertEqual(leads[1][6], "Spain")
+
+        self.db.connect()
+        self.db.cursor.execute("SELECT COUNT(*) FROM locations WHERE label='Spain'")
+        self.assertEqual(self.db.cursor.fetchone()[0], 1)
+        self.db.close()
+
+    def test_unknown_stage_or_status_refused(self):
+        """Test that a misspelled stage or status is an error, not a new lookup code"""
+        lead_id = self.db.add_lead(Lead(None, "Typo Co", "t@co.com", "555", "web"))
+        opp_id = self.db.add_opportunity(Opportunity(None, lead_id, "Deal", 1000))
+
+        with self.assertRaises(ValueError):
+            self.db.add_opportunity(Opportunity(None, lead_id, "Other", 1000, "Closed Wonn"))
+        with self.assertRaises(ValueError):
+            self.db.update_opportunity_stage(opp_id, "Closed Wonn")
+        with self.assertRaises(ValueError):
+            self.db.add_lead(Lead(None, "Typo Two", "t2@co.com", "555", "web", status="qualifed"))
+
+        self.assertEqual(len(self.db.get_all_opportunities()), 1)
+        self.db.connect()
+        self.db.cursor.execute("SELECT COUNT(*) FROM opportunity_stages WHERE label='Closed Wonn'")
+        self.assertEqual(self.db.cursor.fetchone()[0], 0)
+        self.db.close()
+
+    def test_update_opportunity_stage(self):
+        """Test moving an opportunity records the change in its history"""
+        lead_id = self.db.add_lead(Lead(None, "Mover", "m@m.com", "555", "web"))
+        opp_id = self.db.add_opportunity(Opportunity(None, lead_id, "Deal", 1000, "qualification"))
+
+        self.assertTrue(self.db.update_opportunity_stage(opp_id, "negotiation"))
+        self.assertFalse(self.db.update_opportunity_stage(opp_id, "negotiation"))
+        self.assertEqual(self.db.get_all_opportunities()[0][4], "negotiation")
+
+        self.db.connect()
+        self.db.cursor.execute("""
+                               SELECT f.label, t.label
+                               FROM opportunity_stage_history h
+                                        LEFT JOIN opportunity_stages f ON f.code = h.from_stage_id
+                                        JOIN opportunity_stages t ON t.code = h.to_stage_id
+                               WHERE h.opp_id = ?
+                               ORDER BY h.history_id
+                               """, (opp_id,))
+        history = self.db.cursor.fetchall()
+        self.db.close()
+
+        self.assertEqual(history, [(None, "qualification"), ("qualification", "negotiation")])
+
+    def test_bulk_update_stages_and_statuses(self):
+        """Test bulk transitions skip unknown ids and rows already in the target state"""
+        lead_id = self.db.add_lead(Lead(None, "Bulk", "b@b.com", "555", "web"))
+        opp_ids = [self.db.add_opportunity(Opportunity(None, lead_id, f"Deal {i}", 1000))
+                   for i in range(5)]
+        self.db.update_opportunity_stage(opp_ids[0], "negotiation")
+
+        changed = self.db.update_opportunity_stages(opp_ids + [999], "negotiation")
+        self.assertEqual(changed, 4)
+        self.assertEqual({opp[4] for opp in self.db.get_all_opportunities()}, {"negotiation"})
+
+        quote_ids = [self.db.add_quote(Quote(None, opp_ids[0], f"Q-{i}", 900, "2025-01-31"))
+                     for i in range(3)]
+        self.assertEqual(self.db.update_quote_statuses(quote_ids, "sent"), 3)
+        self.assertTrue(self.db.update_quote_status(quote_ids[0], "accepted"))
+        self.assertEqual([q[6] for q in self.db.get_all_quotes()], ["accepted", "sent", "sent"])
+
+    def test_expire_quotes(self):
+        """Test that only open quotes past valid_until are expired"""
+        lead_id = self.db.add_lead(Lead(None, "Expiry", "x@x.com", "555", "web"))
+        opp_id = self.db.add_opportunity(Opportunity(None, lead_id, "Deal", 1000))
+        self.db.add_quote(Quote(None, opp_id, "Q-OLD-DRAFT", 100, "2025-01-31"))
+        self.db.add_quote(Quote(None, opp_id, "Q-OLD-SENT", 100, "2025-01-31", status="sent"))
+        self.db.add_quote(Quote(None, opp_id, "Q-OLD-ACCEPTED", 100, "2025-01-31", status="accepted"))
+        self.db.add_quote(Quote(None, opp_id, "Q-CURRENT", 100, "2025-03-31", status="sent"))
+
+        self.assertEqual(self.db.expire_quotes(as_of="2025-02-01"), 2)
+        self.assertEqual(self.db.expire_quotes(as_of="2025-02-01"), 0)
+
+        statuses = {q[2]: q[6] for q in self.db.get_all_quotes()}
+        self.assertEqual(statuses, {"Q-OLD-DRAFT": "expired", "Q-OLD-SENT": "expired",
+                                    "Q-OLD-ACCEPTED": "accepted", "Q-CURRENT": "sent"})
+
+
+class TestMoney(unittest.TestCase):
+    """Test Money value type"""
+
+    def test_from_amount_rounds_to_cents(self):
+        """Test conversion of euro amounts to integer cents"""
+        self.assertEqual(Money.from_amount(1234.5).cents, 123450)
+        self.assertEqual(Money.from_amount("0.005").cents, 1)
+        self.assertEqual(Money.from_amount(Decimal("19.99")).cents, 1999)
+
+    def test_arithmetic_is_exact(self):
+        """Test that sums don't drift like floats do"""
+        total = sum(Money.from_amount(0.1) for _ in range(10))
+        self.assertEqual(total, Money(100))
+        self.assertEqual(total.to_decimal(), Decimal("1.00"))
+        self.assertEqual(f"{Money(123456789):,.2f}", "1,234,567.89")
+
+    def test_amounts_stored_as_cents(self):
+        """Test that opportunity values are stored as integer cents"""
+        test_db = "test_money.db"
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        db = Database(test_db)
+        db.create_tables()
+
+        lead_id = db.add_lead(Lead(None, "Cents Co", "c@c.com", "555", "web"))
+        db.add_opportunity(Opportunity(None, lead_id, "Deal", 1999.99))
+
+        db.connect()
+        db.cursor.execute("SELECT estimated_value_cents FROM opportunities")
+        self.assertEqual(db.cursor.fetchone()[0], 199999)
+        db.close()
+        self.assertEqual(db.get_all_opportunities()[0][3], 1999.99)
+
+        os.remove(test_db)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""
+Tests for query instrumentation
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from salespipe import profiling
+from salespipe.analytics import Analytics
+from salespipe.database import Database
+from salespipe.models import Lead
+
+
+class TestProfiling(unittest.TestCase):
+    """Test per-operation query counters and the slow-query log"""
+
+    def setUp(self):
+        """Set up a database with a few leads"""
+        self.test_db = "test_profiling.db"
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+
+    def tearDown(self):
+        """Turn instrumentation off and clean up the test database"""
+        profiling.disable()
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+
+    def test_disabled_by_default(self):
+        """Test that connections are plain sqlite3 ones while profiling is off"""
+        self.assertIsNone(profiling.profiler)
+        self.assertIs(profiling.connection_factory(), sqlite3.Connection)
+        self.db.connect()
+        self.assertIs(type(self.db.conn), sqlite3.Connection)
+        self.db.close()
+
+    def test_counts_queries_and_rows_per_operation(self):
+        """Test that statements are charged to the salespipe function that ran them"""
+        profiler = profiling.enable()
+        for i in range(3):
+            self.db.add_lead(Lead(None, f"Lead {i}", f"l{i}@x.com", "", "web", industry="automotive"))
+        leads = list(self.db.iter_leads())
+        Analytics(self.test_db).get_conversion_rates()
+
+        self.assertEqual(len(leads), 3)
+        queries, rows, seconds = profiler.operations['Database.iter_leads']
+        self.assertEqual(rows, 3)
+        self.assertGreater(seconds, 0)
+        self.assertIn('Database.add_lead', profiler.operations)
+        self.assertIn('analytics._funnel_counts', profiler.operations)
+        self.assertIn("QUERY PROFILE", profiler.report())
+
+        self.assertIs(profiling.disable(), profiler)
+        self.assertIs(profiling.connection_factory(), sqlite3.Connection)
+
+    def test_slow_queries_logged_with_plan(self):
+        """Test that a statement over the threshold is logged with its query plan"""
+        profiling.enable(slow_ms=0)
+        with self.assertLogs('salespipe.profiling', level='WARNING') as logs:
+            self.db.get_record('leads', 1)
+
+        message = next(line for line in logs.output if "FROM leads" in line)
+        self.assertIn("Database.get_record", message)
+        self.assertRegex(message, r"SEARCH|SCAN")
+
+
+class TestProfileFlag(unittest.TestCase):
+    """Test the --profile command line flag"""
+
+    def test_summary_on_stderr(self):
+        """Test that --profile prints the query summary after the command"""
+        main = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run([sys.executable, main, '--profile', 'list-leads'],
+                                    capture_output=True, text=True, check=True, cwd=directory)
+        self.assertIn("QUERY PROFILE", result.stderr)
+        self.assertIn("Database.", result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Tests for read-only analytics connections and the read replica
+"""
+import os
+import sqlite3
+import threading
+import unittest
+from salespipe.analytics import Analytics
+from salespipe.database import Database
+from salespipe.models import Lead, Opportunity
+
+
+class TestReadOnlyAnalytics(unittest.TestCase):
+    """Test Analytics in read_only and replica modes"""
+
+    def setUp(self):
+        """Set up a test database with one deal"""
+        self.test_db = "test_read_only.db"
+        self.replica_db = "test_read_only_replica.db"
+        self._remove()
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+        lead_id = self.db.add_lead(Lead(None, "Snapshot Co", "s@s.com", "555", "web", industry="logistics"))
+        self.db.add_opportunity(Opportunity(None, lead_id, "Snapshot Deal", 1000))
+
+    def tearDown(self):
+        """Clean up test databases"""
+        self._remove()
+
+    def _remove(self):
+        for base in (self.test_db, self.replica_db):
+            for path in (base, base + "-wal", base + "-shm", base + "-journal", base + ".partial"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def test_read_only_connection(self):
+        """Test that read-only analytics report normally but cannot write"""
+        analytics = Analytics(self.test_db, read_only=True)
+        self.assertEqual(analytics.get_pipeline_value()['opportunities_value'], 1000.0)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            analytics.db.add_lead(Lead(None, "Nope", "n@n.com", "", "web"))
+
+    def test_reports_during_ingestion(self):
+        """Test that reports and inserts run side by side without lock errors"""
+        analytics = Analytics(self.test_db, read_only=True)
+        errors = []
+        done = threading.Event()
+
+        def ingest():
+            try:
+                for i in range(100):
+                    self.db.add_lead(Lead(None, f"Ingest {i}", f"i{i}@x.com", "", "web", industry="automotive"))
+            except sqlite3.Error as e:
+                errors.append(e)
+            finally:
+                done.set()
+
+        writer = threading.Thread(target=ingest)
+        writer.start()
+        reports = 0
+        while not done.is_set() or reports == 0:
+            try:
+                analytics.get_performance_by_industry()
+                analytics.get_conversion_rates()
+            except sqlite3.Error as e:
+                errors.append(e)
+            reports += 1
+        writer.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(analytics.get_conversion_rates()['total_leads'], 101)
+
+    def test_replica_refresh(self):
+        """Test that the replica lags the live file until it is refreshed"""
+        analytics = Analytics(self.test_db, replica=self.replica_db, replica_max_age=3600)
+        self.assertEqual(analytics.get_conversion_rates()['total_leads'], 1)
+        self.assertTrue(os.path.exists(self.replica_db))
+
+        self.db.add_lead(Lead(None, "After Copy", "a@c.com", "", "web"))
+        self.assertEqual(analytics.get_conversion_rates()['total_leads'], 1)
+
+        analytics.replica.refresh()
+        self.assertEqual(analytics.get_conversion_rates()['total_leads'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Tests for lead scoring
+"""
+import os
+import unittest
+from salespipe.database import Database
+from salespipe.models import Lead, Opportunity, Quote, Order
+from salespipe.scoring import score_leads
+
+
+class TestScoring(unittest.TestCase):
+    """Test score_leads and sorting leads by score"""
+
+    def setUp(self):
+        """Set up automotive leads that win and logistics leads that lose"""
+        self.test_db = "test_scoring.db"
+        self._remove()
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+        for i in range(6):
+            industry, status = ('automotive', 'won') if i % 2 else ('logistics', 'lost')
+            lead_id = self.db.add_lead(Lead(None, f"Company {i}", f"c{i}@example.com", "", "website",
+                                            location="Germany", industry=industry, company_size="large"))
+            opp_id = self.db.add_opportunity(Opportunity(None, lead_id, f"Deal {i}", 10000))
+            quote_id = self.db.add_quote(Quote(None, opp_id, f"Q-{i}", 9000, "2030-01-01", "Net 30", "accepted"))
+            self.db.add_order(Order(None, quote_id, status, 9000, "2024-06-01"))
+        self.new_id = self.db.add_lead(Lead(None, "Newcomer", "new@example.com", "", "website",
+                                            location="Germany", industry="logistics", company_size="large"))
+
+    def tearDown(self):
+        """Clean up test database"""
+        self._remove()
+
+    def _remove(self):
+        for path in (self.test_db, self.test_db + "-wal", self.test_db + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _scores(self):
+        return {row[0]: row[10] for row in self.db.get_all_leads()}
+
+    def test_scores_follow_win_rates(self):
+        """Test that leads like the ones that won score higher, and only stale leads are rescored"""
+        self.assertEqual(score_leads(self.db), 7)
+        scores = self._scores()
+        self.assertGreater(scores[2], scores[1])  # Automotive wins, logistics loses
+        self.assertEqual(scores[self.new_id], scores[1])
+        self.assertTrue(all(0 < score < 100 for score in scores.values()))
+
+        self.assertEqual(score_leads(self.db), 0)
+        self.db.update_lead(self.new_id, industry='automotive')
+        self.db.update_lead(1, phone="+49 30 1234567")  # Not a scored field
+        self.assertEqual(score_leads(self.db), 1)
+        self.assertEqual(self._scores()[self.new_id], scores[2])
+        self.assertEqual(score_leads(self.db, rescore_all=True, batch_size=3), 7)
+
+    def test_sort_by_score(self):
+        """Test that leads list by score, with keyset pages continuing across ties"""
+        score_leads(self.db)
+        ranked = [row[0] for row in self.db.iter_leads(sort='score', descending=True)]
+        self.assertEqual(ranked[:3], [6, 4, 2])
+        first = [row[0] for row in self.db.iter_leads(sort='score', descending=True, limit=4)]
+        rest = [row[0] for row in self.db.iter_leads(sort='score', descending=True, after_id=first[-1])]
+        self.assertEqual(first + rest, ranked)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+Tests for the HTTP/JSON API server
+"""
+import asyncio
+import json
+import os
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from salespipe.server import APIServer
+
+
+class TestAPIServer(unittest.TestCase):
+    """Test APIServer class"""
+
+    def setUp(self):
+        """Start a server on a free port in a background event loop"""
+        self.test_db = "test_server.db"
+        for path in (self.test_db, self.test_db + "-wal", self.test_db + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+        self.server = APIServer(self.test_db, port=0, readers=2)
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            self.loop.run_until_complete(self.server.start())
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+        started.wait(10)
+
+    def tearDown(self):
+        """Stop the server and clean up the test database"""
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        for path in (self.test_db, self.test_db + "-wal", self.test_db + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _request(self, method, path, body=None):
+        """Send a request; returns (status, decoded JSON)"""
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(f"http://127.0.0.1:{self.server.port}{path}", data=data, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                self.assertIn("X-Response-Time", response.headers)
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_record_crud(self):
+        """Test creating, reading, updating and deleting records"""
+        status, lead = self._request("POST", "/leads", {"name": "Api GmbH", "email": "a@api.de",
+                                                        "location": "Germany", "industry": "automotive"})
+        self.assertEqual(status, 201)
+        status, opp = self._request("POST", "/opportunities", {"lead_id": lead["id"], "title": "Robot Cell",
+                                                               "estimated_value": 50000, "probability": 40})
+        self.assertEqual(status, 201)
+
+        status, record = self._request("GET", f"/leads/{lead['id']}")
+        self.assertEqual((status, record["name"], record["location"]), (200, "Api GmbH", "Germany"))
+
+        self.assertEqual(self._request("PATCH", f"/opportunities/{opp['id']}", {"stage": "negotiation"})[0], 200)
+        self.assertEqual(self._request("GET", f"/opportunities/{opp['id']}")[1]["stage"], "negotiation")
+        self.assertEqual(self._request("PATCH", f"/leads/{lead['id']}", {"status": "qualified"})[0], 200)
+
+        # The lead still has an opportunity, so it can't go first
+        self.assertEqual(self._request("DELETE", f"/leads/{lead['id']}")[0], 409)
+        self.assertEqual(self._request("DELETE", f"/opportunities/{opp['id']}")[0], 200)
+        self.assertEqual(self._request("DELETE", f"/leads/{lead['id']}")[0], 200)
+        self.assertEqual(self._request("GET", f"/leads/{lead['id']}")[0], 404)
+
+    def test_list_pages(self):
+        """Test paginated, filtered lead listing"""
+        for i in range(5):
+            self._request("POST", "/leads", {"name": f"Page {i}", "email": f"p{i}@x.com",
+                                             "industry": "logistics" if i % 2 else "automotive"})
+
+        status, page = self._request("GET", "/leads?limit=2")
+        self.assertEqual([lead["name"] for lead in page["items"]], ["Page 0", "Page 1"])
+        page = self._request("GET", f"/leads?limit=2&after_id={page['next_after_id']}")[1]
+        self.assertEqual([lead["name"] for lead in page["items"]], ["Page 2", "Page 3"])
+
+        page = self._request("GET", "/leads?industry=logistics")[1]
+        self.assertEqual([lead["name"] for lead in page["items"]], ["Page 1", "Page 3"])
+        self.assertIsNone(page["next_after_id"])
+
+    def test_reports(self):
+        """Test that analytics reports are served as JSON"""
+        self._request("POST", "/leads", {"name": "Report Co", "email": "r@r.com"})
+        status, report = self._request("GET", "/analytics/conversion")
+        self.assertEqual((status, report["total_leads"]), (200, 1))
+        self.assertEqual(self._request("GET", "/analytics/velocity")[0], 200)
+        self.assertEqual(self._request("GET", "/analytics/top-opportunities?limit=5")[1], [])
+
+    def test_errors(self):
+        """Test error statuses"""
+        self.assertEqual(self._request("GET", "/nothing")[0], 404)
+        self.assertEqual(self._request("GET", "/analytics/nothing")[0], 404)
+        self.assertEqual(self._request("POST", "/leads", {"name": "No Email"})[0], 400)
+        self.assertEqual(self._request("POST", "/leads", {"name": "X", "email": "x", "location": "Spain"})[0], 400)
+        self.assertEqual(self._request("GET", "/leads?limit=many")[0], 400)
+
+    def test_non_numeric_amount(self):
+        """Test that an amount that isn't a number is a bad request, not a server error"""
+        lead_id = self._request("POST", "/leads", {"name": "Amount Co", "email": "a@co.com"})[1]['id']
+        status, payload = self._request("POST", "/opportunities",
+                                        {"lead_id": lead_id, "title": "Deal", "estimated_value": "lots"})
+        self.assertEqual((status, payload), (400, {'error': "Amounts must be numbers"}))
+        self.assertEqual(self._request("GET", "/opportunities")[1]['items'], [])
+
+    def test_metrics(self):
+        """Test that /metrics serves the Prometheus text format"""
+        self._request("POST", "/leads", {"name": "Metric AG", "email": "m@metric.de"})
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.server.port}/metrics") as response:
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+            text = response.read().decode()
+        self.assertIn("# TYPE salespipe_operation_seconds histogram", text)
+        self.assertIn('salespipe_operation_seconds_count{operation="Database.add_lead"}', text)
+        self.assertIn('salespipe_records_inserted_total{entity="leads"}', text)
+
+    def test_changes(self):
+        """Test that /changes pages through the change log"""
+        lead_id = self._request("POST", "/leads", {"name": "Feed AG", "email": "f@feed.de"})[1]['id']
+        self._request("PATCH", f"/leads/{lead_id}", {"status": "contacted"})
+        status, page = self._request("GET", "/changes?limit=1")
+        self.assertEqual(status, 200)
+        self.assertEqual([(c['table_name'], c['record_id'], c['operation']) for c in page['items']],
+                         [('leads', lead_id, 'insert')])
+        page = self._request("GET", f"/changes?since={page['next_since']}&table=leads")[1]
+        self.assertEqual([c['operation'] for c in page['items']], ['update'])
+        self.assertEqual(self._request("GET", "/changes?table=invoices")[0], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
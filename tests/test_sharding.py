@@ -0,0 +1,156 @@
+"""
+Tests for sharded storage by market
+"""
+import contextlib
+import io
+import os
+import threading
+import unittest
+from salespipe.analytics import Analytics
+from salespipe.cli import CLI, create_parser
+from salespipe.database import Database
+from salespipe.models import Lead, Opportunity, Quote, Order, LOCATIONS
+from salespipe.sharding import ShardedDatabase, ShardedAnalytics, SHARD_ID_SPAN, shard_path
+
+
+def fill(db):
+    """Store the same deals in a Database or a ShardedDatabase"""
+    for i, location in enumerate(LOCATIONS * 3):
+        lead_id = db.add_lead(Lead(None, f"Company {i:02d}", f"c{i}@x.com", "", "web", location=location,
+                                   industry=('automotive', 'logistics')[i % 2], created_at=f"2025-01-{i + 1:02d}"))
+        if i % 3 == 2:
+            continue
+        opp_id = db.add_opportunity(Opportunity(None, lead_id, f"Deal {i:02d}", 1000 * (i + 1), "qualification",
+                                                10 * (i % 10), created_at="2025-02-01T00:00:00"))
+        db.update_opportunity_stage(opp_id, "negotiation", changed_at=f"2025-02-{i % 9 + 2:02d}T00:00:00")
+        if i % 3 == 1:
+            quote_id = db.add_quote(Quote(None, opp_id, f"Q-{i}", 900 * (i + 1), "2025-01-01", "Net 30", "sent"))
+            db.add_order(Order(None, quote_id, ('won', 'lost')[i % 2], 850.5 * (i + 1), "2025-03-01"))
+
+
+class TestSharding(unittest.TestCase):
+    """Test ShardedDatabase and ShardedAnalytics"""
+
+    def setUp(self):
+        """Set up an empty sharded database"""
+        self.test_db = "test_sharding.db"
+        self.plain_db = "test_sharding_plain.db"
+        self._remove()
+        self.db = ShardedDatabase(self.test_db)
+        self.db.create_tables()
+
+    def tearDown(self):
+        """Clean up the shard files"""
+        self.db.close()
+        self._remove()
+
+    def _remove(self):
+        for path in [self.test_db, self.plain_db] + [shard_path(self.test_db, market) for market in LOCATIONS]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_routing_and_ids(self):
+        """Test that records land in their market's file with IDs from its range"""
+        italy = self.db.add_lead(Lead(None, "Milano Srl", "m@it.com", "", "web", location="Italy"))
+        benelux = self.db.add_lead(Lead(None, "Gent NV", "g@be.com", "", "web", location="Benelux"))
+        opp_id = self.db.add_opportunity(Opportunity(None, benelux, "Conveyor", 5000))
+        quote_id = self.db.add_quote(Quote(None, opp_id, "Q-BE-1", 4800, "2025-01-31"))
+        order_id = self.db.add_order(Order(None, quote_id, "won", 4700, "2025-01-20"))
+
+        self.assertEqual(italy, 2 * SHARD_ID_SPAN + 1)
+        self.assertEqual(benelux, 4 * SHARD_ID_SPAN + 1)
+        self.assertEqual((opp_id, quote_id, order_id), (4 * SHARD_ID_SPAN + 1,) * 3)
+        self.assertEqual(Database(shard_path(self.test_db, "Benelux")).get_all_orders()[0][0], order_id)
+        self.assertEqual(Database(shard_path(self.test_db, "Italy")).get_all_opportunities(), [])
+        self.assertEqual(self.db.get_record('leads', italy)[1], "Milano Srl")
+        self.assertEqual([row[0] for row in self.db.get_all_leads()], [italy, benelux])
+
+        with self.assertRaises(ValueError):
+            self.db.add_lead(Lead(None, "Nowhere", "n@x.com", "", "web"))
+        with self.assertRaises(ValueError):
+            self.db.update_lead(italy, location="France")
+
+        # A reopened ShardedDatabase keeps handing out IDs from the same ranges
+        self.db.create_tables()
+        self.assertEqual(self.db.add_lead(Lead(None, "Roma Spa", "r@it.com", "", "web", location="Italy")),
+                         2 * SHARD_ID_SPAN + 2)
+
+    def test_reports_match_single_file(self):
+        """Test that merged per-shard reports equal the same reports on one file"""
+        plain = Database(self.plain_db)
+        plain.create_tables()
+        fill(plain)
+        fill(self.db)
+        self.assertEqual(self.db.expire_quotes(as_of="2025-02-01"), plain.expire_quotes(as_of="2025-02-01"))
+
+        single = Analytics(self.plain_db)
+        sharded = ShardedAnalytics(db=self.db)
+        for report in ('get_conversion_rates', 'get_win_rate', 'get_pipeline_value', 'get_performance_by_industry',
+                       'get_performance_by_location', 'get_time_in_stage', 'get_stage_velocity'):
+            self.assertEqual(getattr(sharded, report)(), getattr(single, report)(), report)
+        self.assertEqual(sharded.get_pipeline_value(exclude_expired=True),
+                         single.get_pipeline_value(exclude_expired=True))
+
+        def titles(top):
+            return [(row['title'], row['weighted_value']) for row in top]
+
+        self.assertEqual(titles(sharded.get_top_opportunities(limit=5)), titles(single.get_top_opportunities(limit=5)))
+        self.assertEqual([row['company'] for row in sharded.get_top_accounts(limit=3)],
+                         [row['company'] for row in single.get_top_accounts(limit=3)])
+
+    def test_iter_leads_merges_shards(self):
+        """Test a listing sorted and paged across shards"""
+        fill(self.db)
+        names = [row[1] for row in self.db.iter_leads(sort='name', descending=True)]
+        self.assertEqual(names, sorted(names, reverse=True))
+        self.assertEqual(len(names), 12)
+
+        page = list(self.db.iter_leads(sort='created', limit=5))
+        rest = list(self.db.iter_leads(sort='created', after_id=page[-1][0]))
+        self.assertEqual([row[9] for row in page + rest], sorted(row[9] for row in page + rest))
+        self.assertEqual(len(page + rest), 12)
+
+        automotive = list(self.db.iter_leads(industry='automotive', location='France'))
+        self.assertEqual({(row[6], row[7]) for row in automotive}, {('France', 'automotive')})
+
+    def test_cli_reads_shards(self):
+        """Test that list-leads and analytics read the shard files with --sharded"""
+        fill(self.db)
+        cli, parser = CLI(self.test_db), create_parser()
+
+        def run(*argv):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                cli.dispatch(parser.parse_args(list(argv)))
+            return out.getvalue()
+
+        self.assertEqual(len(run('list-leads', '--sharded', '--format', 'jsonl').splitlines()), 12)
+        self.assertIn("Total Leads:         12", run('analytics', '--type', 'conversion', '--sharded'))
+        self.assertIn("Total Leads:         0", run('analytics', '--type', 'conversion'))
+
+        missing = CLI(self.plain_db)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            missing.dispatch(parser.parse_args(['list-leads', '--sharded']))
+        self.assertIn("No sharded database", out.getvalue())
+        self.assertFalse(os.path.exists(shard_path(self.plain_db, "Germany")))
+
+    def test_parallel_market_writes(self):
+        """Test threads writing to different markets at the same time"""
+        def ingest(market):
+            for i in range(50):
+                self.db.add_lead(Lead(None, f"{market} {i}", "p@x.com", "", "web", location=market))
+
+        writers = [threading.Thread(target=ingest, args=(market,)) for market in LOCATIONS]
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+
+        self.assertEqual(ShardedAnalytics(db=self.db).get_conversion_rates()['total_leads'], 200)
+        self.assertEqual({market: stats['leads'] for market, stats in
+                          ShardedAnalytics(db=self.db).get_performance_by_location().items()},
+                         dict.fromkeys(LOCATIONS, 50))
+
+
+if __name__ == '__main__':
+    unittest.main()
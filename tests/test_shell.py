@@ -0,0 +1,96 @@
+"""
+Tests for the interactive shell
+"""
+import contextlib
+import io
+import os
+import unittest
+from salespipe.cli import CLI, create_parser
+from salespipe.models import Lead
+from salespipe.shell import Shell
+
+
+class TestShell(unittest.TestCase):
+    """Test Shell class"""
+
+    def setUp(self):
+        """Set up a CLI over a test database"""
+        self.test_db = "test_shell.db"
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.cli = CLI(self.test_db)
+
+    def tearDown(self):
+        """Clean up test files"""
+        for path in (self.test_db, self.test_db + "-wal", self.test_db + "-shm", "test_shell_replica.db"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _run(self, *lines):
+        """Run lines through the shell; returns everything it printed"""
+        output = io.StringIO()
+        shell = Shell(self.cli, create_parser(), stdin=io.StringIO("\n".join(lines) + "\n"), stdout=output)
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            shell.run()
+        return output.getvalue()
+
+    def test_runs_cli_commands(self):
+        """Test that regular commands work inside the shell"""
+        output = self._run('add-lead --name "Shell GmbH" --email s@shell.de --location Germany',
+                           'list-leads',
+                           'exit')
+
+        self.assertIn("Lead added successfully! ID: 1", output)
+        self.assertIn("Shell GmbH", output)
+        self.assertEqual(len(self.cli.db.get_all_leads()), 1)
+        self.assertFalse(self.cli.db.in_session)
+
+    def test_bad_input_keeps_session_alive(self):
+        """Test that parse errors, database errors, bad paths and bad values don't end the session"""
+        output = self._run('add-lead --name Broken',
+                           'set-stage --ids 1 --stage nonsense',
+                           'shell',
+                           'add-lead --name "Still Here" --email ok@ok.com',
+                           'export --output no_such_dir/leads.csv',
+                           'generate --leads 1 --industries automotive',
+                           'add-lead --name "Here Too" --email ok2@ok.com')
+
+        self.assertIn("Already in the shell", output)
+        self.assertIn("Error: [Errno 2] No such file or directory: 'no_such_dir/leads.csv'", output)
+        self.assertIn("Error: Expected label=weight, got 'automotive'", output)
+        self.assertIn("Lead added successfully! ID: 2", output)
+        self.assertIn("Lead added successfully", output)
+
+    def test_one_connection_and_cached_analytics(self):
+        """Test that a session reuses its connection and analytics results until data changes"""
+        self.cli.db.open_session()
+        conn = self.cli.db.conn
+
+        first = self.cli.analytics.get_conversion_rates()
+        self.assertIs(self.cli.analytics.get_conversion_rates(), first)
+
+        self.cli.db.add_lead(Lead(None, "New Co", "n@co.com", "555", "web"))
+        second = self.cli.analytics.get_conversion_rates()
+
+        self.assertIs(self.cli.db.conn, conn)
+        self.assertIsNot(second, first)
+        self.assertEqual(second['total_leads'], 1)
+        self.cli.db.close_session()
+
+    def test_flagged_analytics_dont_stick(self):
+        """Test that --read-only and --replica reports leave later plain reports on the session's engine"""
+        self.cli.db.add_lead(Lead(None, "Report Co", "r@co.com", "555", "web"))
+        shared = self.cli.analytics
+        output = self._run('analytics --type conversion --read-only',
+                           'analytics --type conversion --replica test_shell_replica.db',
+                           'add-lead --name "Later Co" --email l@co.com',
+                           'analytics --type conversion')
+
+        self.assertIs(self.cli._analytics, shared)
+        self.assertIs(shared.db, self.cli.db)
+        self.assertEqual(output.count("Total Leads:         1"), 2)
+        self.assertIn("Total Leads:         2", output)
+
+
+if __name__ == '__main__':
+    unittest.main()
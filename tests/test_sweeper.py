@@ -0,0 +1,64 @@
+"""
+Tests for the quote expiry sweeper
+"""
+import unittest
+import os
+import threading
+import time
+from salespipe.database import Database
+from salespipe.models import Lead, Opportunity, Quote
+from salespipe.sweeper import QuoteExpirySweeper
+
+
+class TestQuoteExpirySweeper(unittest.TestCase):
+    """Test QuoteExpirySweeper class"""
+
+    def setUp(self):
+        """Set up a database with one out-of-date quote"""
+        self.test_db = "test_sweeper.db"
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+        lead_id = self.db.add_lead(Lead(None, "Sweep Co", "s@s.com", "555", "web"))
+        opp_id = self.db.add_opportunity(Opportunity(None, lead_id, "Deal", 1000))
+        self.db.add_quote(Quote(None, opp_id, "Q-SWEEP-1", 900, "2024-06-30", status="sent"))
+
+    def tearDown(self):
+        """Clean up test database"""
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+
+    def test_run_once_reports_counts(self):
+        """Test a single sweep and its report"""
+        sweeper = QuoteExpirySweeper(self.test_db)
+
+        report = sweeper.run_once()
+        self.assertEqual(report['expired'], 1)
+        self.assertEqual(report['runs'], 1)
+
+        report = sweeper.run_once()
+        self.assertEqual(report['expired'], 0)
+        self.assertEqual(report['total_expired'], 1)
+
+    def test_run_forever_stops(self):
+        """Test the scheduler loop runs until stopped from another thread"""
+        sweeper = QuoteExpirySweeper(self.test_db)
+        reports = []
+
+        worker = threading.Thread(target=sweeper.run_forever, args=(0.01,),
+                                  kwargs={'on_sweep': reports.append})
+        worker.start()
+        while len(reports) < 3:
+            time.sleep(0.01)
+        sweeper.stop()
+        worker.join(timeout=5)
+
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(reports[0]['expired'], 1)
+        self.assertEqual(sweeper.total_expired, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Stress tests for sharing one Database between threads
+"""
+import os
+import sqlite3
+import threading
+import unittest
+from salespipe.database import Database
+from salespipe.models import Lead, Opportunity
+
+
+class TestThreadSafety(unittest.TestCase):
+    """Test concurrent use of a single Database instance"""
+
+    WRITERS = 8
+    READERS = 4
+    LEADS_PER_WRITER = 20
+
+    def setUp(self):
+        """Set up a shared test database"""
+        self.test_db = "test_threading.db"
+        self._remove()
+        self.db = Database(self.test_db)
+        self.db.create_tables()
+
+    def tearDown(self):
+        """Clean up test database"""
+        self._remove()
+
+    def _remove(self):
+        for path in (self.test_db, self.test_db + "-journal", self.test_db + "-wal", self.test_db + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _hammer(self):
+        """Run writer and reader threads against self.db; returns the errors they hit"""
+        errors = []
+        writers_done = threading.Event()
+
+        def write(n):
+            try:
+                for i in range(self.LEADS_PER_WRITER):
+                    lead_id = self.db.add_lead(Lead(None, f"W{n}-{i}", f"w{n}.{i}@x.com", "", "web"))
+                    opp_id = self.db.add_opportunity(Opportunity(None, lead_id, f"Deal {n}-{i}", 100 + i))
+                    self.db.update_opportunity_stage(opp_id, "qualification")
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                while not writers_done.is_set():
+                    self.db.get_all_leads()
+                    list(self.db.iter_leads(limit=20, sort='name'))
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=write, args=(n,)) for n in range(self.WRITERS)]
+        readers = [threading.Thread(target=read) for _ in range(self.READERS)]
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        writers_done.set()
+        for thread in readers:
+            thread.join()
+        return errors
+
+    def _check_counts(self):
+        total = self.WRITERS * self.LEADS_PER_WRITER
+        self.assertEqual(len(self.db.get_all_leads()), total)
+        stages = {opp[4] for opp in self.db.get_all_opportunities()}
+        self.assertEqual(stages, {"qualification"})
+        self.db.connect()
+        self.db.cursor.execute("SELECT COUNT(*) FROM opportunity_stage_history")
+        self.assertEqual(self.db.cursor.fetchone()[0], total * 2)
+        self.db.close()
+
+    def test_concurrent_writes_and_reads(self):
+        """Test many threads writing and reading through one instance (rollback journal)"""
+        self.assertEqual(self._hammer(), [])
+        self._check_counts()
+
+    def test_concurrent_writes_and_reads_wal(self):
+        """Test the same load with WAL journaling"""
+        self.db.enable_wal()
+        self.assertEqual(self._hammer(), [])
+        self._check_counts()
+
+    def test_write_retried_when_busy(self):
+        """Test that a write waits out another connection's lock through retries"""
+        impatient = Database(self.test_db, busy_timeout=0)
+        blocker = sqlite3.connect(self.test_db, check_same_thread=False)
+        blocker.execute("BEGIN EXCLUSIVE")
+        release = threading.Timer(0.05, blocker.rollback)
+        release.start()
+
+        lead_id = impatient.add_lead(Lead(None, "Patient GmbH", "p@x.com", "", "web"))
+        release.join()
+        blocker.close()
+        self.assertEqual(lead_id, 1)
+
+    def test_sessions_are_per_thread(self):
+        """Test that a session in one thread doesn't hand its connection to another"""
+        self.db.open_session()
+        seen = {}
+
+        def other():
+            seen['in_session'] = self.db.in_session
+            seen['conn'] = self.db.conn
+            self.db.add_lead(Lead(None, "Other Thread", "o@x.com", "", "web"))
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(seen, {'in_session': False, 'conn': None})
+        self.assertEqual(len(self.db.get_all_leads()), 1)
+        self.db.close_session()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Tests for the group-commit write queue
+"""
+import decimal
+import os
+import sqlite3
+import threading
+import unittest
+from salespipe.database import Database
+from salespipe.models import Lead, Opportunity
+from salespipe.write_queue import WriteQueue
+
+
+class TestWriteQueue(unittest.TestCase):
+    """Test WriteQueue class"""
+
+    def setUp(self):
+        """Set up a fresh test database"""
+        self.test_db = "test_write_queue.db"
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+
+    def tearDown(self):
+        """Clean up test database"""
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+
+    def test_futures_resolve_to_ids(self):
+        """Test that queued records are stored in groups and their IDs returned"""
+        with WriteQueue(self.test_db, max_batch=50, max_delay=0.5) as writes:
+            futures = writes.submit_many(Lead(None, f"Queued {i}", f"q{i}@x.com", "", "web") for i in range(120))
+            ids = [future.result(timeout=10) for future in futures]
+            opp_id = writes.submit(Opportunity(None, ids[0], "Queued Deal", 900)).result(timeout=10)
+
+        self.assertEqual(ids, list(range(1, 121)))
+        self.assertEqual(opp_id, 1)
+        self.assertEqual(writes.stats['records'], 121)
+        self.assertLessEqual(writes.stats['groups'], 4)
+        self.assertEqual(len(Database(self.test_db).get_all_leads()), 120)
+
+    def test_failed_record_fails_alone(self):
+        """Test that one bad record doesn't roll back the rest of its group"""
+        with WriteQueue(self.test_db, max_delay=0.5) as writes:
+            good = writes.submit(Lead(None, "Good", "g@x.com", "", "web"))
+            bad = writes.submit(Opportunity(None, 999, "No Such Lead", 100))
+            also_good = writes.submit(Lead(None, "Also Good", "a@x.com", "", "web"))
+
+            self.assertEqual(good.result(timeout=10), 1)
+            with self.assertRaises(sqlite3.IntegrityError):
+                bad.result(timeout=10)
+            self.assertEqual(also_good.result(timeout=10), 2)
+
+        self.assertEqual(Database(self.test_db).get_all_opportunities(), [])
+
+    def test_invalid_record_fails_alone(self):
+        """Test that a record with an unknown stage or a bad amount fails without its group"""
+        with WriteQueue(self.test_db, max_delay=0.5) as writes:
+            lead = writes.submit(Lead(None, "Good", "g@x.com", "", "web"))
+            bad_stage = writes.submit(Opportunity(None, 1, "Bogus Stage", 100, "bogus"))
+            bad_amount = writes.submit(Opportunity(None, 1, "Bad Amount", "lots"))
+            also_good = writes.submit(Lead(None, "Also Good", "a@x.com", "", "web"))
+
+            self.assertEqual(lead.result(timeout=10), 1)
+            with self.assertRaises(ValueError):
+                bad_stage.result(timeout=10)
+            with self.assertRaises(decimal.InvalidOperation):
+                bad_amount.result(timeout=10)
+            self.assertEqual(also_good.result(timeout=10), 2)
+
+        self.assertEqual(len(Database(self.test_db).get_all_leads()), 2)
+        self.assertEqual(Database(self.test_db).get_all_opportunities(), [])
+
+    def test_concurrent_producers(self):
+        """Test many producer threads sharing one queue"""
+        ids = []
+        with WriteQueue(self.test_db) as writes:
+            def produce(n):
+                for i in range(50):
+                    ids.append(writes.submit(Lead(None, f"P{n}-{i}", "p@x.com", "", "web")).result(timeout=10))
+
+            producers = [threading.Thread(target=produce, args=(n,)) for n in range(8)]
+            for thread in producers:
+                thread.start()
+            for thread in producers:
+                thread.join()
+
+        self.assertEqual(sorted(ids), list(range(1, 401)))
+        with self.assertRaises(RuntimeError):
+            writes.submit(Lead(None, "Late", "l@x.com", "", "web"))
+
+
+if __name__ == '__main__':
+    unittest.main()